@@ -1,6 +1,7 @@
 # backend/celery.py
 import os
 from celery import Celery
+from celery.signals import task_postrun, worker_init, worker_process_init, worker_process_shutdown
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -14,6 +15,49 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+
+@worker_process_init.connect
+def _reset_mongodb_client(**kwargs):
+    # Prefork children must not reuse the parent's MongoDB sockets
+    from backend.utils.mongodb import reset_mongodb_client
+    reset_mongodb_client()
+
+
+@worker_init.connect
+@worker_process_init.connect
+def _start_tracemalloc(**kwargs):
+    # Per-stage allocation peaks (books.metrics.track_stage); one frame keeps
+    # the tracing overhead low
+    from django.conf import settings
+    if settings.TRACEMALLOC_STAGES:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+
+
+@task_postrun.connect
+def _record_worker_memory(sender=None, **kwargs):
+    # Connected before _flush_metrics so the flush includes it
+    from books.metrics import record_worker_memory
+    record_worker_memory(getattr(sender, 'name', 'unknown'))
+
+
+@task_postrun.connect
+def _flush_metrics(**kwargs):
+    # Publish this child's counters for the /metrics/ endpoint
+    from backend.utils.metrics import REGISTRY
+    REGISTRY.flush()
+
+
+@worker_process_shutdown.connect
+def _remove_metrics_snapshot(**kwargs):
+    # Prefork children leave through os._exit, which skips atexit. This
+    # keeps their counters, the recycle that retired them included, in
+    # the exited-process totals the /metrics/ endpoint reports
+    from backend.utils.metrics import REGISTRY
+    REGISTRY.remove_snapshot()
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
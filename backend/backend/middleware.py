@@ -0,0 +1,38 @@
+# backend/middleware.py
+import time
+
+from django.conf import settings
+
+REFRESHED_AT_KEY = '_session_refreshed_at'
+
+
+class SlidingSessionMiddleware:
+    """
+    Sliding session expiry without a write on every request.
+
+    With SESSION_SAVE_EVERY_REQUEST off, Django only saves a session (and
+    re-sends the cookie) when it is modified. This middleware modifies an
+    authenticated session at most once per SESSION_REFRESH_INTERVAL
+    seconds, which pushes both the stored expiry and the cookie forward.
+    Must sit after SessionMiddleware so it runs first on the way out.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        # Only sessions the request already loaded; never load one just for this
+        if session is None or not session.accessed or session.modified or session.is_empty():
+            return response
+        if response.status_code >= 500:
+            return response
+
+        now = int(time.time())
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 24 * 60 * 60)
+        refreshed_at = session.get(REFRESHED_AT_KEY, 0)
+        if now - refreshed_at >= interval:
+            session[REFRESHED_AT_KEY] = now
+        return response
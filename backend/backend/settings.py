@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from decouple import config
 
 # Load environment variables from .env file
@@ -66,6 +67,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'backend.middleware.SlidingSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',  # DISABLED for API simplicity
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -94,8 +96,69 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
-# Use database sessions instead of signed cookies for better cross-origin support
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Cache: Redis when CACHE_URL is set (e.g. redis://127.0.0.1:6379/1),
+# otherwise per-process memory
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Shared outline memoization (customllm/services/outline_cache.py): up to
+# OUTLINE_CACHE_VARIANTS outlines per set of generation parameters, served
+# round-robin (0 disables). Kept in Redis with CACHE_URL, otherwise in
+# process memory capped at OUTLINE_CACHE_MAX_ENTRIES keys
+OUTLINE_CACHE_VARIANTS = config('OUTLINE_CACHE_VARIANTS', default=3, cast=int)
+OUTLINE_CACHE_TIMEOUT = config('OUTLINE_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+OUTLINE_CACHE_MAX_ENTRIES = config('OUTLINE_CACHE_MAX_ENTRIES', default=2000, cast=int)
+if CACHE_URL:
+    CACHES['outlines'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+        'KEY_PREFIX': 'outlines',
+        'TIMEOUT': OUTLINE_CACHE_TIMEOUT,
+    }
+else:
+    CACHES['outlines'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'outlines',
+        'TIMEOUT': OUTLINE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': OUTLINE_CACHE_MAX_ENTRIES},
+    }
+
+# Catalog endpoints (books/catalog_cache.py): server-side body cache
+# lifetime and the max-age sent to clients
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+CATALOG_CACHE_MAX_AGE = config('CATALOG_CACHE_MAX_AGE', default=60, cast=int)
+
+# Server-side sessions (not signed cookies) for better cross-origin support.
+# SESSION_BACKEND: 'cache' keeps them only in Redis (SESSION_REDIS_URL),
+# 'cached_db' reads through the default cache and writes to the DB, 'db'
+# is the plain database backend. Both cache-backed choices need a cache
+# every worker shares: without one, 'cache' and 'cached_db' fall back to
+# 'db', so a logout or password change in one worker reaches the others.
+SESSION_BACKEND = config('SESSION_BACKEND', default='cached_db')
+SESSION_REDIS_URL = config('SESSION_REDIS_URL', default=CACHE_URL)
+if SESSION_BACKEND == 'cache' and SESSION_REDIS_URL:
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SESSION_REDIS_URL,
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+    SESSION_CACHE_ALIAS = 'sessions'
+elif SESSION_BACKEND in ('cache', 'cached_db') and CACHE_URL:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -110,6 +173,19 @@ DATABASES = {
 MONGODB_URI = config('MONGODB_URI')
 MONGODB_DB_NAME = config('MONGODB_DB_NAME')
 
+# MongoDB connection pool (see backend/utils/mongodb.py)
+MONGODB_MAX_POOL_SIZE = config('MONGODB_MAX_POOL_SIZE', default=50, cast=int)
+MONGODB_MIN_POOL_SIZE = config('MONGODB_MIN_POOL_SIZE', default=0, cast=int)
+MONGODB_MAX_IDLE_TIME_MS = config('MONGODB_MAX_IDLE_TIME_MS', default=300000, cast=int)
+MONGODB_CONNECT_TIMEOUT_MS = config('MONGODB_CONNECT_TIMEOUT_MS', default=5000, cast=int)
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=5000, cast=int)
+MONGODB_SOCKET_TIMEOUT_MS = config('MONGODB_SOCKET_TIMEOUT_MS', default=30000, cast=int)
+# Wire compression negotiated with the server, e.g. "zstd,zlib" or "" to disable
+MONGODB_COMPRESSORS = config('MONGODB_COMPRESSORS', default='zlib')
+# Codec for chapter text at rest (books/services/content_codec.py):
+# auto (zstd if installed, else zlib), zstd, zlib or none
+BOOK_CONTENT_CODEC = config('BOOK_CONTENT_CODEC', default='auto')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -141,6 +217,12 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Book downloads (backend/utils/downloads.py): 'django' streams from the app,
+# 'x-accel' hands off to nginx, 'x-sendfile' to Apache/lighttpd
+DOWNLOAD_SERVE_MODE = config('DOWNLOAD_SERVE_MODE', default='django')
+# nginx "internal" location aliased to MEDIA_ROOT, used in x-accel mode
+DOWNLOAD_ACCEL_PREFIX = config('DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -187,7 +269,10 @@ CORS_ALLOWED_METHODS = [
 
 # Session settings for frontend compatibility
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
-SESSION_SAVE_EVERY_REQUEST = True
+# Sessions are saved only when modified; SlidingSessionMiddleware extends
+# expiry at most once per SESSION_REFRESH_INTERVAL seconds
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = config('SESSION_REFRESH_INTERVAL', default=86400, cast=int)
 SESSION_COOKIE_HTTPONLY = False  # Allow JavaScript access for debugging (set True in production)
 SESSION_COOKIE_SAMESITE = 'Lax'  # Lax allows cookies on navigation
 SESSION_COOKIE_SECURE = False  # False for development (HTTP), True in production (HTTPS)
@@ -204,6 +289,72 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'compact-usage-ledger': {
+        'task': 'books.tasks.compact_usage_ledger',
+        'schedule': config('USAGE_LEDGER_COMPACT_INTERVAL', default=300, cast=int),
+    },
+}
+
+# Per-child memory budget in MB (0 disables). A prefork child whose peak RSS
+# passes it is replaced after its current task instead of growing until the
+# OOM killer picks a victim. TRACEMALLOC_STAGES adds peak Python allocation
+# per pipeline stage to the metrics, at a few percent CPU.
+WORKER_MEMORY_BUDGET_MB = config('WORKER_MEMORY_BUDGET_MB', default=0, cast=int)
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = WORKER_MEMORY_BUDGET_MB * 1024 or None  # KiB
+TRACEMALLOC_STAGES = config('TRACEMALLOC_STAGES', default=False, cast=bool)
+
+# Metrics (backend/utils/metrics.py); METRICS_DIR is shared by web and
+# worker processes on a host, empty disables cross-process snapshots
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'book-generator-metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=15, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(',')
+
+# Token usage ledger and its compacted summary (books/services/usage_tracker.py)
+USAGE_DATA_DIR = config('USAGE_DATA_DIR', default=str(BASE_DIR))
+
+# Cloudflare Workers AI HTTP client (customllm/services/cloudflare_client.py):
+# keep-alive connections per process, retries on 429/5xx, base backoff seconds
+CLOUDFLARE_POOL_SIZE = config('CLOUDFLARE_POOL_SIZE', default=10, cast=int)
+CLOUDFLARE_MAX_RETRIES = config('CLOUDFLARE_MAX_RETRIES', default=3, cast=int)
+CLOUDFLARE_RETRY_BACKOFF = config('CLOUDFLARE_RETRY_BACKOFF', default=0.5, cast=float)
+# Point the client at a local stand-in (manage.py cloudflare_stand_in),
+# e.g. http://127.0.0.1:8787/client/v4; empty means the real API
+CLOUDFLARE_API_BASE_URL = config('CLOUDFLARE_API_BASE_URL', default='')
+
+# Cloudflare response cache (customllm/services/response_cache.py): 'disk'
+# (per host), 'redis' or empty to disable; size-bounded LRU with a TTL
+LLM_CACHE_BACKEND = config('LLM_CACHE_BACKEND', default='disk')
+LLM_CACHE_DIR = config('LLM_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'book-generator-llm-cache'))
+LLM_CACHE_REDIS_URL = config('LLM_CACHE_REDIS_URL', default=CACHE_URL)
+LLM_CACHE_MAX_MB = config('LLM_CACHE_MAX_MB', default=512, cast=int)
+LLM_CACHE_TTL = config('LLM_CACHE_TTL', default=7 * 24 * 60 * 60, cast=int)
+
+# Outbound model call limits (customllm/services/rate_limiter.py), shared by
+# every worker through Redis when RATE_LIMIT_REDIS_URL is set. Per-model
+# overrides go under '<provider>:<model>'. rpm or concurrency 0 = no limit.
+RATE_LIMIT_REDIS_URL = config('RATE_LIMIT_REDIS_URL', default=CACHE_URL)
+RATE_LIMIT_MODE = config('RATE_LIMIT_MODE', default='block')  # or 'fail_fast'
+RATE_LIMIT_TIMEOUT = config('RATE_LIMIT_TIMEOUT', default=30, cast=float)
+RATE_LIMIT_LEASE_SECONDS = config('RATE_LIMIT_LEASE_SECONDS', default=300, cast=int)
+RATE_LIMITS = {
+    'cloudflare': {
+        'rpm': config('CLOUDFLARE_RATE_LIMIT_RPM', default=300, cast=float),
+        'burst': config('CLOUDFLARE_RATE_LIMIT_BURST', default=10, cast=int),
+        'concurrency': config('CLOUDFLARE_MAX_CONCURRENCY', default=8, cast=int),
+    },
+    'cloudflare:@cf/stabilityai/stable-diffusion-xl-base-1.0': {
+        'rpm': config('CLOUDFLARE_IMAGE_RATE_LIMIT_RPM', default=720, cast=float),
+    },
+}
+
+# Pipeline task profiling (books/services/profiling.py); off unless a book
+# or user is listed or the sample rate (0.0-1.0) is above zero
+TASK_PROFILING_BOOK_IDS = [int(i) for i in config('TASK_PROFILING_BOOK_IDS', default='').split(',') if i.strip()]
+TASK_PROFILING_USER_IDS = [int(i) for i in config('TASK_PROFILING_USER_IDS', default='').split(',') if i.strip()]
+TASK_PROFILING_SAMPLE_RATE = config('TASK_PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+TASK_PROFILING_TOP_N = config('TASK_PROFILING_TOP_N', default=25, cast=int)
 
 # REST Framework settings
 REST_FRAMEWORK = {
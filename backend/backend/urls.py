@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -32,6 +34,9 @@ urlpatterns = [
     path('api/users/', include('users.urls')),
     path('api/', include('books.urls')),
     path('api/payments/', include('payments.urls')),
+    
+    # Prometheus scrape target
+    path('metrics/', views.metrics, name='metrics'),
 ]
 
 # Serve media files in development
@@ -0,0 +1,159 @@
+"""
+File download responses with proxy offload, HTTP Range and strong ETags.
+
+``DOWNLOAD_SERVE_MODE`` selects who moves the bytes:
+
+- ``django`` (default): stream from the app process. Single byte ranges
+  are answered with 206, unsatisfiable ones with 416.
+- ``x-accel``: nginx. The response carries ``X-Accel-Redirect`` pointing at
+  ``DOWNLOAD_ACCEL_PREFIX`` + the path relative to MEDIA_ROOT, which must
+  be an ``internal`` location aliased to MEDIA_ROOT.
+- ``x-sendfile``: Apache mod_xsendfile / lighttpd. The response carries
+  ``X-Sendfile`` with the absolute path.
+
+In the proxy modes the proxy handles Range itself; conditional GETs are
+answered here with 304 before anything is handed off.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_fingerprint(path: Path) -> Dict[str, object]:
+    """Hash and size recorded next to a generated artifact, used for ETags."""
+    path = Path(path)
+    return {'sha256': file_sha256(path), 'size': path.stat().st_size}
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == '*':
+        return True
+    # Weak comparison is fine for If-None-Match (RFC 9110 13.1.2)
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag == etag or tag == f'W/{etag}' for tag in candidates)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns None when the header is absent or not something we honour
+    (multiple ranges, other units); the caller then sends the full body.
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('range not satisfiable')
+    return start, min(end, size - 1)
+
+
+def _iter_range(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _content_disposition(filename: str) -> str:
+    ascii_name = filename.encode('ascii', 'ignore').decode() or 'download'
+    ascii_name = ascii_name.replace('"', '')
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def serve_file(request, path: Path, *, filename: str, content_type: str = 'application/octet-stream',
+               etag_hash: Optional[str] = None):
+    """Build the response for downloading ``path`` (absolute, under MEDIA_ROOT)."""
+    path = Path(path)
+    stat = path.stat()
+    etag = f'"{etag_hash}"' if etag_hash else None
+
+    def _decorate(response):
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if etag:
+            response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        return response
+
+    if etag and _etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        return _decorate(HttpResponseNotModified())
+
+    mode = getattr(settings, 'DOWNLOAD_SERVE_MODE', 'django')
+    if mode in ('x-accel', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            relative = path.resolve().relative_to(Path(settings.MEDIA_ROOT).resolve())
+            prefix = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/protected-media/').rstrip('/')
+            response['X-Accel-Redirect'] = quote(f'{prefix}/{relative.as_posix()}')
+        else:
+            response['X-Sendfile'] = str(path.resolve())
+        response['Content-Disposition'] = _content_disposition(filename)
+        return _decorate(response)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # A stale If-Range validator means "send the whole new file"
+    if not if_range or (etag and if_range.strip() == etag):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return _decorate(response)
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_iter_range(path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    response['Content-Disposition'] = _content_disposition(filename)
+    return _decorate(response)
+
+
+def is_initial_request(request) -> bool:
+    """False for resumed/partial fetches, so a download is counted once."""
+    header = request.META.get('HTTP_RANGE', '')
+    match = RANGE_RE.match(header.strip()) if header else None
+    return match is None or match.group(1) == '0'
@@ -0,0 +1,73 @@
+"""
+Process memory readings for per-stage accounting.
+
+``current_rss_bytes`` is what the process holds right now,
+``peak_rss_bytes`` the high-water mark (the figure Celery's
+``worker_max_memory_per_child`` compares against). ``StageMemory``
+measures a block: RSS growth always, and the peak of Python allocations
+when ``tracemalloc`` is tracing. Stages nest; an inner stage's peak still
+counts towards the stage around it.
+"""
+
+import os
+import resource
+import tracemalloc
+from typing import List, Optional
+
+MiB = 1024 * 1024
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Open tracemalloc stages, innermost last: [start_traced, peak_seen_by_children]
+_traced_stack: List[List[int]] = []
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # No procfs (macOS); the high-water mark is the best we have
+        return peak_rss_bytes()
+
+
+class StageMemory:
+    """
+    ``with StageMemory() as usage:`` leaves ``usage.rss_growth`` and, when
+    tracemalloc is tracing, ``usage.alloc_peak`` (bytes above the level at
+    entry) set on exit.
+    """
+
+    def __init__(self):
+        self.rss_growth = 0
+        self.alloc_peak: Optional[int] = None
+        self._tracing = False
+
+    def __enter__(self):
+        self._rss_start = current_rss_bytes()
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if _traced_stack:
+                # Resetting the peak below would lose the enclosing stage's
+                # high-water mark, so hand it over first
+                _traced_stack[-1][1] = max(_traced_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            _traced_stack.append([current, 0])
+        return self
+
+    def __exit__(self, *exc_info):
+        self.rss_growth = max(current_rss_bytes() - self._rss_start, 0)
+        if self._tracing and _traced_stack:
+            start, child_peak = _traced_stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+            self.alloc_peak = max(peak - start, 0)
+            if _traced_stack:
+                _traced_stack[-1][1] = max(_traced_stack[-1][1], peak)
+        return False
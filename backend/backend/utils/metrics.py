@@ -0,0 +1,375 @@
+"""
+Minimal in-process metrics registry with Prometheus text exposition.
+
+Counters and histograms live in memory per process. Celery prefork
+children and web workers periodically write a snapshot to ``METRICS_DIR``
+(``metrics-<pid>.json``); the scrape endpoint merges every snapshot with
+its own live values, so one scrape sees the whole host. A process folds
+its values into ``metrics-dead.json`` and removes its snapshot when it
+exits (atexit, Celery ``worker_process_shutdown``); the next scrape does
+the same for processes that died without doing so. Recycled workers
+therefore don't pile up files, and the merged counters never go down,
+which Prometheus would read as a reset. Gauges are
+computed at scrape time by callbacks (e.g. a grouped DB query) instead of
+being tracked per process.
+
+Usage::
+
+    STAGE_SECONDS = Histogram('book_stage_seconds', 'Pipeline stage duration', ['stage'])
+
+    with STAGE_SECONDS.time(stage='outline'):
+        ...
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows; one process there anyway
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SNAPSHOT_PREFIX = 'metrics-'
+# Totals of exited processes; not a pid, so the snapshot scan skips it
+DEAD_SNAPSHOT = f'{SNAPSHOT_PREFIX}dead.json'
+LOCK_FILE = 'metrics.lock'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[LabelKey, object] = {}
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[dict(key), _copy(value)] for key, value in self._series.items()]
+
+
+def _copy(value):
+    return dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value
+
+
+def _add(current, value):
+    """Sum of two values of one series, or None if histogram buckets differ."""
+    if isinstance(value, dict):
+        if len(value['buckets']) != len(current['buckets']):
+            return None
+        return {
+            'buckets': [a + b for a, b in zip(current['buckets'], value['buckets'])],
+            'sum': current['sum'] + value['sum'],
+            'count': current['count'] + value['count'],
+        }
+    return current + value
+
+
+def _sum_snapshots(snapshots: Iterable[Dict[str, list]]) -> Dict[str, list]:
+    totals: Dict[str, Dict[LabelKey, object]] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            merged = totals.setdefault(name, {})
+            for labels, value in series:
+                key = tuple(sorted(labels.items()))
+                current = merged.get(key)
+                total = _copy(value) if current is None else _add(current, value)
+                if total is not None:
+                    merged[key] = total
+    return {name: [[dict(key), value] for key, value in series.items()] for name, series in totals.items()}
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+        self._registry.maybe_flush()
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            # Stored per bucket; cumulated when rendering
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+        for listener in self._registry.listeners:
+            listener(self.name, labels, value)
+        self._registry.maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = {}
+        self._last_flush = 0.0
+        self._cleanup_registered = False
+        # Set once this process's values are in the dead-process totals;
+        # it must not publish a snapshot after that
+        self._retired_pid: Optional[int] = None
+        # Called as listener(name, labels, value) for every histogram
+        # observation; the load-test harness uses this for raw percentiles
+        self.listeners: List[Callable[[str, Dict[str, object], float], None]] = []
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} already registered')
+        self._metrics[metric.name] = metric
+
+    def register_gauge(self, name: str, documentation: str, callback) -> None:
+        """``callback()`` yields ``(labels, value)`` pairs at scrape time."""
+        self._gauges[name] = (documentation, callback)
+
+    # Cross-process snapshots ----------------------------------------------
+
+    def _metrics_dir(self) -> Optional[Path]:
+        directory = getattr(settings, 'METRICS_DIR', '')
+        return Path(directory) if directory else None
+
+    def snapshot(self) -> Dict[str, list]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def _snapshot_path(self, directory: Path, pid: Optional[int] = None) -> Path:
+        return directory / f'{SNAPSHOT_PREFIX}{pid or os.getpid()}.json'
+
+    def flush(self) -> None:
+        directory = self._metrics_dir()
+        if directory is None or self._retired_pid == os.getpid():
+            return
+        self._last_flush = time.monotonic()
+        if not self._cleanup_registered:
+            # Forked children inherit this; remove_snapshot looks up the pid when it runs
+            atexit.register(self.remove_snapshot)
+            self._cleanup_registered = True
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            path = self._snapshot_path(directory)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"Could not write metrics snapshot: {exc}")
+
+    def remove_snapshot(self) -> None:
+        """
+        Fold this process's values into the dead-process totals and delete
+        its snapshot; called as the process exits.
+        """
+        directory = self._metrics_dir()
+        if directory is None or self._retired_pid == os.getpid():
+            return
+        self._retired_pid = os.getpid()
+        try:
+            with self._locked(directory):
+                self._fold_dead(directory, [self.snapshot()])
+                self._snapshot_path(directory).unlink(missing_ok=True)
+        except OSError as exc:
+            logger.warning(f"Could not retire metrics snapshot: {exc}")
+
+    @contextmanager
+    def _locked(self, directory: Path):
+        """Held while snapshots move into the dead-process totals."""
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / LOCK_FILE, 'a') as handle:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def _read_dead(self, directory: Path) -> Dict[str, list]:
+        try:
+            return json.loads((directory / DEAD_SNAPSHOT).read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            logger.warning(f"Could not read exited processes' metrics: {exc}")
+            return {}
+
+    def _fold_dead(self, directory: Path, snapshots: List[Dict[str, list]]) -> Dict[str, list]:
+        """Add ``snapshots`` to the dead-process totals; call under ``_locked``."""
+        totals = _sum_snapshots([self._read_dead(directory), *snapshots])
+        path = directory / DEAD_SNAPSHOT
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(totals))
+        os.replace(tmp_path, path)
+        return totals
+
+    def maybe_flush(self) -> None:
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 15)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def _other_snapshots(self) -> List[Dict[str, list]]:
+        """The dead-process totals and every other live process's snapshot."""
+        directory = self._metrics_dir()
+        if directory is None or not directory.is_dir():
+            return []
+        own = os.getpid()
+        totals: Dict[str, list] = {}
+        live, dead, dead_paths = [], [], []
+        try:
+            # Locked so a process retiring mid-scrape is counted exactly once
+            with self._locked(directory):
+                for path in directory.glob(f'{SNAPSHOT_PREFIX}*.json'):
+                    try:
+                        pid = int(path.stem[len(SNAPSHOT_PREFIX):])
+                    except ValueError:
+                        continue
+                    if pid == own:
+                        continue
+                    try:
+                        snapshot = json.loads(path.read_text())
+                    except (OSError, ValueError):
+                        snapshot = None
+                    if _pid_alive(pid):
+                        if snapshot is not None:
+                            live.append(snapshot)
+                    else:
+                        # Killed before it could clean up (OOM, SIGKILL, crash)
+                        dead_paths.append(path)
+                        if snapshot is not None:
+                            dead.append(snapshot)
+                totals = self._fold_dead(directory, dead) if dead else self._read_dead(directory)
+                for path in dead_paths:
+                    path.unlink(missing_ok=True)
+        except OSError as exc:
+            logger.warning(f"Could not merge metrics snapshots: {exc}")
+        return [totals, *live]
+
+    def collect(self) -> Dict[str, Dict[LabelKey, object]]:
+        """Merge this process's live series with every other snapshot."""
+        merged: Dict[str, Dict[LabelKey, object]] = {name: {} for name in self._metrics}
+        for snapshot in [self.snapshot(), *self._other_snapshots()]:
+            for name, series in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, value in series:
+                    key = tuple((label, labels.get(label, '')) for label in metric.labelnames)
+                    current = merged[name].get(key)
+                    total = _copy(value) if current is None else _add(current, value)
+                    if total is not None:
+                        merged[name][key] = total
+        return merged
+
+    # Exposition -----------------------------------------------------------
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type_name}')
+            for key, value in sorted(series.items()):
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value['buckets']):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(key, le=_number(bound))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(key, le="+Inf")} {value["count"]}')
+                    lines.append(f'{name}_sum{_labels(key)} {_number(value["sum"])}')
+                    lines.append(f'{name}_count{_labels(key)} {value["count"]}')
+                else:
+                    lines.append(f'{name}{_labels(key)} {_number(value)}')
+
+        for name, (documentation, callback) in self._gauges.items():
+            try:
+                samples = list(callback())
+            except Exception as exc:
+                logger.warning(f"Gauge {name} failed: {exc}")
+                continue
+            lines.append(f'# HELP {name} {_escape_help(documentation)}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _escape_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(key: LabelKey, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_value(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value)) if abs(value) < 1e15 else repr(value)
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
@@ -1,20 +1,128 @@
 # backend/utils/mongodb.py
-from pymongo import MongoClient
+import os
+import threading
+
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from django.conf import settings
 
-# Reuse connection across requests (optional: add connection pooling if needed)
+# One client per process. MongoClient is thread-safe and pools its own
+# connections, but it is NOT fork-safe: a client inherited by a prefork
+# Celery child shares sockets with its parent. We remember the pid that
+# created the client and rebuild it transparently after a fork.
 _client = None
 _db = None
+_client_pid = None
+_lock = threading.Lock()
+
+# Indexes the application relies on for its hot lookups. Every
+# download, final-PDF merge and generation run does a find_one on
+# ``book_id`` in these collections; chapter bodies are read by
+# ``book_id`` sorted on ``number``.
+MONGODB_INDEXES = {
+    'book_contents': [
+        {'keys': [('book_id', ASCENDING)], 'name': 'book_id_unique', 'unique': True},
+    ],
+    'book_generation_params': [
+        {'keys': [('book_id', ASCENDING)], 'name': 'book_id_unique', 'unique': True},
+    ],
+    'book_chapters': [
+        {'keys': [('book_id', ASCENDING), ('number', ASCENDING)], 'name': 'book_id_number_unique', 'unique': True},
+    ],
+    # Task profiles, listed newest first on the book's admin page
+    'book_profiles': [
+        {'keys': [('book_id', ASCENDING), ('created_at', DESCENDING)], 'name': 'book_id_created_at'},
+    ],
+}
+
+
+def _client_options():
+    """Build MongoClient keyword arguments from settings."""
+    options = {
+        'maxPoolSize': getattr(settings, 'MONGODB_MAX_POOL_SIZE', 50),
+        'minPoolSize': getattr(settings, 'MONGODB_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': getattr(settings, 'MONGODB_MAX_IDLE_TIME_MS', 300000),
+        'connectTimeoutMS': getattr(settings, 'MONGODB_CONNECT_TIMEOUT_MS', 5000),
+        'serverSelectionTimeoutMS': getattr(settings, 'MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'socketTimeoutMS': getattr(settings, 'MONGODB_SOCKET_TIMEOUT_MS', 30000),
+        'retryWrites': True,
+    }
+    compressors = getattr(settings, 'MONGODB_COMPRESSORS', '')
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
 
 def get_mongodb_client():
-    global _client
-    if _client is None:
-        _client = MongoClient(settings.MONGODB_URI)
+    global _client, _db, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                # Never close() an inherited client: its sockets belong to
+                # the parent process. Just drop the reference.
+                _client = MongoClient(settings.MONGODB_URI, connect=False, **_client_options())
+                _db = None
+                _client_pid = pid
     return _client
 
+
 def get_mongodb_db():
     global _db
+    client = get_mongodb_client()
     if _db is None:
-        client = get_mongodb_client()
         _db = client[settings.MONGODB_DB_NAME]
     return _db
+
+
+def reset_mongodb_client():
+    """Forget the current client so the next call builds a fresh one.
+
+    Called in forked children (Celery ``worker_process_init``) so they
+    never reuse the parent's connection pool.
+    """
+    global _client, _db, _client_pid
+    _client = None
+    _db = None
+    _client_pid = None
+
+
+def ensure_indexes(db=None):
+    """Create the application's indexes. Safe to call repeatedly.
+
+    Returns a dict mapping collection name to the index names created.
+    """
+    db = db if db is not None else get_mongodb_db()
+    created = {}
+    for collection_name, specs in MONGODB_INDEXES.items():
+        collection = db[collection_name]
+        created[collection_name] = []
+        for spec in specs:
+            name = collection.create_index(
+                spec['keys'],
+                name=spec['name'],
+                unique=spec.get('unique', False),
+                background=True,
+            )
+            created[collection_name].append(name)
+    return created
+
+
+def missing_indexes(db=None):
+    """Return ``(collection, index_name)`` pairs that are absent or wrong."""
+    db = db if db is not None else get_mongodb_db()
+    missing = []
+    for collection_name, specs in MONGODB_INDEXES.items():
+        existing = db[collection_name].index_information()
+        for spec in specs:
+            info = existing.get(spec['name'])
+            if (
+                info is None
+                or list(info.get('key', [])) != list(spec['keys'])
+                or bool(info.get('unique', False)) != spec.get('unique', False)
+            ):
+                missing.append((collection_name, spec['name']))
+    return missing
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_mongodb_client)
@@ -0,0 +1,8 @@
+"""
+Micro-benchmarks for hot text and layout functions, and the end-to-end
+pipeline load test.
+
+Run with ``python manage.py run_benchmarks``; see benchmarks/runner.py for
+how timings are taken and compared against a stored baseline.
+``python manage.py loadtest_pipeline`` drives benchmarks/loadtest.py.
+"""
@@ -0,0 +1,149 @@
+"""
+Benchmark cases: the text and layout functions every book goes through.
+
+Each case is a ``(name, setup)`` pair; ``setup()`` builds the objects once
+and returns the zero-argument callable that gets timed, so filtering by
+name skips the setup of cases that won't run. Anything that would hit the
+network, MongoDB or the cache is bypassed in setup so the timings only
+cover the code under test.
+"""
+
+import io
+import random
+from typing import Callable, List, Tuple
+from unittest import mock
+
+from benchmarks import corpora
+
+Case = Tuple[str, Callable[[], Callable[[], object]]]
+
+
+def _no_google_fonts():
+    # Fall back to the bundled ReportLab fonts instead of downloading
+    return mock.patch('backend.utils.fonts.GoogleFontsIntegration.load_google_font', return_value=None)
+
+
+def _evaluate_section(size):
+    def setup():
+        from books.services.quality import evaluate_section
+
+        text = corpora.chapter(size)['content']
+        return lambda: evaluate_section(text)
+    return setup
+
+
+def _adapt_chapter_template(size):
+    def setup():
+        from customllm.services.local_llm_engine import LocalLLMEngine
+
+        with mock.patch.object(LocalLLMEngine, '_load_training_data'):
+            engine = LocalLLMEngine()
+        engine.training_data = {}
+        chapter = corpora.chapter(size)
+        template = {'completion': chapter['content'][:2000]}
+        context = {'domain': 'AI & Automation', 'niche': 'Business Automation', 'audience': 'founders'}
+        topics = corpora.subtopics()
+
+        def run():
+            # The template filler picks phrases at random
+            random.seed(corpora.SEED)
+            return engine._adapt_chapter_template(
+                template, chapter['title'], chapter['content'][:300], chapter['word_count'], context, topics,
+            )
+        return run
+    return setup
+
+
+def _final_rewrite(size):
+    def setup():
+        from books.services.custom_llm_book_generator import CustomLLMBookGenerator
+
+        # __init__ wants Cloudflare credentials; the rewrite pass doesn't use them
+        generator = CustomLLMBookGenerator.__new__(CustomLLMBookGenerator)
+        chapters = corpora.book(size)
+        return lambda: generator._final_rewrite([dict(chapter) for chapter in chapters])
+    return setup
+
+
+def _format_chapter(size):
+    def setup():
+        from books.services.pdf_generator_pro import ProfessionalPDFGenerator
+
+        with _no_google_fonts():
+            generator = ProfessionalPDFGenerator(domain_slug='ai_automation')
+        chapter = corpora.chapter(size)
+        return lambda: generator._format_chapter(chapter['title'], chapter['content'])
+    return setup
+
+
+def _prepare_title_layout(title_key):
+    def setup():
+        from reportlab.pdfgen import canvas
+
+        from covers.layout_engine import CoverLayoutEngine
+        from covers.template_library import DEFAULT_TEMPLATE_KEY, resolve_template
+
+        with _no_google_fonts():
+            engine = CoverLayoutEngine(
+                canvas.Canvas(io.BytesIO()), resolve_template(DEFAULT_TEMPLATE_KEY), domain_slug='ai_automation',
+            )
+        title = corpora.TITLES[title_key]
+        return lambda: engine._prepare_title_layout(title)
+    return setup
+
+
+def _trending_context(sub_niche):
+    def setup():
+        from books.services.trending import get_trending_context
+
+        return lambda: get_trending_context(sub_niche)
+    return setup
+
+
+def _parse_outline(size):
+    def setup():
+        from customllm.services.response_parser import ResponseParser
+
+        parser = ResponseParser()
+        response = corpora.outline_response(size)
+        return lambda: parser.parse_outline(response)
+    return setup
+
+
+def _stream_outline(size):
+    def setup():
+        from customllm.services.response_parser import StreamingOutlineParser
+
+        response = corpora.outline_response(size)
+        # Roughly token-sized pieces, as generate_text_stream yields them
+        chunks = [response[start:start + 16] for start in range(0, len(response), 16)]
+
+        def run():
+            parser = StreamingOutlineParser()
+            for chunk in chunks:
+                parser.feed(chunk)
+            parser.close()
+            return parser.outline()
+        return run
+    return setup
+
+
+def all_cases() -> List[Case]:
+    cases: List[Case] = []
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'quality.evaluate_section[{size}]', _evaluate_section(size)))
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'local_llm.adapt_chapter_template[{size}]', _adapt_chapter_template(size)))
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'generator.final_rewrite[{size}]', _final_rewrite(size)))
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'pdf.format_chapter[{size}]', _format_chapter(size)))
+    for title_key in corpora.TITLES:
+        cases.append((f'cover.prepare_title_layout[{title_key}]', _prepare_title_layout(title_key)))
+    cases.append(('trending.get_trending_context[known]', _trending_context('ai_business_automation')))
+    cases.append(('trending.get_trending_context[fallback]', _trending_context('unlisted_niche')))
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'parser.parse_outline[{size}]', _parse_outline(size)))
+    for size in corpora.BOOK_SIZES:
+        cases.append((f'parser.stream_outline[{size}]', _stream_outline(size)))
+    return cases
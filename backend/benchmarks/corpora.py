@@ -0,0 +1,101 @@
+"""
+Fixed synthetic corpora for the benchmarks.
+
+Everything is generated from a seeded RNG, so each run (and each
+machine) benchmarks byte-identical inputs. The text mimics generated
+chapters: ``####`` section headings, paragraphs, bullet lists and the
+occasional repeated sentence, which is what the quality and PDF code
+spend their time on.
+"""
+
+import random
+from functools import lru_cache
+from typing import Dict, List
+
+SEED = 20250101
+
+# (chapters, words per chapter)
+BOOK_SIZES = {
+    'short': (6, 600),
+    'standard': (8, 1200),
+    'long': (12, 2000),
+}
+
+TITLES = {
+    'short': 'AI Workflows',
+    'long': 'The Complete Practical Guide to Automating Your Small Business Workflows with AI',
+    'very_long': (
+        'Mindful Parenting Through the Early Years: Speech, Play, Routines and Emotional '
+        'Resilience for Busy Families Who Want Calm Homes and Confident Children'
+    ),
+}
+
+_VOCABULARY = (
+    'automation workflow customer process team data model strategy practice routine '
+    'child parent habit learning example result metric tool system product market '
+    'growth quality feedback step plan review experiment pattern signal context goal '
+    'simple practical clear consistent measurable reliable gentle focused steady '
+    'build improve measure test adapt share track design launch support explain'
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(8, 18))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def _chapter_text(rng: random.Random, words: int, sections: int = 4) -> str:
+    parts: List[str] = []
+    per_section = max(words // sections, 40)
+    for index in range(sections):
+        parts.append(f"#### Section {index + 1}: {rng.choice(_VOCABULARY).title()} {rng.choice(_VOCABULARY).title()}")
+        written = 0
+        while written < per_section:
+            if rng.random() < 0.15:
+                bullets = [f"- {_sentence(rng)}" for _ in range(rng.randint(3, 5))]
+                parts.append('\n'.join(bullets))
+                written += sum(len(b.split()) for b in bullets)
+                continue
+            paragraph = ' '.join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+            if rng.random() < 0.1 and len(parts) > 1:
+                # Generated text repeats itself; the quality gate has to notice
+                paragraph += ' ' + parts[-1].split('. ')[0].lstrip('- ') + '.'
+            parts.append(paragraph)
+            written += len(paragraph.split())
+    return '\n\n'.join(parts)
+
+
+@lru_cache(maxsize=None)
+def book(size: str) -> List[Dict]:
+    """Chapters for a synthetic book of the given size."""
+    chapter_count, words = BOOK_SIZES[size]
+    rng = random.Random(f'{SEED}-{size}')
+    return [
+        {
+            'number': number,
+            'title': f"Chapter {number}: {rng.choice(_VOCABULARY).title()} {rng.choice(_VOCABULARY).title()}",
+            'content': _chapter_text(rng, words),
+            'word_count': words,
+        }
+        for number in range(1, chapter_count + 1)
+    ]
+
+
+def chapter(size: str) -> Dict:
+    return book(size)[0]
+
+
+@lru_cache(maxsize=None)
+def outline_response(size: str) -> str:
+    """Raw model output in the TITLE / numbered-chapter format ResponseParser reads."""
+    chapters = book(size)
+    lines = [f"TITLE: {TITLES['long']}", '', 'CHAPTERS:']
+    for item in chapters:
+        summary = item['content'].split('\n\n')[1].split('. ')[0]
+        lines.append(f"{item['number']}. {item['title'].split(': ', 1)[1]} - {summary}")
+    return '\n'.join(lines)
+
+
+def subtopics(count: int = 4) -> List[str]:
+    rng = random.Random(f'{SEED}-subtopics')
+    return [f"{rng.choice(_VOCABULARY).title()} {rng.choice(_VOCABULARY).title()}" for _ in range(count)]
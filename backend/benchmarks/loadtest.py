@@ -0,0 +1,604 @@
+"""
+End-to-end pipeline load test (``manage.py loadtest_pipeline``)
+
+Test-support code: it patches settings and services with
+``unittest.mock`` and ``override_settings``, so it lives outside the
+Django apps and is only imported by the command and the tests.
+
+Simulated users drive create -> content -> cover -> merge -> download
+through the real API views and Celery tasks. Celery runs eagerly in the
+user's thread, MongoDB is swapped for an in-memory stand-in and the
+Cloudflare HTTP API for a local stub with configurable latency, so the
+numbers describe this codebase rather than the network. With
+``cloudflare_url`` the calls go over HTTP to a stand-in server instead,
+through the real session, response cache and rate limiter.
+
+Stage latencies are exclusive: a task's time excludes the tasks it
+triggered eagerly, so ``content_task`` is not inflated by ``cover_task``
+and ``final_pdf_task``. Finer stages (outline, chapter, pdf_render, mongo_*) come from
+the histograms in books/metrics.py.
+"""
+
+import copy
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest import mock
+
+from bson import ObjectId
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from pymongo import ReplaceOne, ReturnDocument
+
+from backend.utils.memory import MiB, peak_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+# A write slower than this is counted as having waited on a lock
+LOCK_WAIT_THRESHOLD = 0.05
+
+# Report keys compared against a baseline, and whether bigger is better
+BASELINE_KEYS = {
+    'books_per_minute': True,
+    'peak_rss_mb': False,
+    'db.write_p95_ms': False,
+    'db.lock_waits': False,
+    'db.lock_errors': False,
+}
+BASELINE_STAGE_FIELDS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+# MongoDB stand-in ------------------------------------------------------------
+
+class MemoryCursor(list):
+    def sort(self, key, direction=1):
+        return MemoryCursor(sorted(self, key=lambda doc: doc.get(key), reverse=direction < 0))
+
+    def limit(self, count):
+        return MemoryCursor(self[:count]) if count else self
+
+
+class MemoryCollection:
+    """The subset of pymongo's Collection API the application uses."""
+
+    def __init__(self):
+        self._docs: List[Dict[str, Any]] = []
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _matches(doc, query):
+        for key, condition in (query or {}).items():
+            value = doc.get(key)
+            if isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+                for op, operand in condition.items():
+                    if op == '$in' and value not in operand:
+                        return False
+                    if op == '$nin' and value in operand:
+                        return False
+                    if op == '$ne' and value == operand:
+                        return False
+                    if op == '$exists' and (key in doc) != bool(operand):
+                        return False
+            elif value != condition:
+                return False
+        return True
+
+    @staticmethod
+    def _project(doc, projection):
+        doc = copy.deepcopy(doc)
+        if not projection:
+            return doc
+        included = [key for key, flag in projection.items() if flag]
+        if included:
+            result = {key: doc[key] for key in included if key in doc and key != '_id'}
+            if projection.get('_id', 1) and '_id' in doc:
+                result['_id'] = doc['_id']
+            return result
+        return {key: value for key, value in doc.items() if key not in projection}
+
+    def _replace(self, query, replacement, upsert):
+        for index, doc in enumerate(self._docs):
+            if self._matches(doc, query):
+                self._docs[index] = {**copy.deepcopy(replacement), '_id': doc['_id']}
+                return doc, self._docs[index]
+        if not upsert:
+            return None, None
+        new_doc = {**copy.deepcopy(replacement), '_id': replacement.get('_id', ObjectId())}
+        self._docs.append(new_doc)
+        return None, new_doc
+
+    def insert_one(self, document):
+        with self._lock:
+            document.setdefault('_id', ObjectId())
+            self._docs.append(copy.deepcopy(document))
+        return SimpleNamespace(inserted_id=document['_id'])
+
+    def find_one(self, query=None, projection=None):
+        with self._lock:
+            for doc in self._docs:
+                if self._matches(doc, query):
+                    return self._project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return MemoryCursor(self._project(doc, projection) for doc in self._docs if self._matches(doc, query))
+
+    def count_documents(self, query):
+        with self._lock:
+            return sum(1 for doc in self._docs if self._matches(doc, query))
+
+    def find_one_and_replace(self, query, replacement, projection=None, upsert=False,
+                             return_document=ReturnDocument.BEFORE, **kwargs):
+        with self._lock:
+            before, after = self._replace(query, replacement, upsert)
+        chosen = after if return_document == ReturnDocument.AFTER else before
+        return self._project(chosen, projection) if chosen else None
+
+    def replace_one(self, query, replacement, upsert=False):
+        with self._lock:
+            before, after = self._replace(query, replacement, upsert)
+        upserted_id = after['_id'] if before is None and after is not None else None
+        return SimpleNamespace(matched_count=int(before is not None), upserted_id=upserted_id)
+
+    def bulk_write(self, requests, ordered=True):
+        with self._lock:
+            for request in requests:
+                if not isinstance(request, ReplaceOne):
+                    raise NotImplementedError(f'{type(request).__name__} is not supported by the stand-in')
+                self._replace(request._filter, request._doc, request._upsert)
+
+    def update_one(self, query, update, upsert=False):
+        with self._lock:
+            for doc in self._docs:
+                if self._matches(doc, query):
+                    doc.update(copy.deepcopy(update.get('$set', {})))
+                    for key in update.get('$unset', {}):
+                        doc.pop(key, None)
+                    return SimpleNamespace(matched_count=1)
+            if upsert:
+                self._docs.append({**query, **copy.deepcopy(update.get('$set', {})), '_id': ObjectId()})
+        return SimpleNamespace(matched_count=0)
+
+    def delete_one(self, query):
+        with self._lock:
+            for index, doc in enumerate(self._docs):
+                if self._matches(doc, query):
+                    del self._docs[index]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, query):
+        with self._lock:
+            kept = [doc for doc in self._docs if not self._matches(doc, query)]
+            deleted = len(self._docs) - len(kept)
+            self._docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def create_index(self, keys, name=None, **kwargs):
+        return name or '_'.join(f'{key}_{direction}' for key, direction in keys)
+
+    def index_information(self):
+        return {}
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            return self._collections.setdefault(name, MemoryCollection())
+
+    get_collection = __getitem__
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+
+@contextmanager
+def memory_mongo():
+    """Point backend.utils.mongodb at an in-memory database for the block."""
+    from backend.utils import mongodb
+
+    saved = (mongodb._client, mongodb._db, mongodb._client_pid)
+    database = MemoryDatabase()
+    mongodb._client = SimpleNamespace(close=lambda: None)
+    mongodb._db = database
+    mongodb._client_pid = os.getpid()
+    try:
+        yield database
+    finally:
+        mongodb._client, mongodb._db, mongodb._client_pid = saved
+
+
+# Cloudflare stub ---------------------------------------------------------------
+
+# A 1x1 transparent PNG
+STUB_IMAGE = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+class StubCloudflareAPI:
+    """Stands in for the Cloudflare client's pooled HTTP session."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _response(self, payload=None, content=b''):
+        body = json.dumps(payload).encode() if payload is not None else content
+        return SimpleNamespace(status_code=200, content=body, text=body.decode('latin-1'),
+                               json=lambda: payload, iter_lines=lambda: iter(()))
+
+    def request(self, method, url, **kwargs):
+        return self.post(url, **kwargs) if method == 'POST' else self.get(url, **kwargs)
+
+    def post(self, url, json=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if json and 'prompt' in json and 'messages' not in json:
+            return self._response(content=STUB_IMAGE)
+        return self._response({'result': {'response': 'Stub response.', 'tokens_used': 16}, 'success': True})
+
+    def get(self, url, **kwargs):
+        return self._response({'result': [], 'success': True})
+
+
+@contextmanager
+def stub_cloudflare(latency=0.0):
+    from customllm.services import cloudflare_client
+
+    stub = StubCloudflareAPI(latency)
+    credentials = {'CLOUDFLARE_API_TOKEN': 'loadtest', 'CLOUDFLARE_ACCOUNT_ID': 'loadtest'}
+    # Every book asks the stub again, as it would with real, varied prompts,
+    # and the stub has no provider limits to respect
+    with mock.patch.dict(os.environ, credentials), override_settings(LLM_CACHE_BACKEND='', RATE_LIMITS={}), \
+            mock.patch.object(cloudflare_client, 'get_session', lambda: stub):
+        yield stub
+
+
+class RemoteCloudflareAPI:
+    """Counts the calls a run makes to a stand-in server (manage.py cloudflare_stand_in)."""
+
+    def __init__(self, url):
+        self.stats_url = f"{url.rstrip('/')}/__stats__"
+        self._start = self._served()
+
+    def _served(self):
+        import requests
+
+        return requests.get(self.stats_url, timeout=5).json()['requests']
+
+    @property
+    def calls(self):
+        return self._served() - self._start
+
+
+@contextmanager
+def remote_cloudflare(url):
+    """
+    Send the run's Cloudflare calls over HTTP to ``url``. Unlike the stub,
+    the response cache and rate limiter stay as configured, so their
+    effect shows in the numbers.
+    """
+    with override_settings(CLOUDFLARE_API_BASE_URL=url):
+        yield RemoteCloudflareAPI(url)
+
+
+# Measurement -----------------------------------------------------------------
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def peak_rss_mb():
+    return round(peak_rss_bytes() / MiB, 1)
+
+
+def summarize_memory(values):
+    return {
+        'count': len(values),
+        'rss_growth_p95_mb': round(percentile(values, 95) / MiB, 2),
+        'rss_growth_max_mb': round(max(values) / MiB, 2) if values else 0.0,
+    }
+
+
+class Recorder:
+    """Collects stage samples, exclusive task timings and query stats."""
+
+    TASK_STAGES = {
+        'books.tasks.generate_book_content': 'content_task',
+        'books.tasks.generate_book_covers': 'cover_task',
+        'books.tasks.create_final_book_pdf': 'final_pdf_task',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.samples: Dict[str, List[float]] = {}
+        # RSS growth per stage; with concurrent users it includes whatever
+        # the other threads allocated meanwhile, so read it as an upper bound
+        self.memory: Dict[str, List[float]] = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.write_seconds: List[float] = []
+        self.lock_errors = 0
+
+    def sample(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    # Exclusive timing of nested (eager) work
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def enter(self, stage):
+        self._stack().append([stage, time.perf_counter(), 0.0])
+
+    def exit(self):
+        stage, started, nested = self._stack().pop()
+        total = time.perf_counter() - started
+        if self._stack():
+            self._stack()[-1][2] += total
+        self.sample(stage, total - nested)
+        return total
+
+    @contextmanager
+    def stage(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def task_prerun(self, sender=None, **kwargs):
+        stage = self.TASK_STAGES.get(getattr(sender, 'name', ''))
+        if stage:
+            self.enter(stage)
+
+    def task_postrun(self, sender=None, **kwargs):
+        if self.TASK_STAGES.get(getattr(sender, 'name', '')):
+            self.exit()
+
+    def observe(self, name, labels, value):
+        if name == 'book_stage_seconds':
+            self.sample(labels['stage'], value)
+        elif name == 'book_mongo_seconds':
+            self.sample(f"mongo_{labels['operation']}", value)
+        elif name == 'book_stage_rss_growth_bytes':
+            with self._lock:
+                self.memory.setdefault(labels['stage'], []).append(value)
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if 'locked' in str(exc):
+                with self._lock:
+                    self.lock_errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            is_write = sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE')
+            with self._lock:
+                self.queries += 1
+                self.query_seconds += elapsed
+                if is_write:
+                    self.write_seconds.append(elapsed)
+
+
+# Runner ----------------------------------------------------------------------
+
+def _seed_catalog():
+    from books.models import Domain, Niche
+
+    domain, _ = Domain.objects.get_or_create(slug='loadtest', defaults={'name': 'AI & Automation'})
+    niche, _ = Niche.objects.get_or_create(
+        slug='loadtest-niche', defaults={'domain': domain, 'name': 'Workflow Automation'},
+    )
+    return domain, niche
+
+
+def _simulated_user(index, books, recorder, domain, niche, book_length):
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+
+    from books.models import Book
+    from users.models import UserProfile
+
+    outcomes = []
+    try:
+        with connection.execute_wrapper(recorder):
+            user = User.objects.create_user(f'loadtest-{index}', f'loadtest-{index}@example.com')
+            UserProfile.objects.create(user=user, subscription_tier='testing')
+            client = APIClient()
+            client.force_authenticate(user)
+
+            for _ in range(books):
+                started = time.perf_counter()
+                with recorder.stage('create'):
+                    response = client.post(
+                        '/api/books/create-guided/',
+                        {'domain': domain.slug, 'niche': niche.slug, 'book_length': book_length},
+                        format='json',
+                    )
+                if response.status_code != 201:
+                    outcomes.append({'ok': False, 'error': f'create returned {response.status_code}'})
+                    continue
+
+                book = Book.objects.get(pk=response.data['id'])
+                if book.status != 'ready':
+                    outcomes.append({'ok': False, 'error': book.error_message or book.status})
+                    continue
+
+                with recorder.stage('download'):
+                    download = client.get(f'/api/books/{book.pk}/download/')
+                    size = sum(len(chunk) for chunk in download.streaming_content) if download.streaming else len(download.content)
+                if download.status_code != 200 or not size:
+                    outcomes.append({'ok': False, 'error': f'download returned {download.status_code}'})
+                    continue
+
+                recorder.sample('book_total', time.perf_counter() - started)
+                outcomes.append({'ok': True})
+    finally:
+        connections.close_all()
+    return outcomes
+
+
+def run_isolated_load_test(workdir: Path, **options):
+    """``run_load_test`` against a throwaway database and MEDIA_ROOT under ``workdir``."""
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # A file, not shared-cache memory, so concurrent writers wait on
+        # the real SQLite lock like they do in development
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(workdir / 'loadtest.sqlite3')
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(MEDIA_ROOT=str(workdir / 'media'), METRICS_DIR=''):
+            return run_load_test(**options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def run_load_test(users=4, books_per_user=2, concurrency=None, book_length='short', cloudflare_latency=0.0,
+                  cloudflare_url=None):
+    """Drive the pipeline and return a JSON-serialisable report.
+
+    Expects an isolated database and MEDIA_ROOT; see ``run_isolated_load_test``.
+    """
+    from celery.signals import task_postrun, task_prerun
+
+    from backend.celery import app
+    from backend.utils.metrics import REGISTRY
+
+    concurrency = concurrency or users
+    recorder = Recorder()
+    domain, niche = _seed_catalog()
+
+    saved_conf = (app.conf.task_always_eager, app.conf.task_eager_propagates)
+    app.conf.task_always_eager, app.conf.task_eager_propagates = True, False
+    task_prerun.connect(recorder.task_prerun, weak=False)
+    task_postrun.connect(recorder.task_postrun, weak=False)
+    REGISTRY.listeners.append(recorder.observe)
+
+    started = time.perf_counter()
+    try:
+        cloudflare_api = remote_cloudflare(cloudflare_url) if cloudflare_url else stub_cloudflare(cloudflare_latency)
+        with memory_mongo(), cloudflare_api as cloudflare:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [
+                    pool.submit(_simulated_user, index, books_per_user, recorder, domain, niche, book_length)
+                    for index in range(users)
+                ]
+                outcomes = list(itertools.chain.from_iterable(future.result() for future in futures))
+    finally:
+        wall = time.perf_counter() - started
+        REGISTRY.listeners.remove(recorder.observe)
+        task_prerun.disconnect(recorder.task_prerun)
+        task_postrun.disconnect(recorder.task_postrun)
+        app.conf.task_always_eager, app.conf.task_eager_propagates = saved_conf
+
+    completed = sum(1 for outcome in outcomes if outcome['ok'])
+    errors = sorted({outcome['error'] for outcome in outcomes if not outcome['ok']})
+    return {
+        'config': {
+            'users': users,
+            'books_per_user': books_per_user,
+            'concurrency': concurrency,
+            'book_length': book_length,
+            'cloudflare_latency_ms': round(cloudflare_latency * 1000, 1),
+            'cloudflare_url': cloudflare_url,
+            'database': connection.vendor,
+        },
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'wall_seconds': round(wall, 3),
+        'books_requested': users * books_per_user,
+        'books_completed': completed,
+        'books_failed': len(outcomes) - completed,
+        'errors': errors[:20],
+        'books_per_minute': round(completed / wall * 60, 2) if wall else 0.0,
+        'stages': {stage: summarize(values) for stage, values in sorted(recorder.samples.items())},
+        'stage_memory': {stage: summarize_memory(values) for stage, values in sorted(recorder.memory.items())},
+        'db': {
+            'queries': recorder.queries,
+            'query_seconds': round(recorder.query_seconds, 3),
+            'write_p95_ms': round(percentile(recorder.write_seconds, 95) * 1000, 2),
+            'lock_waits': sum(1 for seconds in recorder.write_seconds if seconds > LOCK_WAIT_THRESHOLD),
+            'lock_errors': recorder.lock_errors,
+        },
+        'cloudflare_calls': cloudflare.calls,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _lookup(report, dotted):
+    value = report
+    for part in dotted.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare_reports(current, baseline, max_regression=None):
+    """Rows of ``(key, baseline, current, change_pct, regressed)``.
+
+    ``change_pct`` is signed so that positive always means worse.
+    """
+    keys = dict(BASELINE_KEYS)
+    for stage in sorted(set(current.get('stages', {})) & set(baseline.get('stages', {}))):
+        for field in BASELINE_STAGE_FIELDS:
+            keys[f'stages.{stage}.{field}'] = False
+
+    rows = []
+    for key, higher_is_better in keys.items():
+        old, new = _lookup(baseline, key), _lookup(current, key)
+        if old is None or new is None:
+            continue
+        if old:
+            change = (new - old) / old * 100
+        else:
+            change = 0.0 if new == old else 100.0
+        if higher_is_better:
+            change = -change
+        regressed = max_regression is not None and change > max_regression
+        rows.append((key, old, new, round(change, 1), regressed))
+    return rows
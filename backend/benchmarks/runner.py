@@ -0,0 +1,104 @@
+"""
+Timing and baseline comparison for the micro-benchmarks.
+
+Each case is calibrated so one sample runs for at least ``min_time``
+seconds (tiny functions are looped), warmed up, then sampled ``repeats``
+times with the garbage collector paused. The median per-call time is what
+gets compared against the baseline; min and stdev are reported to show
+how noisy the run was.
+"""
+
+import gc
+import json
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class Result:
+    name: str
+    loops: int
+    repeats: int
+    min_us: float
+    median_us: float
+    stdev_us: float
+
+
+def _time_loops(func: Callable[[], object], loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return time.perf_counter() - started
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    warmup: int = 2,
+    repeats: int = 7,
+    min_time: float = 0.05,
+) -> Result:
+    """Time ``func`` and return per-call statistics in microseconds."""
+    loops = 1
+    while True:
+        elapsed = _time_loops(func, loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    for _ in range(warmup):
+        _time_loops(func, loops)
+
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        samples = [_time_loops(func, loops) / loops * 1e6 for _ in range(repeats)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return Result(
+        name=name,
+        loops=loops,
+        repeats=repeats,
+        min_us=round(min(samples), 3),
+        median_us=round(statistics.median(samples), 3),
+        stdev_us=round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+    )
+
+
+def load_baseline(path) -> Dict[str, dict]:
+    return json.loads(Path(path).read_text())['results']
+
+
+def save_baseline(path, results: List[Result]) -> None:
+    payload = {'results': {result.name: asdict(result) for result in results}}
+    Path(path).write_text(json.dumps(payload, indent=2, sort_keys=True) + '\n')
+
+
+def compare(results: List[Result], baseline: Dict[str, dict], threshold: float) -> List[dict]:
+    """
+    One row per result. ``change_pct`` is positive when slower than the
+    baseline; ``regressed`` is set when it exceeds ``threshold`` percent.
+    Cases missing from the baseline are reported with ``change_pct=None``.
+    """
+    rows = []
+    for result in results:
+        old: Optional[dict] = baseline.get(result.name)
+        if not old or not old.get('median_us'):
+            rows.append({'name': result.name, 'baseline_us': None, 'current_us': result.median_us,
+                         'change_pct': None, 'regressed': False})
+            continue
+        change = (result.median_us - old['median_us']) / old['median_us'] * 100
+        rows.append({
+            'name': result.name,
+            'baseline_us': old['median_us'],
+            'current_us': result.median_us,
+            'change_pct': round(change, 1),
+            'regressed': change > threshold,
+        })
+    return rows
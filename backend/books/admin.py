@@ -1,5 +1,12 @@
+from bson import ObjectId
+from bson.errors import InvalidId
 from django.contrib import admin
+from django.http import Http404, HttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
 from .models import Book, BookTemplate, Domain, Niche, CoverStyle
+from .services.profiling import flag_book, list_profiles, profile_data
 
 
 @admin.register(Domain)
@@ -32,8 +39,74 @@ class BookAdmin(admin.ModelAdmin):
     list_display = ['title', 'user', 'domain', 'niche', 'book_length', 'status', 'quality_score', 'created_at']
     list_filter = ['status', 'domain', 'niche', 'book_length', 'created_at']
     search_fields = ['title', 'user__username', 'user__email']
-    readonly_fields = ['created_at', 'updated_at', 'generation_started_at', 'generation_completed_at']
+    readonly_fields = [
+        'created_at', 'updated_at', 'generation_started_at', 'generation_completed_at', 'profiling_hotspots',
+    ]
     ordering = ['-created_at']
+    actions = ['profile_next_run']
+
+    # Hotspots shown per stored profile on the change page
+    HOTSPOT_ROWS = 15
+
+    @admin.action(description='Profile the next pipeline run')
+    def profile_next_run(self, request, queryset):
+        for book_id in queryset.values_list('id', flat=True):
+            flag_book(book_id)
+        self.message_user(request, f"Profiling armed for {queryset.count()} book(s); regenerate them to capture.")
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:book_id>/profiles/<str:profile_id>.prof',
+                self.admin_site.admin_view(self.download_profile),
+                name='books_book_profile',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_profile(self, request, book_id, profile_id):
+        book = self.get_object(request, str(book_id))
+        if book is None or not self.has_view_permission(request, book):
+            raise Http404
+        try:
+            data = profile_data(book.pk, ObjectId(profile_id))
+        except InvalidId:
+            data = None
+        if data is None:
+            raise Http404('Profile not found')
+        response = HttpResponse(data, content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="book-{book_id}-{profile_id}.prof"'
+        return response
+
+    @admin.display(description='Profiling hotspots')
+    def profiling_hotspots(self, obj):
+        if obj.pk is None:
+            return '-'
+        try:
+            profiles = list_profiles(obj.pk)
+        except Exception as exc:
+            return f'Profiles unavailable: {exc}'
+        if not profiles:
+            return 'No profiles captured. Use the "Profile the next pipeline run" action, then regenerate.'
+        return format_html_join('', '{}', ((self._render_profile(obj.pk, profile),) for profile in profiles))
+
+    def _render_profile(self, book_id, profile):
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (row['function'], row['calls'], f"{row['cumtime']:.3f}", f"{row['tottime']:.3f}")
+                for row in profile['hotspots']['cumulative'][:self.HOTSPOT_ROWS]
+            ),
+        )
+        url = reverse('admin:books_book_profile', args=[book_id, str(profile['_id'])])
+        return format_html(
+            '<p><strong>{}</strong> ({}) {} &middot; {}s &middot; {} &middot; {} calls &middot; '
+            '<a href="{}">download .prof</a></p>'
+            '<table><tr><th>function</th><th>calls</th><th>cumulative s</th><th>own s</th></tr>{}</table>',
+            profile['task'], profile['reason'], profile['created_at'].strftime('%Y-%m-%d %H:%M:%S'), profile['duration'],
+            profile['status'], profile['total_calls'], url, rows,
+        )
 
 
 @admin.register(BookTemplate)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        from . import checks  # noqa: F401  (registers system checks)
+        from . import signals  # noqa: F401  (catalog cache invalidation)
+        from . import metrics  # noqa: F401  (registers pipeline gauges)
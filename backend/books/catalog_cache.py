@@ -0,0 +1,81 @@
+"""
+Versioned response cache for the catalog endpoints (domains, niches,
+cover styles).
+
+The catalog changes only when an admin edits it, so responses are cached
+pre-rendered under a key that includes a catalog version. Saving or
+deleting a Domain, Niche or CoverStyle bumps the version (see
+books/signals.py), which orphans every cached body at once. Each body is
+stored with its ETag so repeat visitors get a 304 without a query.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import urlencode
+from rest_framework.renderers import JSONRenderer
+
+VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a flushed cache never revives old bodies
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def _etag_matches(header, etag):
+    return header.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+class CatalogCacheMixin:
+    """Serve list/retrieve from the versioned catalog cache.
+
+    Only JSON responses are cached; the browsable API renders normally.
+    """
+
+    def _cache_key(self, request, version):
+        query = urlencode(sorted(request.query_params.items()))
+        return f'catalog:{version}:{self.basename}:{self.action}:{self.kwargs.get("pk", "")}:{query}'
+
+    def _cached_response(self, request, build):
+        if getattr(request.accepted_renderer, 'format', None) != 'json':
+            return build()
+
+        key = self._cache_key(request, catalog_version())
+        entry = cache.get(key)
+        if entry is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            entry = (f'"{hashlib.sha256(body).hexdigest()}"', body)
+            cache.set(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+
+        etag, body = entry
+        if _etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'CATALOG_CACHE_MAX_AGE', 60)}"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,36 @@
+from django.core.checks import Warning, register, Tags
+
+
+@register(Tags.database)
+def check_mongodb_indexes(app_configs, **kwargs):
+    """Warn when the MongoDB indexes behind hot book_id lookups are missing.
+
+    Django runs database-tagged checks on every command but only passes
+    ``databases`` for ``migrate`` and ``check --database``; without it this
+    returns at once rather than wait out the MongoDB server-selection
+    timeout on ``runserver`` or ``makemigrations``.
+    """
+    if not kwargs.get('databases'):
+        return []
+
+    from backend.utils.mongodb import missing_indexes
+
+    try:
+        missing = missing_indexes()
+    except Exception as exc:
+        return [
+            Warning(
+                f"Could not verify MongoDB indexes: {exc}",
+                hint="Check MONGODB_URI and that the server is reachable.",
+                id='books.W001',
+            )
+        ]
+
+    return [
+        Warning(
+            f"MongoDB index '{name}' is missing on '{collection}'.",
+            hint="Run 'python manage.py ensure_mongo_indexes'.",
+            id='books.W002',
+        )
+        for collection, name in missing
+    ]
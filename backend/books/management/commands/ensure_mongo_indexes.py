@@ -0,0 +1,131 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from backend.utils.mongodb import (
+    MONGODB_INDEXES,
+    ensure_indexes,
+    get_mongodb_db,
+    missing_indexes,
+)
+
+
+class Command(BaseCommand):
+    help = "Create and verify the MongoDB indexes used for book_id lookups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only verify; exit non-zero if any index is missing')
+        parser.add_argument('--dedupe', action='store_true', help='Remove documents that would violate a unique index (keeps the newest) before indexing')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='DOCS',
+                            help='Time book_id lookups on a scratch collection of DOCS documents with and without the index')
+        parser.add_argument('--lookups', type=int, default=500, help='Number of lookups per benchmark pass')
+
+    def handle(self, *args, **options):
+        db = get_mongodb_db()
+
+        if options['benchmark']:
+            self._benchmark(db, options['benchmark'], options['lookups'])
+            return
+
+        if options['check']:
+            missing = missing_indexes(db)
+            for collection, name in missing:
+                self.stdout.write(self.style.ERROR(f"Missing index {collection}.{name}"))
+            if missing:
+                raise CommandError(f"{len(missing)} MongoDB index(es) missing")
+            self.stdout.write(self.style.SUCCESS("All MongoDB indexes present"))
+            return
+
+        if options['dedupe']:
+            for collection_name, specs in MONGODB_INDEXES.items():
+                for spec in specs:
+                    if not spec.get('unique'):
+                        continue
+                    fields = [field for field, _direction in spec['keys']]
+                    removed = self._dedupe(db[collection_name], fields)
+                    self.stdout.write(f"{collection_name}: removed {removed} duplicate document(s)")
+
+        try:
+            created = ensure_indexes(db)
+        except (DuplicateKeyError, OperationFailure) as exc:
+            raise CommandError(
+                f"Index creation failed: {exc}. Re-run with --dedupe to drop duplicate book_id documents."
+            )
+
+        for collection_name, names in created.items():
+            self.stdout.write(self.style.SUCCESS(f"{collection_name}: {', '.join(names)}"))
+
+        missing = missing_indexes(db)
+        if missing:
+            raise CommandError(f"Indexes still missing after creation: {missing}")
+
+    def _dedupe(self, collection, fields):
+        """Keep the newest document per unique key and delete the rest."""
+        group_key = {field: f'${field}' for field in fields}
+        pipeline = [
+            {'$sort': {'_id': -1}},
+            {'$group': {'_id': group_key, 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+        ]
+        removed = 0
+        for group in collection.aggregate(pipeline, allowDiskUse=True):
+            stale_ids = group['ids'][1:]
+            removed += collection.delete_many({'_id': {'$in': stale_ids}}).deleted_count
+        return removed
+
+    def _benchmark(self, db, doc_count, lookups):
+        """Compare find_one latency on book_id before and after indexing."""
+        collection = db['_index_benchmark_book_contents']
+        collection.drop()
+        try:
+            self.stdout.write(f"Seeding {doc_count} documents...")
+            batch = []
+            for book_id in range(1, doc_count + 1):
+                batch.append({
+                    'book_id': book_id,
+                    'interior_pdf_path': f'/media/books/book_{book_id}_interior.pdf',
+                    'final_pdf_path': f'books/book_{book_id}_final.pdf',
+                    'title': f'Benchmark Book {book_id}',
+                })
+                if len(batch) == 1000:
+                    collection.insert_many(batch)
+                    batch = []
+            if batch:
+                collection.insert_many(batch)
+
+            sample = [random.randint(1, doc_count) for _ in range(lookups)]
+
+            without_index = self._time_lookups(collection, sample)
+            collection.create_index([('book_id', ASCENDING)], unique=True)
+            with_index = self._time_lookups(collection, sample)
+        finally:
+            collection.drop()
+
+        self.stdout.write(f"Lookups per pass: {lookups}")
+        self._report('without index', without_index)
+        self._report('with index', with_index)
+        if with_index['mean_ms'] > 0:
+            speedup = without_index['mean_ms'] / with_index['mean_ms']
+            self.stdout.write(self.style.SUCCESS(f"Speedup: {speedup:.1f}x"))
+
+    def _time_lookups(self, collection, sample):
+        timings = []
+        for book_id in sample:
+            start = time.perf_counter()
+            collection.find_one({'book_id': book_id}, {'final_pdf_path': 1})
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            'mean_ms': sum(timings) / len(timings),
+            'p50_ms': timings[len(timings) // 2],
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        }
+
+    def _report(self, label, stats):
+        self.stdout.write(
+            f"  {label:<14} mean={stats['mean_ms']:.3f}ms "
+            f"p50={stats['p50_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms"
+        )
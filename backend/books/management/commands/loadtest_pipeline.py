@@ -0,0 +1,108 @@
+import io
+import json
+import logging
+import tempfile
+from contextlib import nullcontext, redirect_stdout
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.loadtest import compare_reports, run_isolated_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive simulated users through create -> content -> cover -> merge -> download "
+        "and report throughput, per-stage latency, DB lock waits and peak RSS"
+    )
+    # The run uses its own MongoDB stand-in; don't wait on the real one
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4, help='Simulated users')
+        parser.add_argument('--books-per-user', type=int, default=2, help='Books each user creates and downloads')
+        parser.add_argument('--concurrency', type=int, default=0, help='Users running at once (default: all)')
+        parser.add_argument('--book-length', default='short', choices=['short', 'standard', 'long'])
+        parser.add_argument('--cloudflare-latency-ms', type=float, default=0.0,
+                            help='Latency added to every stubbed Cloudflare call')
+        parser.add_argument('--cloudflare-url', default=None,
+                            help='Call a stand-in server (manage.py cloudflare_stand_in) instead of the stub, '
+                                 'e.g. http://127.0.0.1:8787/client/v4')
+        parser.add_argument('--output', help='Write the JSON report here (use it as a later --baseline)')
+        parser.add_argument('--baseline', help='Compare against a previous JSON report')
+        parser.add_argument('--max-regression', type=float, default=None, metavar='PCT',
+                            help='Exit non-zero if any compared metric is this many percent worse than the baseline')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+
+        # Generation logs and prints every step; keep the report readable
+        quiet = options['verbosity'] < 2
+        if quiet:
+            logging.disable(logging.WARNING)
+        try:
+            with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+                with redirect_stdout(io.StringIO()) if quiet else nullcontext():
+                    report = run_isolated_load_test(
+                        Path(workdir),
+                        users=options['users'],
+                        books_per_user=options['books_per_user'],
+                        concurrency=options['concurrency'] or None,
+                        book_length=options['book_length'],
+                        cloudflare_latency=options['cloudflare_latency_ms'] / 1000,
+                        cloudflare_url=options['cloudflare_url'],
+                    )
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self._print_report(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if baseline is not None:
+            rows = compare_reports(report, baseline, options['max_regression'])
+            self._print_comparison(rows)
+            regressed = [row[0] for row in rows if row[4]]
+            if regressed:
+                raise CommandError(f"Regressed beyond {options['max_regression']}%: {', '.join(regressed)}")
+
+    def _print_report(self, report):
+        style = self.style.SUCCESS if not report['books_failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"{report['books_completed']}/{report['books_requested']} books in {report['wall_seconds']}s "
+            f"-> {report['books_per_minute']} books/min"
+        ))
+        for error in report['errors']:
+            self.stdout.write(self.style.ERROR(f"  failure: {error}"))
+
+        self.stdout.write(f"{'stage':<24}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+        for stage, stats in report['stages'].items():
+            self.stdout.write(
+                f"{stage:<24}{stats['count']:>7}{stats['p50_ms']:>11}{stats['p95_ms']:>11}"
+                f"{stats['p99_ms']:>11}{stats['max_ms']:>11}"
+            )
+
+        for stage, stats in report.get('stage_memory', {}).items():
+            self.stdout.write(
+                f"{stage + ' RSS growth':<24}{stats['count']:>7}  p95 {stats['rss_growth_p95_mb']} MB, "
+                f"max {stats['rss_growth_max_mb']} MB"
+            )
+
+        db = report['db']
+        self.stdout.write(
+            f"DB: {db['queries']} queries in {db['query_seconds']}s, write p95 {db['write_p95_ms']} ms, "
+            f"{db['lock_waits']} lock waits, {db['lock_errors']} lock errors"
+        )
+        self.stdout.write(f"Peak RSS: {report['peak_rss_mb']} MB, Cloudflare calls: {report['cloudflare_calls']}")
+
+    def _print_comparison(self, rows):
+        self.stdout.write(f"{'metric':<36}{'baseline':>12}{'current':>12}{'worse %':>10}")
+        for key, old, new, change, regressed in rows:
+            line = f"{key:<36}{old:>12}{new:>12}{change:>10}"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
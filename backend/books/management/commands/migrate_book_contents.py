@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from bson import BSON
+
+from backend.utils.mongodb import get_mongodb_db
+from books.services.content_store import (
+    CHAPTERS_COLLECTION,
+    CONTENTS_COLLECTION,
+    SCHEMA_VERSION,
+    convert_legacy_document,
+    recompress_chapters,
+)
+from books.services.content_codec import default_codec
+
+
+class Command(BaseCommand):
+    help = "Convert legacy book_contents documents to the split header/chapters schema"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+        parser.add_argument('--limit', type=int, default=0, help='Convert at most this many documents')
+        parser.add_argument('--compress', action='store_true',
+                            help='Re-encode stored chapters with the current BOOK_CONTENT_CODEC instead of converting')
+
+    def handle(self, *args, **options):
+        db = get_mongodb_db()
+        if options['compress']:
+            self._compress(db, options)
+            return
+
+        contents = db[CONTENTS_COLLECTION]
+        legacy_filter = {'$or': [
+            {'schema_version': {'$exists': False}},
+            {'schema_version': {'$lt': SCHEMA_VERSION}},
+        ]}
+
+        cursor = contents.find(legacy_filter, no_cursor_timeout=True)
+        if options['limit']:
+            cursor = cursor.limit(options['limit'])
+
+        converted = 0
+        bytes_before = 0
+        try:
+            for document in cursor:
+                bytes_before += len(BSON.encode(document))
+                if options['dry_run']:
+                    converted += 1
+                    continue
+                if convert_legacy_document(db, document):
+                    converted += 1
+        finally:
+            cursor.close()
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{converted} legacy document(s) would be converted ({bytes_before / 1024:.1f} KiB of BSON)"
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} document(s) ({bytes_before / 1024:.1f} KiB of legacy BSON); "
+            f"chapters now in '{CHAPTERS_COLLECTION}'"
+        ))
+
+    def _compress(self, db, options):
+        codec = default_codec()
+        book_ids = db[CHAPTERS_COLLECTION].distinct('book_id', {'content_codec': {'$ne': codec}})
+        if options['limit']:
+            book_ids = book_ids[:options['limit']]
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(book_ids)} book(s) would be re-encoded with {codec}")
+            return
+
+        raw_total = stored_total = 0
+        for book_id in book_ids:
+            summary = recompress_chapters(db, book_id)
+            if summary:
+                raw_total += summary['raw_bytes']
+                stored_total += summary['stored_bytes']
+        ratio = raw_total / stored_total if stored_total else 1.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-encoded {len(book_ids)} book(s) with {codec}: {raw_total} -> {stored_total} bytes ({ratio:.2f}x)"
+        ))
@@ -0,0 +1,87 @@
+import fnmatch
+import io
+import json
+import logging
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.cases import all_cases
+from benchmarks.runner import compare, load_baseline, measure, save_baseline
+
+
+class Command(BaseCommand):
+    help = "Time the hot text and layout functions on fixed corpora and compare against a baseline"
+    # Pure CPU work on synthetic input; nothing to check
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', default='*', help='Glob on case names, e.g. "pdf.*"')
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--repeats', type=int, default=7)
+        parser.add_argument('--min-time', type=float, default=0.05,
+                            help='Minimum seconds per sample; fast cases are looped to reach it')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline')
+        parser.add_argument('--threshold', type=float, default=15.0,
+                            help='Percent slowdown of the median that counts as a regression')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        cases = [(name, setup) for name, setup in all_cases() if fnmatch.fnmatch(name, options['filter'])]
+        if not cases:
+            raise CommandError(f"No benchmark matches {options['filter']!r}")
+
+        results = []
+        if not options['json']:
+            self.stdout.write(f"{'case':<48}{'median us':>14}{'min us':>14}{'stdev us':>12}")
+        # Generation code logs and prints liberally; keep it out of the timings
+        logging.disable(logging.CRITICAL)
+        try:
+            for name, setup in cases:
+                with redirect_stdout(io.StringIO()):
+                    func = setup()
+                    result = measure(name, func, options['warmup'], options['repeats'], options['min_time'])
+                results.append(result)
+                if not options['json']:
+                    self.stdout.write(
+                        f"{name:<48}{result.median_us:>14.1f}{result.min_us:>14.1f}{result.stdev_us:>12.1f}"
+                    )
+        finally:
+            logging.disable(logging.NOTSET)
+
+        baseline_path = Path(options['baseline'])
+        rows = []
+        if options['save_baseline']:
+            save_baseline(baseline_path, results)
+        elif baseline_path.exists():
+            try:
+                rows = compare(results, load_baseline(baseline_path), options['threshold'])
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read baseline {baseline_path}: {exc}")
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': [asdict(r) for r in results], 'comparison': rows}, indent=2))
+        else:
+            self._print_comparison(rows)
+            if options['save_baseline']:
+                self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+
+        regressed = [row['name'] for row in rows if row['regressed']]
+        if regressed:
+            raise CommandError(f"Slower than baseline by more than {options['threshold']}%: {', '.join(regressed)}")
+
+    def _print_comparison(self, rows):
+        if not rows:
+            return
+        self.stdout.write('')
+        self.stdout.write(f"{'case':<48}{'baseline us':>14}{'current us':>14}{'slower %':>12}")
+        for row in rows:
+            if row['change_pct'] is None:
+                line = f"{row['name']:<48}{'-':>14}{row['current_us']:>14.1f}{'new':>12}"
+            else:
+                line = f"{row['name']:<48}{row['baseline_us']:>14.1f}{row['current_us']:>14.1f}{row['change_pct']:>12}"
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
@@ -0,0 +1,163 @@
+"""
+Book pipeline metrics (exposed at /metrics/, see backend/utils/metrics.py)
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+
+from backend.utils.memory import MiB, StageMemory, current_rss_bytes, peak_rss_bytes
+from backend.utils.metrics import REGISTRY, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Statuses a book passes through before it is ready or failed
+IN_FLIGHT_STATUSES = ('generating', 'content_generated', 'cover_pending')
+
+STAGE_SECONDS = Histogram(
+    'book_stage_seconds',
+    'Duration of a book pipeline stage',
+    ['stage'],
+)
+GENERATION_SECONDS = Histogram(
+    'book_generation_seconds',
+    'Wall time from content generation start to a downloadable book',
+    buckets=(30, 60, 120, 300, 600, 900, 1800, 3600),
+)
+QUALITY_ATTEMPTS = Histogram(
+    'book_chapter_quality_attempts',
+    'Generation attempts per chapter before the quality gate passed or gave up',
+    buckets=(1, 2, 3, 4),
+)
+MONGO_SECONDS = Histogram(
+    'book_mongo_seconds',
+    'Duration of book content store operations',
+    ['operation'],
+)
+TASK_RETRIES = Counter(
+    'book_task_retries_total',
+    'Pipeline task retries scheduled',
+    ['task'],
+)
+TASK_FAILURES = Counter(
+    'book_task_failures_total',
+    'Pipeline task runs that ended in an error',
+    ['task'],
+)
+MEMORY_BUCKETS = tuple(size * MiB for size in (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 4000))
+STAGE_RSS_GROWTH_BYTES = Histogram(
+    'book_stage_rss_growth_bytes',
+    'Resident memory a pipeline stage added to its process',
+    ['stage'],
+    buckets=MEMORY_BUCKETS,
+)
+STAGE_ALLOC_PEAK_BYTES = Histogram(
+    'book_stage_alloc_peak_bytes',
+    'Peak Python allocations during a pipeline stage (only with TRACEMALLOC_STAGES)',
+    ['stage'],
+    buckets=MEMORY_BUCKETS,
+)
+WORKER_RSS_BYTES = Histogram(
+    'book_worker_rss_bytes',
+    'Worker resident memory after each task',
+    ['task'],
+    buckets=MEMORY_BUCKETS,
+)
+WORKER_RECYCLES = Counter(
+    'book_worker_recycles_total',
+    'Worker children retired for going over WORKER_MEMORY_BUDGET_MB',
+)
+CLOUDFLARE_SECONDS = Histogram(
+    'cloudflare_request_seconds',
+    'Cloudflare Workers AI request latency, retries included',
+    ['operation', 'outcome'],
+)
+CLOUDFLARE_RETRIES = Counter(
+    'cloudflare_request_retries_total',
+    'Cloudflare Workers AI requests retried, by status code or connection error',
+    ['reason'],
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'outbound_rate_limit_wait_seconds',
+    'Time an outbound model call waited for a rate-limit token and concurrency slot',
+    ['provider', 'model'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    'outbound_rate_limit_rejections_total',
+    'Outbound model calls refused by the rate limiter (fail_fast or timeout)',
+    ['provider', 'model', 'reason'],
+)
+RATE_LIMIT_LOCAL_FALLBACKS = Counter(
+    'outbound_rate_limit_local_fallbacks_total',
+    'Limiter decisions made per process because Redis was unreachable',
+)
+LLM_CACHE_LOOKUPS = Counter(
+    'llm_cache_lookups_total',
+    'Model calls looked up in the response cache, by hit, miss or bypass',
+    ['operation', 'result'],
+)
+LLM_CACHE_BYTES_SAVED = Counter(
+    'llm_cache_bytes_saved_total',
+    'Response bytes served from the response cache instead of Cloudflare',
+    ['operation'],
+)
+OUTLINE_CACHE_LOOKUPS = Counter(
+    'outline_cache_lookups_total',
+    'Outline lookups in the shared outline cache, by hit, miss, disabled or error',
+    ['source', 'result'],
+)
+LLM_FALLBACKS = Counter(
+    'book_llm_fallbacks_total',
+    'Local LLM generations served by the untrained-domain fallback',
+    ['kind', 'domain'],
+)
+
+
+@contextmanager
+def track_stage(stage):
+    """Time a pipeline stage and account the memory it took."""
+    memory = StageMemory()
+    with STAGE_SECONDS.time(stage=stage):
+        try:
+            with memory:
+                yield
+        finally:
+            STAGE_RSS_GROWTH_BYTES.observe(memory.rss_growth, stage=stage)
+            if memory.alloc_peak is not None:
+                STAGE_ALLOC_PEAK_BYTES.observe(memory.alloc_peak, stage=stage)
+
+
+def record_worker_memory(task_name):
+    """
+    Called after every task. Celery retires the child itself once its peak
+    RSS passes worker_max_memory_per_child; this records why it happened.
+    """
+    WORKER_RSS_BYTES.observe(current_rss_bytes(), task=task_name)
+    budget = getattr(settings, 'WORKER_MEMORY_BUDGET_MB', 0)
+    peak = peak_rss_bytes()
+    if budget and peak > budget * MiB:
+        WORKER_RECYCLES.inc()
+        logger.warning(
+            f"Worker {os.getpid()} peaked at {peak // MiB} MB after {task_name}, "
+            f"over the {budget} MB budget; recycling the process"
+        )
+
+
+def _books_in_flight():
+    from .models import Book
+
+    counts = dict(
+        Book.objects.filter(status__in=IN_FLIGHT_STATUSES)
+        .order_by()
+        .values_list('status')
+        .annotate(total=Count('id'))
+    )
+    for status in IN_FLIGHT_STATUSES:
+        yield {'status': status}, counts.get(status, 0)
+
+
+REGISTRY.register_gauge('book_pipeline_books', 'Books currently in each pipeline stage', _books_in_flight)
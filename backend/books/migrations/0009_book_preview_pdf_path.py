@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_update_guided_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='preview_pdf_path',
+            field=models.CharField(blank=True, default='', help_text='Preview PDF published once the first chapter passes quality checks', max_length=255),
+        ),
+    ]
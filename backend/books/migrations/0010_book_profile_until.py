@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_preview_pdf_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='profile_until',
+            field=models.DateTimeField(blank=True, help_text="Profile this book's pipeline tasks until this time", null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_book_profile_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='preview_pdf_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -274,6 +274,24 @@ class Book(models.Model):
     
     # MongoDB reference for content
     mongodb_id = models.CharField(max_length=100, blank=True, null=True)
+
+    # Early interior preview (title page, contents, first chapter), relative to MEDIA_ROOT
+    preview_pdf_path = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Preview PDF published once the first chapter passes quality checks"
+    )
+    # ETag of the current preview; the file is replaced in place
+    preview_pdf_sha256 = models.CharField(max_length=64, blank=True, default='')
+
+    # Set by the "Profile the next pipeline run" admin action; stored on the
+    # row so every worker process sees it
+    profile_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Profile this book's pipeline tasks until this time"
+    )
     
     # SaaS Features
     subscription_plan = models.ForeignKey(
@@ -352,7 +370,14 @@ class Book(models.Model):
     
     @property
     def selected_cover(self):
-        """Get the selected cover for this book"""
+        """Get the selected cover for this book.
+
+        Uses prefetched covers when the queryset did
+        ``prefetch_related('covers')`` instead of issuing a query.
+        """
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('covers')
+        if prefetched is not None:
+            return next((cover for cover in prefetched if cover.is_selected), None)
         return self.covers.filter(is_selected=True).first()
     
     @property
@@ -417,6 +442,7 @@ class Book(models.Model):
     
     def record_download(self, request):
         """Record a download with analytics"""
+        from users import analytics
         from users.models import DownloadHistory
         
         download = DownloadHistory.objects.create(
@@ -426,9 +452,8 @@ class Book(models.Model):
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
         )
         
-        # Update user's download count
-        if hasattr(self.user, 'profile'):
-            self.user.profile.increment_book_usage()
+        # Quota is charged at creation (users.quota.consume_book), not here
+        analytics.record_download(self.user_id)
         
         return download
     
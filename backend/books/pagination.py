@@ -0,0 +1,14 @@
+# books/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class BookCursorPagination(CursorPagination):
+    """Stable keyset pagination for a user's books, newest first.
+
+    Cursor pages stay cheap on deep pages (no OFFSET) and do not skip or
+    repeat books when new ones are created while the user is paging.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -2,8 +2,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
 from .models import Book, BookTemplate, Domain, Niche, CoverStyle
 from covers.models import Cover
+from users.analytics import record_book_created
+from users.quota import consume_book, release_book
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -85,7 +88,17 @@ class CoverSerializer(serializers.ModelSerializer):
         return f"{settings.MEDIA_URL}{obj.image_path}"
 
 
-class BookSerializer(serializers.ModelSerializer):
+class PreviewUrlMixin(serializers.Serializer):
+    preview_url = serializers.SerializerMethodField()
+
+    def get_preview_url(self, obj):
+        """Get preview URL once the first chapter has been published"""
+        if obj.preview_pdf_path:
+            return f"/api/books/{obj.id}/preview/"
+        return None
+
+
+class BookSerializer(PreviewUrlMixin, serializers.ModelSerializer):
     covers = CoverSerializer(many=True, read_only=True)
     selected_cover = serializers.SerializerMethodField()
     can_download = serializers.SerializerMethodField()
@@ -104,7 +117,8 @@ class BookSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_username', 'title', 'domain', 'domain_name', 'niche', 'niche_name', 
                   'book_length', 'cover_style', 'cover_style_name',
                   'status', 'created_at', 'updated_at', 'completed_at', 'content_generated_at',
-                  'covers', 'selected_cover', 'can_download', 'download_url', 'page_length', 'quality_score',
+                  'covers', 'selected_cover', 'can_download', 'download_url', 'preview_url', 'page_length',
+                  'quality_score',
                   'error_message', 'mongodb_id', 'progress_percentage', 'current_step']
         read_only_fields = ['id', 'title', 'status', 'created_at', 
                            'updated_at', 'completed_at', 'content_generated_at', 'error_message', 'mongodb_id']
@@ -194,11 +208,22 @@ class BookCreateSerializer(serializers.ModelSerializer):
         book_fields = ['domain', 'niche', 'cover_style', 'book_length']
         book_data = {field: validated_data[field] for field in book_fields if field in validated_data}
 
-        book = Book.objects.create(
-            user=self.context['request'].user,
-            title="Generating...",
-            **book_data
-        )
+        user = self.context['request'].user
+        # Take the quota slot first: a single conditional UPDATE, so
+        # concurrent creates cannot both slip under the limit
+        if not consume_book(user):
+            raise PermissionDenied({'error': 'Monthly book limit reached for your plan.'})
+
+        try:
+            book = Book.objects.create(
+                user=user,
+                title="Generating...",
+                **book_data
+            )
+        except Exception:
+            release_book(user)
+            raise
+        record_book_created(book)
 
         niche = book.niche
         generation_params = {
@@ -222,12 +247,12 @@ class BookCreateSerializer(serializers.ModelSerializer):
         return book
 
 
-class BookStatusSerializer(serializers.ModelSerializer):
+class BookStatusSerializer(PreviewUrlMixin, serializers.ModelSerializer):
     progress_percentage = serializers.SerializerMethodField()
     
     class Meta:
         model = Book
-        fields = ['id', 'status', 'progress_percentage', 'error_message', 'created_at', 'updated_at']
+        fields = ['id', 'status', 'progress_percentage', 'preview_url', 'error_message', 'created_at', 'updated_at']
     
     def get_progress_percentage(self, obj):
         status_progress = {
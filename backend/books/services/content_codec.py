@@ -0,0 +1,98 @@
+"""
+Compression codec for chapter text stored in MongoDB
+
+Chapter bodies are stored as ``bson.Binary`` with a codec tag next to
+them so readers know how to decode. zstd is used when the optional
+``zstandard`` package is installed, zlib (stdlib) otherwise. Short texts
+are stored as plain strings: compressing them costs more than it saves.
+"""
+
+import zlib
+from typing import Tuple, Union
+
+from bson.binary import Binary
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# Below this many UTF-8 bytes text is stored uncompressed
+MIN_COMPRESS_BYTES = 256
+
+
+class CodecError(Exception):
+    """Raised when stored content cannot be decoded."""
+
+
+def available_codecs():
+    codecs = [CODEC_NONE, CODEC_ZLIB]
+    if zstandard is not None:
+        codecs.append(CODEC_ZSTD)
+    return codecs
+
+
+def default_codec() -> str:
+    """Codec for new writes, from ``settings.BOOK_CONTENT_CODEC``.
+
+    ``auto`` picks zstd when available and falls back to zlib.
+    """
+    codec = getattr(settings, 'BOOK_CONTENT_CODEC', 'auto')
+    if codec == 'auto':
+        return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+    if codec not in available_codecs():
+        raise CodecError(f"Unsupported BOOK_CONTENT_CODEC '{codec}' (available: {available_codecs()})")
+    return codec
+
+
+def encode_text(text: str, codec: str = None) -> Tuple[str, Union[str, Binary], int, int]:
+    """Compress ``text``.
+
+    Returns ``(codec, payload, raw_size, stored_size)`` where the sizes are
+    in bytes. ``payload`` is the original string when the codec is ``none``.
+    """
+    text = text or ''
+    raw = text.encode('utf-8')
+    codec = codec or default_codec()
+
+    if codec == CODEC_NONE or len(raw) < MIN_COMPRESS_BYTES:
+        return CODEC_NONE, text, len(raw), len(raw)
+
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise CodecError("zstd requested but the zstandard package is not installed")
+        # Compressor objects are not thread-safe; they are cheap to build
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    elif codec == CODEC_ZLIB:
+        data = zlib.compress(raw, ZLIB_LEVEL)
+    else:
+        raise CodecError(f"Unknown codec '{codec}'")
+
+    if len(data) >= len(raw):
+        return CODEC_NONE, text, len(raw), len(raw)
+    return codec, Binary(data), len(raw), len(data)
+
+
+def decode_text(codec: str, payload: Union[str, bytes, None]) -> str:
+    """Inverse of :func:`encode_text`. A missing codec means plain text."""
+    if payload is None:
+        return ''
+    if not codec or codec == CODEC_NONE:
+        return payload if isinstance(payload, str) else bytes(payload).decode('utf-8')
+
+    data = bytes(payload)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise CodecError("Content is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise CodecError(f"Unknown codec '{codec}'")
@@ -0,0 +1,276 @@
+"""
+Book content storage in MongoDB
+
+Schema (version 2):
+- ``book_contents``: one small header document per book holding the file
+  paths, title, outline and compact metadata. Every hot path (download,
+  final-PDF merge) reads it with a projection.
+- ``book_chapters``: one document per chapter holding the chapter body.
+  Chapter text is stored exactly once, compressed (see
+  ``content_codec``), and is only read and decompressed when an interior
+  PDF has to be regenerated.
+
+Version 1 documents (chapters embedded twice, under ``chapters`` and
+``content``) are still readable; ``manage.py migrate_book_contents``
+converts them in place.
+"""
+
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.utils import timezone
+from pymongo import ReplaceOne, ReturnDocument
+
+from backend.utils.mongodb import get_mongodb_db
+from books.metrics import MONGO_SECONDS
+from books.services.content_codec import decode_text, encode_text
+
+logger = logging.getLogger(__name__)
+
+CONTENTS_COLLECTION = 'book_contents'
+CHAPTERS_COLLECTION = 'book_chapters'
+# Written by books/services/profiling.py; removed with the book's content
+PROFILES_COLLECTION = 'book_profiles'
+SCHEMA_VERSION = 2
+
+# Header fields that are cheap to read and safe to project on hot paths
+PATH_FIELDS = ('interior_pdf_path', 'final_pdf_path')
+
+
+def _compact_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop per-section ``clean_text`` copies from the quality summary."""
+    metadata = dict(metadata or {})
+    quality = metadata.get('quality')
+    if isinstance(quality, dict) and quality.get('sections'):
+        metadata['quality'] = {
+            **quality,
+            'sections': [
+                {k: v for k, v in section.items() if k != 'clean_text'}
+                for section in quality['sections']
+            ],
+        }
+    return metadata
+
+
+class LazyChapter(Mapping):
+    """Read-only chapter dict that decompresses ``content`` on first access."""
+
+    def __init__(self, document: Dict[str, Any]):
+        self._document = document
+        self._content = None
+
+    def __getitem__(self, key):
+        if key == 'content':
+            if self._content is None:
+                self._content = decode_text(
+                    self._document.get('content_codec'), self._document.get('content')
+                )
+            return self._content
+        return self._document[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._document)
+
+    def __len__(self) -> int:
+        return len(self._document)
+
+    def __repr__(self):
+        return f"LazyChapter(number={self._document.get('number')!r}, title={self._document.get('title')!r})"
+
+
+def _chapter_documents(book_id: int, chapters: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    documents = []
+    for index, chapter in enumerate(chapters, 1):
+        codec, payload, raw_size, stored_size = encode_text(chapter.get('content', ''))
+        documents.append({
+            'book_id': book_id,
+            'number': chapter.get('number') or index,
+            'title': chapter.get('title', ''),
+            'content': payload,
+            'content_codec': codec,
+            'raw_size': raw_size,
+            'stored_size': stored_size,
+            'word_count': chapter.get('word_count', 0),
+            'niche_stage': chapter.get('niche_stage'),
+        })
+    return documents
+
+
+def _compression_summary(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    raw = sum(doc['raw_size'] for doc in documents)
+    stored = sum(doc['stored_size'] for doc in documents)
+    codecs = sorted({doc['content_codec'] for doc in documents})
+    return {
+        'codecs': codecs,
+        'raw_bytes': raw,
+        'stored_bytes': stored,
+        'ratio': round(raw / stored, 2) if stored else 1.0,
+    }
+
+
+def _write_chapters(db, book_id: int, chapters: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replace the book's chapter documents; returns a compression summary."""
+    documents = _chapter_documents(book_id, chapters)
+    collection = db[CHAPTERS_COLLECTION]
+    if documents:
+        collection.bulk_write(
+            [
+                ReplaceOne({'book_id': book_id, 'number': doc['number']}, doc, upsert=True)
+                for doc in documents
+            ],
+            ordered=False,
+        )
+    # Drop chapters left over from a longer previous generation
+    collection.delete_many({
+        'book_id': book_id,
+        'number': {'$nin': [doc['number'] for doc in documents]},
+    })
+    summary = _compression_summary(documents)
+    summary['chapter_count'] = len(documents)
+    return summary
+
+
+@MONGO_SECONDS.time(operation='save')
+def save_book_content(book_id: int, content_data: Dict[str, Any],
+                      interior_pdf_path: Optional[str] = None, **extra: Any) -> str:
+    """Store a generated book and return the header document id.
+
+    ``extra`` fields are stored on the header as-is.
+    """
+    db = get_mongodb_db()
+
+    # Chapters first so a header never points at missing bodies
+    summary = _write_chapters(db, book_id, content_data.get('chapters', []))
+    chapter_count = summary.pop('chapter_count')
+    logger.info(
+        f"Stored {chapter_count} chapters for book {book_id}: "
+        f"{summary['raw_bytes']} -> {summary['stored_bytes']} bytes ({summary['ratio']}x, {'/'.join(summary['codecs']) or 'none'})"
+    )
+
+    header = {
+        'book_id': book_id,
+        'schema_version': SCHEMA_VERSION,
+        'title': content_data.get('title'),
+        'outline': content_data.get('outline', {}),
+        'metadata': _compact_metadata(content_data.get('metadata', {})),
+        'chapter_count': chapter_count,
+        'compression': summary,
+        'interior_pdf_path': interior_pdf_path,
+        'created_at': timezone.now().isoformat(),
+        **extra,
+    }
+    saved = db[CONTENTS_COLLECTION].find_one_and_replace(
+        {'book_id': book_id},
+        header,
+        projection={'_id': 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return str(saved['_id'])
+
+
+@MONGO_SECONDS.time(operation='get_fields')
+def get_content_fields(book_id: int, *fields: str) -> Optional[Dict[str, Any]]:
+    """Projected read of header fields, e.g. ``get_content_fields(1, 'final_pdf_path')``.
+
+    Returns None when the book has no content document.
+    """
+    projection = {field: 1 for field in fields}
+    projection['_id'] = 0
+    return get_mongodb_db()[CONTENTS_COLLECTION].find_one({'book_id': book_id}, projection)
+
+
+@MONGO_SECONDS.time(operation='update_fields')
+def update_content_fields(book_id: int, **fields: Any) -> None:
+    """Set header fields such as ``final_pdf_path``."""
+    get_mongodb_db()[CONTENTS_COLLECTION].update_one({'book_id': book_id}, {'$set': fields})
+
+
+@MONGO_SECONDS.time(operation='load')
+def load_content_data(book_id: int) -> Optional[Dict[str, Any]]:
+    """Reassemble the full ``content_data`` dict used to render an interior PDF."""
+    db = get_mongodb_db()
+    header = db[CONTENTS_COLLECTION].find_one(
+        {'book_id': book_id},
+        {'_id': 0, 'schema_version': 1, 'title': 1, 'outline': 1, 'metadata': 1, 'content': 1},
+    )
+    if not header:
+        return None
+
+    if header.get('schema_version', 1) < SCHEMA_VERSION:
+        # Legacy document: the full content dict is embedded
+        return header.get('content') or None
+
+    chapters = [
+        LazyChapter(document)
+        for document in db[CHAPTERS_COLLECTION]
+        .find({'book_id': book_id}, {'_id': 0, 'book_id': 0})
+        .sort('number', 1)
+    ]
+    return {
+        'title': header.get('title'),
+        'outline': header.get('outline', {}),
+        'chapters': chapters,
+        'metadata': header.get('metadata', {}),
+    }
+
+
+@MONGO_SECONDS.time(operation='delete')
+def delete_book_content(book_id: int) -> None:
+    db = get_mongodb_db()
+    db[CHAPTERS_COLLECTION].delete_many({'book_id': book_id})
+    db[CONTENTS_COLLECTION].delete_one({'book_id': book_id})
+    db[PROFILES_COLLECTION].delete_many({'book_id': book_id})
+
+
+def convert_legacy_document(db, document: Dict[str, Any]) -> bool:
+    """Convert one version 1 ``book_contents`` document to version 2.
+
+    Returns False when there was nothing to convert.
+    """
+    if document.get('schema_version', 1) >= SCHEMA_VERSION:
+        return False
+
+    book_id = document['book_id']
+    embedded = document.get('content') if isinstance(document.get('content'), dict) else {}
+    chapters = document.get('chapters') or embedded.get('chapters') or []
+    metadata = document.get('metadata') or embedded.get('metadata') or {}
+
+    summary = _write_chapters(db, book_id, chapters)
+    chapter_count = summary.pop('chapter_count')
+
+    update = {
+        '$set': {
+            'schema_version': SCHEMA_VERSION,
+            'title': document.get('title') or embedded.get('title'),
+            'outline': document.get('outline') or embedded.get('outline') or {},
+            'metadata': _compact_metadata(metadata),
+            'chapter_count': chapter_count,
+            'compression': summary,
+        },
+        '$unset': {'chapters': '', 'content': ''},
+    }
+    if not document.get('interior_pdf_path') and document.get('pdf_path'):
+        update['$set']['interior_pdf_path'] = document['pdf_path']
+        update['$unset']['pdf_path'] = ''
+
+    db[CONTENTS_COLLECTION].update_one({'_id': document['_id']}, update)
+    return True
+
+
+def recompress_chapters(db, book_id: int) -> Optional[Dict[str, Any]]:
+    """Re-encode a book's chapters with the current default codec.
+
+    Returns the new compression summary, or None if the book has no chapters.
+    """
+    stored = [
+        LazyChapter(document)
+        for document in db[CHAPTERS_COLLECTION].find({'book_id': book_id}, {'_id': 0}).sort('number', 1)
+    ]
+    if not stored:
+        return None
+    summary = _write_chapters(db, book_id, [dict(chapter) for chapter in stored])
+    summary.pop('chapter_count')
+    db[CONTENTS_COLLECTION].update_one({'book_id': book_id}, {'$set': {'compression': summary}})
+    return summary
@@ -5,17 +5,27 @@ Unlimited generation for AI & Automation, Parenting, E-commerce domains
 """
 
 import logging
+import os
+import time
 from typing import Dict, Any, List, Optional, Set
-from django.utils import timezone
+from django.conf import settings
 from pathlib import Path
 
 from customllm.services.custom_book_generator import CustomBookGenerator
 from books.services.pdf_generator_pro import ProfessionalPDFGenerator
+from backend.utils.downloads import artifact_fingerprint
 from backend.utils.mongodb import get_mongodb_db
+from books.services.content_store import save_book_content
 from books.services.quality import evaluate_section, evaluate_book
+from books.metrics import QUALITY_ATTEMPTS, track_stage
+from books.models import Book
 
 logger = logging.getLogger(__name__)
 
+# Seconds between "Writing chapter i/n, section k" progress writes; the
+# local engine streams sections far faster than anyone polls for them
+PROGRESS_WRITE_INTERVAL = 2.0
+
 
 class CustomLLMBookGenerator:
     """
@@ -102,7 +112,8 @@ class CustomLLMBookGenerator:
             book.progress_percentage = 20
             book.save()
             
-            outline_result = self.custom_llm.generate_book_outline(book_context)
+            with track_stage('outline'):
+                outline_result = self.custom_llm.generate_book_outline(book_context)
             outline = outline_result['outline']
             chapters_list = outline.get('chapters', [])
 
@@ -118,6 +129,7 @@ class CustomLLMBookGenerator:
             # Step 2: Generate chapters with quality gating and anti-repetition
             logger.info(f"✍️ Step 2/3: Generating {len(chapters_list)} chapters...")
             chapters_content = []
+            preview_attempted = False
             
             for i, chapter_info in enumerate(chapters_list, 1):
                 progress = 30 + (i * 40 // len(chapters_list))  # 30-70%
@@ -127,36 +139,50 @@ class CustomLLMBookGenerator:
                 
                 logger.info(f"   Chapter {i}/{len(chapters_list)}: {chapter_info['title']}")
                 
-                # Phase 2a: derive concrete subtopics for structure
-                subtopics = self.custom_llm.llm.generate_chapter_subtopics(
-                    chapter_title=chapter_info['title'],
-                    book_context=book_context,
-                    count=4
-                )
-
-                # Attempt generation with up to 2 quality retries
-                attempts = 0
-                best = None
-                target_words = self._calculate_chapter_word_count(book_length)
-                while attempts < 2:
-                    attempts += 1
-                    chapter_result = self.custom_llm.generate_chapter(
+                with track_stage('chapter'):
+                    # Phase 2a: derive concrete subtopics for structure
+                    subtopics = self.custom_llm.llm.generate_chapter_subtopics(
                         chapter_title=chapter_info['title'],
-                        chapter_outline=chapter_info.get('summary', ''),
                         book_context=book_context,
-                        word_count=target_words,
-                        subtopics=subtopics
+                        count=4
                     )
-                    diag = evaluate_section(chapter_result['content'])
-                    logger.info(f"      Quality attempt {attempts}: score={diag['score']} grade={diag['readability_grade']} dup={diag['duplicate_ratio']}")
-                    # Keep best
-                    if not best or diag['score'] > best['diag']['score']:
-                        best = {'result': chapter_result, 'diag': diag}
-                    # Accept if >= 80 and structured
-                    if diag['score'] >= 80 and diag['has_min_structure']:
-                        break
-                    # Otherwise try once more with higher word target to improve structure
-                    target_words = int(target_words * 1.15)
+
+                    # Attempt generation with up to 2 quality retries
+                    attempts = 0
+                    best = None
+                    target_words = self._calculate_chapter_word_count(book_length)
+                    while attempts < 2:
+                        attempts += 1
+                        # Subsections arrive as they are written; report them,
+                        # at most once per PROGRESS_WRITE_INTERVAL
+                        pieces = []
+                        last_write = time.monotonic()
+                        for piece in self.custom_llm.stream_chapter(
+                            chapter_title=chapter_info['title'],
+                            chapter_outline=chapter_info.get('summary', ''),
+                            book_context=book_context,
+                            word_count=target_words,
+                            subtopics=subtopics
+                        ):
+                            pieces.append(piece)
+                            if time.monotonic() - last_write < PROGRESS_WRITE_INTERVAL:
+                                continue
+                            last_write = time.monotonic()
+                            Book.objects.filter(pk=book.pk).update(
+                                current_step=f'Writing chapter {i}/{len(chapters_list)}, section {len(pieces)}'
+                            )
+                        content = ''.join(pieces)
+                        chapter_result = {'content': content, 'word_count': len(content.split())}
+                        diag = evaluate_section(chapter_result['content'])
+                        logger.info(f"      Quality attempt {attempts}: score={diag['score']} grade={diag['readability_grade']} dup={diag['duplicate_ratio']}")
+                        # Keep best
+                        if not best or diag['score'] > best['diag']['score']:
+                            best = {'result': chapter_result, 'diag': diag}
+                        if self._passes_quality_gate(diag):
+                            break
+                        # Otherwise try once more with higher word target to improve structure
+                        target_words = int(target_words * 1.15)
+                QUALITY_ATTEMPTS.observe(attempts)
 
                 final_text = best['diag']['clean_text']
 
@@ -167,6 +193,12 @@ class CustomLLMBookGenerator:
                     'word_count': best['result']['word_count'],
                     'niche_stage': chapter_info.get('niche_stage'),
                 })
+
+                # Readers get the opening of the book once a chapter passes
+                # the quality gate (normally the first), not after the whole run
+                if not preview_attempted and self._passes_quality_gate(best['diag']):
+                    preview_attempted = True
+                    self.publish_preview(book, outline, chapters_content)
             
             logger.info(f"✅ All {len(chapters_content)} chapters generated")
             
@@ -207,6 +239,7 @@ class CustomLLMBookGenerator:
                     'total_words': sum(ch['word_count'] for ch in chapters_content),
                     'generated_with': 'custom_local_llm',
                     'generation_time': outline_result['metadata']['elapsed_time'],
+                    'outline_cache': outline_result['metadata'].get('outline_cache'),
                     'api_calls_used': 0,  # Zero external API calls for text!
                     'quality': quality_summary
                 }
@@ -367,11 +400,12 @@ class CustomLLMBookGenerator:
             output_path = str(books_dir / f'book_{book.id}_interior.pdf')
             
             # Use professional PDF generator
-            self.pdf_generator.create_book_pdf(
-                book=book,
-                content_data=content_data,
-                output_path=output_path
-            )
+            with track_stage('pdf_render'):
+                self.pdf_generator.create_book_pdf(
+                    book=book,
+                    content_data=content_data,
+                    output_path=output_path
+                )
             
             logger.info(f"✅ PDF created: {output_path}")
             
@@ -381,6 +415,54 @@ class CustomLLMBookGenerator:
             logger.error(f"❌ PDF creation failed: {str(e)}")
             raise
     
+    @staticmethod
+    def _passes_quality_gate(diag: Dict[str, Any]) -> bool:
+        """Accept a chapter at score >= 80 with the minimum structure."""
+        return diag['score'] >= 80 and diag['has_min_structure']
+    
+    def publish_preview(self, book, outline: Dict[str, Any], chapters_content: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Render the title page, table of contents and the chapters written so
+        far, and record the PDF on ``book.preview_pdf_path``
+        
+        The file is replaced atomically so a reader downloading an earlier
+        preview never gets a partial one. A failed preview is logged and
+        never fails generation.
+        
+        Returns:
+            Preview path relative to MEDIA_ROOT, or None
+        """
+        try:
+            books_dir = Path(settings.MEDIA_ROOT) / 'books'
+            books_dir.mkdir(parents=True, exist_ok=True)
+            relative_path = f'books/book_{book.id}_preview.pdf'
+            output_path = Path(settings.MEDIA_ROOT) / relative_path
+            partial_path = output_path.with_suffix('.pdf.partial')
+            
+            # The generated title replaces the placeholder now instead of after the last chapter
+            if outline.get('title'):
+                book.title = outline['title']
+            
+            with track_stage('preview_pdf'):
+                self.pdf_generator.create_preview_pdf(
+                    book=book,
+                    content_data={'title': book.title, 'outline': outline, 'chapters': chapters_content},
+                    output_path=str(partial_path)
+                )
+            # Hashed before the swap so the ETag never outlives its file
+            fingerprint = artifact_fingerprint(partial_path)
+            os.replace(partial_path, output_path)
+            
+            book.preview_pdf_path = relative_path
+            book.preview_pdf_sha256 = fingerprint['sha256']
+            book.save(update_fields=['title', 'preview_pdf_path', 'preview_pdf_sha256', 'updated_at'])
+            logger.info(f"👀 Preview published: {relative_path}")
+            return relative_path
+            
+        except Exception as e:
+            logger.warning(f"⚠️ Preview PDF failed for book {book.id}: {str(e)}")
+            return None
+    
     def save_to_mongodb(self, book_id: int, content_data: Dict[str, Any], pdf_path: str) -> str:
         """
         Save book content to MongoDB
@@ -396,25 +478,13 @@ class CustomLLMBookGenerator:
         try:
             logger.info("💾 Saving content to MongoDB...")
             
-            db = get_mongodb_db()
-            collection = db['book_contents']
-            
-            document = {
-                'book_id': book_id,
-                'title': content_data['title'],
-                'outline': content_data['outline'],
-                'chapters': content_data['chapters'],
-                'metadata': content_data['metadata'],
-                'interior_pdf_path': pdf_path,  # Changed from 'pdf_path' to 'interior_pdf_path'
-                'content': content_data,  # Also save full content for regeneration
-                'created_at': timezone.now().isoformat()
-            }
-            
-            result = collection.insert_one(document)
+            # Chapters go to their own collection; the book_contents
+            # header stays small enough to read on every download.
+            mongodb_id = save_book_content(book_id, content_data, pdf_path)
             
-            logger.info(f"✅ Content saved to MongoDB: {result.inserted_id}")
+            logger.info(f"✅ Content saved to MongoDB: {mongodb_id}")
             
-            return str(result.inserted_id)
+            return mongodb_id
             
         except Exception as e:
             logger.error(f"❌ MongoDB save failed: {str(e)}")
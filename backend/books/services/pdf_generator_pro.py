@@ -413,6 +413,26 @@ class ProfessionalPDFGenerator:
         doc.multiBuild(story)
         return output_path
 
+    def create_preview_pdf(self, book, content_data: Dict, output_path: str):
+        """
+        Render the early interior preview: title page, the table of contents
+        for every chapter in the outline and the chapters written so far.
+        """
+        self._active_book_title = book.title
+        doc = self._build_doc_template(output_path, book.title)
+        story: List = []
+        story.extend(self._create_title_page(book, content_data))
+        story.append(PageBreak())
+        story.extend(self._create_preview_toc(content_data))
+
+        for chapter_title, chapter_content in self._collect_sections(content_data):
+            self._ensure_recto_start(story)
+            story.extend(self._format_chapter(chapter_title, chapter_content))
+
+        # Single pass: the contents page is static, not a TableOfContents flowable
+        doc.build(story)
+        return output_path
+
     def _build_doc_template(self, output_path: str, book_title: str) -> BaseDocTemplate:
         outer_self = self
 
@@ -793,6 +813,20 @@ class ProfessionalPDFGenerator:
         canvas_obj.setFont(self.header_font, max(10, int(book_height * 0.85)))
         canvas_obj.drawCentredString(center_x, center_y - book_height * 0.18, "AI")
 
+    def _create_preview_toc(self, content_data: Dict) -> List:
+        """Static contents page listing every outlined chapter, written or not"""
+        elements = [Paragraph('Table of Contents', self.styles['ChapterTitle']), Spacer(1, 0.3*inch)]
+        toc_style = ParagraphStyle('PreviewTOCEntry', parent=self.styles['BookBody'], fontSize=13, spaceAfter=8,
+                                   leftIndent=20)
+        written = len(content_data.get('chapters', []))
+        outlined = (content_data.get('outline') or {}).get('chapters') or content_data.get('chapters', [])
+        for i, chapter in enumerate(outlined, 1):
+            entry = f'Chapter {i}: {chapter.get("title", "Chapter")}'
+            if i > written:
+                entry += ' <i>(in progress)</i>'
+            elements.append(Paragraph(f'• {entry}', toc_style))
+        return elements
+
     def _create_toc(self, content_data: Dict) -> List:
         """Create table of contents"""
         elements = []
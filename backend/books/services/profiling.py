@@ -0,0 +1,167 @@
+"""
+On-demand cProfile capture for the book pipeline tasks.
+
+A task run is profiled when its book is flagged (``TASK_PROFILING_BOOK_IDS``
+or the "Profile next pipeline run" admin action), its owner is listed in
+``TASK_PROFILING_USER_IDS``, or the book falls in the
+``TASK_PROFILING_SAMPLE_RATE`` sample. Sampling hashes the book id, so a
+sampled book has all of its pipeline tasks profiled, not a random subset.
+
+Profiles go to the ``book_profiles`` collection next to the book's content:
+a top-N hotspot summary for the admin plus the raw pstats data, which the
+admin offers as a ``.prof`` download for ``python -m pstats`` or snakeviz. When
+nothing is enabled a task run costs one primary-key lookup and no profiler.
+The admin flag is ``Book.profile_until`` rather than a cache entry, so it
+reaches every worker even when the default cache is per-process.
+"""
+
+import cProfile
+import functools
+import logging
+import marshal
+import pstats
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from backend.utils.mongodb import get_mongodb_db
+from books.metrics import MONGO_SECONDS
+from books.services.content_store import PROFILES_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# How long an admin "profile next run" flag stays armed; long enough for the
+# content, cover and merge tasks of one generation to all pick it up
+FLAG_TIMEOUT = 6 * 60 * 60
+
+
+def flag_book(book_id: int) -> None:
+    from books.models import Book
+
+    profile_until = timezone.now() + timedelta(seconds=FLAG_TIMEOUT)
+    Book.objects.filter(id=book_id).update(profile_until=profile_until)
+
+
+def _sampled(book_id: int, rate: float) -> bool:
+    return zlib.crc32(str(book_id).encode()) / 2 ** 32 < rate
+
+
+def profiling_reason(book_id: int) -> Optional[str]:
+    """Why this book's tasks should be profiled, or None."""
+    if book_id in getattr(settings, 'TASK_PROFILING_BOOK_IDS', ()):
+        return 'book'
+
+    from books.models import Book
+
+    row = Book.objects.filter(id=book_id).values('profile_until', 'user_id').first()
+    if row is None:
+        return None
+    if row['profile_until'] and row['profile_until'] > timezone.now():
+        return 'book'
+    if row['user_id'] in getattr(settings, 'TASK_PROFILING_USER_IDS', ()):
+        return 'user'
+    rate = getattr(settings, 'TASK_PROFILING_SAMPLE_RATE', 0.0)
+    if rate > 0 and _sampled(book_id, rate):
+        return 'sampled'
+    return None
+
+
+def _location(filename: str, line: int, function: str) -> str:
+    if filename == '~':
+        # Builtins have no file
+        return function
+    for marker in ('site-packages/', str(settings.BASE_DIR) + '/'):
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f'{function} ({filename}:{line})'
+
+
+def summarize(stats: pstats.Stats, top_n: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Top ``top_n`` functions by cumulative and by own time."""
+    rows = [
+        {
+            'function': _location(*key),
+            'calls': calls,
+            'primitive_calls': primitive,
+            'tottime': round(tottime, 6),
+            'cumtime': round(cumtime, 6),
+        }
+        for key, (primitive, calls, tottime, cumtime, _callers) in stats.stats.items()
+    ]
+    return {
+        'cumulative': sorted(rows, key=lambda row: row['cumtime'], reverse=True)[:top_n],
+        'tottime': sorted(rows, key=lambda row: row['tottime'], reverse=True)[:top_n],
+    }
+
+
+@MONGO_SECONDS.time(operation='save_profile')
+def save_profile(book_id: int, task: str, profiler: cProfile.Profile, duration: float,
+                 reason: str, status: str) -> None:
+    stats = pstats.Stats(profiler)
+    get_mongodb_db()[PROFILES_COLLECTION].insert_one({
+        'book_id': book_id,
+        'task': task,
+        'reason': reason,
+        'status': status,
+        'duration': round(duration, 3),
+        'total_calls': stats.total_calls,
+        'created_at': timezone.now(),
+        'hotspots': summarize(stats, getattr(settings, 'TASK_PROFILING_TOP_N', 25)),
+        'stats': zlib.compress(marshal.dumps(stats.stats)),
+    })
+
+
+@MONGO_SECONDS.time(operation='list_profiles')
+def list_profiles(book_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    """Newest first, without the raw stats."""
+    cursor = get_mongodb_db()[PROFILES_COLLECTION].find({'book_id': book_id}, {'stats': 0})
+    return list(cursor.sort('created_at', -1).limit(limit))
+
+
+def profile_data(book_id: int, profile_id) -> Optional[bytes]:
+    """One of the book's profiles in the format ``Profile.dump_stats`` writes."""
+    document = get_mongodb_db()[PROFILES_COLLECTION].find_one({'_id': profile_id, 'book_id': book_id}, {'stats': 1})
+    return zlib.decompress(document['stats']) if document else None
+
+
+def profiled(task_name: str):
+    """
+    Profile a bound pipeline task ``(self, book_id, ...)`` when
+    ``profiling_reason`` says so. Place it under ``@shared_task``. With
+    profiling off a call still costs one indexed primary-key query, for
+    the admin flag and owner, but runs no profiler.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(task, book_id, *args, **kwargs):
+            reason = profiling_reason(book_id)
+            if reason is None:
+                return func(task, book_id, *args, **kwargs)
+
+            from celery.exceptions import Retry
+
+            profiler = cProfile.Profile()
+            status = 'error'
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                result = func(task, book_id, *args, **kwargs)
+                status = 'ok'
+                return result
+            except Retry:
+                status = 'retry'
+                raise
+            finally:
+                profiler.disable()
+                try:
+                    save_profile(book_id, task_name, profiler, time.perf_counter() - started, reason, status)
+                except Exception as exc:
+                    # A profile is never worth failing the book over
+                    logger.warning(f"Could not store {task_name} profile for book {book_id}: {exc}")
+        return wrapper
+    return decorator
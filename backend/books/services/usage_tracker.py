@@ -1,31 +1,66 @@
 # books/services/usage_tracker.py
+"""
+Token and Cloudflare usage tracking
+
+Events are appended to ``token_usage.ledger.jsonl`` (one JSON line each),
+so recording costs one small write no matter how much history exists.
+Appends take a shared ``flock`` and use O_APPEND, which keeps lines from
+different Celery processes intact.
+
+``compact()`` (run periodically by ``books.tasks.compact_usage_ledger``)
+rotates the ledger under an exclusive lock and folds the rotated segment
+into ``token_usage.json``: overall totals, monthly aggregates and the
+Cloudflare summary. Readers combine that summary with whatever is still
+in the live ledger, which compaction keeps short.
+"""
+import copy
+import fcntl
 import json
+import logging
+import os
 import time
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from datetime import datetime, timedelta
-from collections import defaultdict
-import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LEDGER_NAME = 'token_usage.ledger.jsonl'
+SUMMARY_NAME = 'token_usage.json'
+LOCK_NAME = 'token_usage.lock'
+COMPACT_LOCK_NAME = 'token_usage.compact.lock'
+SEGMENT_SUFFIX = '.compacting'
+# Segment names already folded into the summary, so a crash between
+# writing the summary and deleting the segment never double counts
+KEEP_SEGMENT_NAMES = 50
+
 
 class UsageTracker:
     """
     Enhanced token usage tracker with analytics and optimization features
     """
 
-    def __init__(self):
-        self.usage_file = Path("token_usage.json")
+    def __init__(self, data_dir=None):
+        data_dir = Path(data_dir or getattr(settings, 'USAGE_DATA_DIR', '.'))
+        self.ledger_file = data_dir / LEDGER_NAME
+        self.usage_file = data_dir / SUMMARY_NAME
+        self.lock_file = data_dir / LOCK_NAME
+        self.compact_lock_file = data_dir / COMPACT_LOCK_NAME
         # OpenRouter DeepSeek R1T2 Chimera pricing (as of 2024)
         self.pricing = {
             'input_tokens': 0.55 / 1000000,  # $0.55 per 1M input tokens
             'output_tokens': 2.19 / 1000000,  # $2.19 per 1M output tokens
         }
         self.monthly_limit = 87700000000  # 87.7B tokens (adjust based on actual limits)
-        self._lock = threading.Lock()  # Thread safety for concurrent access
-        
+
         # Cloudflare AI pricing (approximate)
         self.cloudflare_pricing = {
             'image_generation': 0.01,  # $0.01 per image
             'token_counting': 0.0,  # Free
         }
+        self._summary_cache = None
 
     def record_usage(self, input_tokens, output_tokens, model="deepseek/deepseek-r1-turbo", operation="generation"):
         """
@@ -37,125 +72,67 @@ class UsageTracker:
             model: AI model used
             operation: Type of operation (generation, cover_design, etc.)
         """
-        with self._lock:
-            try:
-                data = self._load_usage_data()
-
-                # Calculate costs
-                input_cost = input_tokens * self.pricing['input_tokens']
-                output_cost = output_tokens * self.pricing['output_tokens']
-                total_cost = input_cost + output_cost
-                total_tokens = input_tokens + output_tokens
-
-                # Update current month totals
-                current_month = datetime.now().strftime('%Y-%m')
-                if current_month not in data['monthly_usage']:
-                    data['monthly_usage'][current_month] = {
-                        'total_tokens': 0,
-                        'total_cost': 0.0,
-                        'input_tokens': 0,
-                        'output_tokens': 0,
-                        'operations': defaultdict(int),
-                        'models': defaultdict(int)
-                    }
-
-                month_data = data['monthly_usage'][current_month]
-                month_data['total_tokens'] += total_tokens
-                month_data['total_cost'] += total_cost
-                month_data['input_tokens'] += input_tokens
-                month_data['output_tokens'] += output_tokens
-                month_data['operations'][operation] += 1
-                month_data['models'][model] += total_tokens
-
-                # Update overall totals
-                data['total_tokens'] += total_tokens
-                data['total_cost'] += total_cost
-                data['total_input_tokens'] += input_tokens
-                data['total_output_tokens'] += output_tokens
-
-                # Record individual operation
-                operation_record = {
-                    'timestamp': datetime.now().isoformat(),
-                    'model': model,
-                    'operation': operation,
-                    'input_tokens': input_tokens,
-                    'output_tokens': output_tokens,
-                    'total_tokens': total_tokens,
-                    'cost': total_cost
-                }
-                data['operations'].append(operation_record)
-
-                # Keep only last 1000 operations to prevent file bloat
-                if len(data['operations']) > 1000:
-                    data['operations'] = data['operations'][-1000:]
-
-                self._save_usage_data(data)
-
-                # Check limits and warn if approaching
-                self._check_limits(month_data)
-
-                return {
-                    'tokens_used': total_tokens,
-                    'cost': total_cost,
-                    'remaining_monthly': self.get_remaining_tokens()
-                }
-
-            except Exception as e:
-                print(f"Usage tracking error: {e}")
-                return None
-    
+        try:
+            input_cost = input_tokens * self.pricing['input_tokens']
+            output_cost = output_tokens * self.pricing['output_tokens']
+            total_cost = input_cost + output_cost
+            total_tokens = input_tokens + output_tokens
+
+            self._append({
+                'kind': 'llm',
+                'timestamp': datetime.now().isoformat(),
+                'model': model,
+                'operation': operation,
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'cost': total_cost,
+            })
+
+            # Limits are checked against the last compaction plus this
+            # event; re-reading the live ledger here would make every
+            # record O(ledger size) again
+            month_tokens = self._compacted_month_tokens() + total_tokens
+            self._check_limits(month_tokens)
+
+            return {
+                'tokens_used': total_tokens,
+                'cost': total_cost,
+                'remaining_monthly': max(0, self.monthly_limit - month_tokens)
+            }
+
+        except Exception as e:
+            logger.error(f"Usage tracking error: {e}")
+            return None
+
     def record_cloudflare_usage(self, operation_type, count=1):
         """
         Record Cloudflare AI usage
-        
+
         Args:
             operation_type: Type of Cloudflare operation (image_generation, token_counting)
             count: Number of operations
         """
-        with self._lock:
-            try:
-                data = self._load_usage_data()
-                
-                # Initialize Cloudflare tracking if not exists
-                if 'cloudflare_usage' not in data:
-                    data['cloudflare_usage'] = {
-                        'total_operations': 0,
-                        'total_cost': 0.0,
-                        'by_type': {}
-                    }
-                
-                # Calculate cost
-                cost = self.cloudflare_pricing.get(operation_type, 0) * count
-                
-                # Update totals
-                data['cloudflare_usage']['total_operations'] += count
-                data['cloudflare_usage']['total_cost'] += cost
-                
-                # Update by type
-                if operation_type not in data['cloudflare_usage']['by_type']:
-                    data['cloudflare_usage']['by_type'][operation_type] = {
-                        'count': 0,
-                        'cost': 0.0
-                    }
-                
-                data['cloudflare_usage']['by_type'][operation_type]['count'] += count
-                data['cloudflare_usage']['by_type'][operation_type]['cost'] += cost
-                
-                self._save_usage_data(data)
-                
-                print(f"Cloudflare {operation_type}: {count} operations, ${cost:.4f}")
-                
-            except Exception as e:
-                print(f"Cloudflare usage tracking error: {e}")
+        try:
+            cost = self.cloudflare_pricing.get(operation_type, 0) * count
+            self._append({
+                'kind': 'cloudflare',
+                'timestamp': datetime.now().isoformat(),
+                'operation': operation_type,
+                'count': count,
+                'cost': cost,
+            })
+            logger.info(f"Cloudflare {operation_type}: {count} operations, ${cost:.4f}")
+        except Exception as e:
+            logger.error(f"Cloudflare usage tracking error: {e}")
 
     def get_remaining_tokens(self):
         """Get remaining tokens for the current month"""
         try:
-            data = self._load_usage_data()
+            data = self._current_data()
             current_month = datetime.now().strftime('%Y-%m')
             used = data['monthly_usage'].get(current_month, {}).get('total_tokens', 0)
             return max(0, self.monthly_limit - used)
-        except:
+        except Exception:
             return self.monthly_limit
 
     def get_usage_stats(self, months_back=1):
@@ -169,15 +146,18 @@ class UsageTracker:
             dict: Usage statistics
         """
         try:
-            data = self._load_usage_data()
-            current_month = datetime.now()
+            data = self._current_data()
+            now = datetime.now()
             stats = {}
 
             for i in range(months_back):
-                month_key = (current_month - timedelta(days=i*30)).strftime('%Y-%m')
+                year, month = divmod(now.year * 12 + now.month - 1 - i, 12)
+                month_key = f'{year:04d}-{month + 1:02d}'
                 if month_key in data['monthly_usage']:
                     stats[month_key] = data['monthly_usage'][month_key]
 
+            current_month = now.strftime('%Y-%m')
+            used = data['monthly_usage'].get(current_month, {}).get('total_tokens', 0)
             return {
                 'monthly_stats': stats,
                 'overall_totals': {
@@ -185,23 +165,20 @@ class UsageTracker:
                     'total_cost': data['total_cost'],
                     'total_input_tokens': data['total_input_tokens'],
                     'total_output_tokens': data['total_output_tokens'],
-                    'remaining_monthly': self.get_remaining_tokens()
+                    'remaining_monthly': max(0, self.monthly_limit - used)
                 },
+                'cloudflare_usage': data['cloudflare_usage'],
                 'efficiency_metrics': self._calculate_efficiency_metrics(data)
             }
         except Exception as e:
-            print(f"Error getting usage stats: {e}")
+            logger.error(f"Error getting usage stats: {e}")
             return {}
 
     def _calculate_efficiency_metrics(self, data):
-        """Calculate efficiency metrics for optimization"""
+        """Calculate efficiency metrics from the aggregated totals"""
         try:
-            if data['total_tokens'] == 0:
-                return {}
-
-            # Calculate average tokens per operation
-            total_operations = len(data['operations'])
-            if total_operations == 0:
+            total_operations = data.get('total_operations', 0)
+            if data['total_tokens'] == 0 or total_operations == 0:
                 return {}
 
             avg_input_tokens = data['total_input_tokens'] / total_operations
@@ -210,7 +187,7 @@ class UsageTracker:
             avg_cost_per_operation = data['total_cost'] / total_operations
 
             # Calculate cost efficiency (lower is better)
-            cost_per_token = data['total_cost'] / data['total_tokens'] if data['total_tokens'] > 0 else 0
+            cost_per_token = data['total_cost'] / data['total_tokens']
 
             return {
                 'avg_input_tokens_per_operation': round(avg_input_tokens, 2),
@@ -221,53 +198,183 @@ class UsageTracker:
                 'total_operations': total_operations
             }
         except Exception as e:
-            print(f"Error calculating efficiency metrics: {e}")
+            logger.error(f"Error calculating efficiency metrics: {e}")
             return {}
 
-    def _check_limits(self, month_data):
+    def _check_limits(self, month_tokens):
         """Check usage limits and provide warnings"""
-        used_percentage = (month_data['total_tokens'] / self.monthly_limit) * 100
+        used_percentage = (month_tokens / self.monthly_limit) * 100
 
         if used_percentage > 95:
-            print(f"CRITICAL: Used {used_percentage:.1f}% of monthly token limit!")
+            logger.critical(f"Used {used_percentage:.1f}% of monthly token limit!")
         elif used_percentage > 80:
-            print(f"WARNING: Used {used_percentage:.1f}% of monthly token limit")
+            logger.warning(f"Used {used_percentage:.1f}% of monthly token limit")
         elif used_percentage > 50:
-            print(f"INFO: Used {used_percentage:.1f}% of monthly token limit")
+            logger.info(f"Used {used_percentage:.1f}% of monthly token limit")
 
-    def _load_usage_data(self):
-        """Load usage data from file with error handling"""
+    # Ledger ---------------------------------------------------------------
+
+    @contextmanager
+    def _locked(self, path, mode):
+        with open(path, 'a') as handle:
+            fcntl.flock(handle, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _append(self, event):
+        self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+        # Shared: appenders don't block each other, only a rotating compactor
+        with self._locked(self.lock_file, fcntl.LOCK_SH):
+            fd = os.open(self.ledger_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+    def _read_events(self, path):
         try:
-            if self.usage_file.exists():
-                with open(self.usage_file, 'r') as f:
-                    data = json.load(f)
-            else:
-                data = self._get_default_data_structure()
-
-            # Ensure all required keys exist
-            required_keys = [
-                'total_tokens', 'total_cost', 'total_input_tokens', 'total_output_tokens',
-                'monthly_usage', 'operations'
-            ]
-            for key in required_keys:
-                if key not in data:
-                    if key in ['monthly_usage', 'operations']:
-                        data[key] = {} if key == 'monthly_usage' else []
-                    else:
-                        data[key] = 0
-
-            return data
-        except Exception as e:
-            print(f"Error loading usage data: {e}")
+            with open(path, 'r', encoding='utf-8') as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A worker killed mid-write can leave a torn last line
+                        logger.warning(f"Skipping malformed usage ledger line in {path.name}")
+        except FileNotFoundError:
+            return
+
+    def _apply(self, data, event):
+        """Fold one ledger event into the summary structure"""
+        month_key = event.get('timestamp', '')[:7] or datetime.now().strftime('%Y-%m')
+        cost = event.get('cost', 0.0)
+
+        if event.get('kind') == 'cloudflare':
+            count = event.get('count', 1)
+            cloudflare = data['cloudflare_usage']
+            cloudflare['total_operations'] += count
+            cloudflare['total_cost'] += cost
+            by_type = cloudflare['by_type'].setdefault(event['operation'], {'count': 0, 'cost': 0.0})
+            by_type['count'] += count
+            by_type['cost'] += cost
+            return
+
+        input_tokens = event.get('input_tokens', 0)
+        output_tokens = event.get('output_tokens', 0)
+        total_tokens = input_tokens + output_tokens
+
+        month_data = data['monthly_usage'].setdefault(month_key, {
+            'total_tokens': 0,
+            'total_cost': 0.0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'operations': {},
+            'models': {},
+        })
+        month_data['total_tokens'] += total_tokens
+        month_data['total_cost'] += cost
+        month_data['input_tokens'] += input_tokens
+        month_data['output_tokens'] += output_tokens
+        operations = month_data.setdefault('operations', {})
+        operations[event['operation']] = operations.get(event['operation'], 0) + 1
+        models = month_data.setdefault('models', {})
+        models[event['model']] = models.get(event['model'], 0) + total_tokens
+
+        data['total_tokens'] += total_tokens
+        data['total_cost'] += cost
+        data['total_input_tokens'] += input_tokens
+        data['total_output_tokens'] += output_tokens
+        data['total_operations'] += 1
+
+    def _current_data(self):
+        """Compacted summary plus the events still in the live ledger"""
+        data = copy.deepcopy(self._load_usage_data())
+        for event in self._read_events(self.ledger_file):
+            self._apply(data, event)
+        return data
+
+    def _compacted_month_tokens(self):
+        month = self._load_usage_data()['monthly_usage'].get(datetime.now().strftime('%Y-%m'), {})
+        return month.get('total_tokens', 0)
+
+    def compact(self):
+        """
+        Rotate the live ledger and fold every pending segment into the summary.
+
+        Returns the number of events folded, or None if another process is
+        already compacting.
+        """
+        self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.compact_lock_file, 'a') as compact_lock:
+            try:
+                fcntl.flock(compact_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                with self._locked(self.lock_file, fcntl.LOCK_EX):
+                    if self.ledger_file.exists() and self.ledger_file.stat().st_size:
+                        segment = self.ledger_file.with_name(
+                            f'{self.ledger_file.name}.{time.time_ns()}{SEGMENT_SUFFIX}'
+                        )
+                        os.replace(self.ledger_file, segment)
+
+                folded = 0
+                data = self._load_usage_data(use_cache=False)
+                for segment in sorted(self.ledger_file.parent.glob(f'{self.ledger_file.name}.*{SEGMENT_SUFFIX}')):
+                    if segment.name not in data['compacted_segments']:
+                        for event in self._read_events(segment):
+                            self._apply(data, event)
+                            folded += 1
+                        data['compacted_segments'] = (data['compacted_segments'] + [segment.name])[-KEEP_SEGMENT_NAMES:]
+                        data['compacted_at'] = datetime.now().isoformat()
+                        self._save_usage_data(data)
+                    segment.unlink()
+                return folded
+            finally:
+                fcntl.flock(compact_lock, fcntl.LOCK_UN)
+
+    # Summary --------------------------------------------------------------
+
+    def _load_usage_data(self, use_cache=True):
+        """Load the compacted summary; cached until the file changes"""
+        try:
+            mtime = self.usage_file.stat().st_mtime_ns
+        except FileNotFoundError:
             return self._get_default_data_structure()
 
-    def _save_usage_data(self, data):
-        """Save usage data to file"""
+        if use_cache and self._summary_cache and self._summary_cache[0] == mtime:
+            return self._summary_cache[1]
+
         try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
+            with open(self.usage_file, 'r') as f:
+                data = json.load(f)
         except Exception as e:
-            print(f"Error saving usage data: {e}")
+            logger.error(f"Error loading usage data: {e}")
+            return self._get_default_data_structure()
+
+        defaults = self._get_default_data_structure()
+        # Files written before the ledger kept the last 1000 operation
+        # records instead of a count
+        legacy_operations = data.pop('operations', None)
+        if 'total_operations' not in data and legacy_operations is not None:
+            data['total_operations'] = len(legacy_operations)
+        for key, value in defaults.items():
+            data.setdefault(key, value)
+
+        self._summary_cache = (mtime, data)
+        return data
+
+    def _save_usage_data(self, data):
+        """Write the summary atomically so readers never see a partial file"""
+        tmp_path = self.usage_file.with_name(f'{self.usage_file.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, self.usage_file)
 
     def _get_default_data_structure(self):
         """Get default data structure"""
@@ -276,8 +383,14 @@ class UsageTracker:
             'total_cost': 0.0,
             'total_input_tokens': 0,
             'total_output_tokens': 0,
+            'total_operations': 0,
             'monthly_usage': {},
-            'operations': []
+            'cloudflare_usage': {
+                'total_operations': 0,
+                'total_cost': 0.0,
+                'by_type': {}
+            },
+            'compacted_segments': [],
         }
 
     def optimize_prompt_for_tokens(self, prompt, max_tokens=4000):
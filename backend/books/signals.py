@@ -0,0 +1,13 @@
+# books/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog_cache import bump_catalog_version
+from .models import CoverStyle, Domain, Niche
+
+
+@receiver([post_save, post_delete], sender=Domain)
+@receiver([post_save, post_delete], sender=Niche)
+@receiver([post_save, post_delete], sender=CoverStyle)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
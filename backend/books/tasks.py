@@ -10,16 +10,27 @@ from django.utils import timezone
 from pathlib import Path
 import logging
 
+from .metrics import GENERATION_SECONDS, TASK_FAILURES, TASK_RETRIES, track_stage
 from .models import Book
-from .services.custom_llm_book_generator import CustomLLMBookGenerator  # NEW: Custom LLM
-from .services.pdf_merger import PDFMerger
-from covers.services_pro import CoverGeneratorProfessional
-from backend.utils.mongodb import get_mongodb_db
+from users.analytics import refresh_recent_books
+from backend.utils.downloads import artifact_fingerprint
+from .services.content_store import (
+    delete_book_content,
+    get_content_fields,
+    load_content_data,
+    update_content_fields,
+)
+from .services.profiling import profiled
+
+# The generator, cover and merge services pull in ReportLab and pypdf; they
+# are imported inside the tasks so the web process and `manage.py` commands
+# that only enqueue work don't pay for them
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task(bind=True, max_retries=3)
+@profiled('generate_book_content')
 def generate_book_content(self, book_id):
     """
     Generate book content using Custom LLM (NO OpenRouter)
@@ -33,7 +44,8 @@ def generate_book_content(self, book_id):
         book.status = 'generating'
         book.progress_percentage = 10
         book.current_step = 'Initializing custom LLM generation'
-        book.save()
+        book.track_generation_start()
+        refresh_recent_books(book.user_id)
 
         logger.info(f"🚀 Starting CUSTOM LLM generation for book {book_id}: {book.title}")
 
@@ -43,6 +55,8 @@ def generate_book_content(self, book_id):
         book.save()
 
         # Generate content using CUSTOM LLM (NO external APIs)
+        from .services.custom_llm_book_generator import CustomLLMBookGenerator
+
         generator = CustomLLMBookGenerator()
         content_data = generator.generate_book_content(book)
 
@@ -75,6 +89,7 @@ def generate_book_content(self, book_id):
         book.progress_percentage = 90
         book.current_step = 'Content generation completed - NO API limits used!'
         book.save()
+        refresh_recent_books(book.user_id)
 
         logger.info(f"✅ CUSTOM LLM generation completed for book {book_id}")
         logger.info(f"   Words: {content_data['metadata']['total_words']}")
@@ -88,6 +103,7 @@ def generate_book_content(self, book_id):
 
     except Exception as e:
         logger.error(f"Content generation failed for book {book_id}: {str(e)}")
+        TASK_FAILURES.inc(task='generate_book_content')
 
         # Update book status
         try:
@@ -97,6 +113,7 @@ def generate_book_content(self, book_id):
             book.progress_percentage = 0
             book.current_step = f'Error: {str(e)}'
             book.save()
+            refresh_recent_books(book.user_id)
         except Exception:
             pass
 
@@ -104,12 +121,14 @@ def generate_book_content(self, book_id):
         if self.request.retries < self.max_retries:
             delay = 2 ** self.request.retries  # 2, 4, 8 seconds
             logger.info(f"Retrying content generation for book {book_id} in {delay} seconds")
+            TASK_RETRIES.inc(task='generate_book_content')
             raise self.retry(countdown=delay, exc=e)
 
         return {'status': 'failed', 'book_id': book_id, 'error': str(e)}
 
 
 @shared_task(bind=True, max_retries=2)
+@profiled('generate_book_covers')
 def generate_book_covers(self, book_id):
     """
     Generate cover for the book - single cover for guided workflow, multiple for manual
@@ -151,6 +170,7 @@ def generate_book_covers(self, book_id):
 
         # Guided workflow requires domain + niche selection
         is_guided = book.domain_id is not None and book.niche_id is not None
+        from covers.services_pro import CoverGeneratorProfessional
 
         if is_guided:
             # Update progress
@@ -160,7 +180,8 @@ def generate_book_covers(self, book_id):
 
             # Generate single cover for guided workflow
             cover_gen = CoverGeneratorProfessional()
-            cover = cover_gen.generate_single_cover(book)
+            with track_stage('cover_render'):
+                cover = cover_gen.generate_single_cover(book)
 
             # Update progress
             book.progress_percentage = 98
@@ -181,7 +202,8 @@ def generate_book_covers(self, book_id):
 
             # Generate 3 covers for manual workflow
             cover_gen = CoverGeneratorProfessional()
-            covers = cover_gen.generate_three_covers(book)
+            with track_stage('cover_render'):
+                covers = cover_gen.generate_three_covers(book)
             
             if len(covers) == 0:
                 raise Exception("No covers were generated")
@@ -196,11 +218,13 @@ def generate_book_covers(self, book_id):
             # Update book status
             book.status = 'cover_pending'
             book.save()
+            refresh_recent_books(book.user_id)
             
             return {'status': 'success', 'book_id': book_id, 'covers_count': len(covers), 'guided': False}
 
     except Exception as e:
         logger.error(f"Cover generation failed for book {book_id}: {str(e)}")
+        TASK_FAILURES.inc(task='generate_book_covers')
 
         # Update book status
         try:
@@ -210,6 +234,7 @@ def generate_book_covers(self, book_id):
             book.progress_percentage = 0
             book.current_step = f'Error: {str(e)}'
             book.save()
+            refresh_recent_books(book.user_id)
         except Exception:
             pass
 
@@ -217,12 +242,14 @@ def generate_book_covers(self, book_id):
         if self.request.retries < self.max_retries:
             delay = 5 * (self.request.retries + 1)  # 5, 10 seconds
             logger.info(f"Retrying cover generation for book {book_id} in {delay} seconds")
+            TASK_RETRIES.inc(task='generate_book_covers')
             raise self.retry(countdown=delay, exc=e)
 
         return {'status': 'failed', 'book_id': book_id, 'error': str(e)}
 
 
 @shared_task(bind=True, max_retries=2)
+@profiled('create_final_book_pdf')
 def create_final_book_pdf(self, book_id):
     """
     Merge selected cover with interior PDF to create final downloadable book
@@ -243,9 +270,8 @@ def create_final_book_pdf(self, book_id):
 
         logger.info(f"Creating final PDF for book {book_id}: {book.title}")
 
-        # Get interior PDF path from MongoDB
-        db = get_mongodb_db()
-        content_doc = db.book_contents.find_one({'book_id': book.id})
+        # Get interior PDF path from MongoDB (header only, no chapter bodies)
+        content_doc = get_content_fields(book.id, 'interior_pdf_path')
 
         if not content_doc:
             raise Exception("Book content not found in MongoDB")
@@ -262,15 +288,14 @@ def create_final_book_pdf(self, book_id):
             book.current_step = 'Regenerating interior PDF'
             book.save()
 
+            from .services.custom_llm_book_generator import CustomLLMBookGenerator
+
             generator = CustomLLMBookGenerator()  # Use Custom LLM
-            content_data = content_doc.get('content', {})
+            content_data = load_content_data(book.id)
             if content_data:
                 interior_pdf_path = generator.create_pdf(book, content_data)
                 # Update MongoDB
-                db.book_contents.update_one(
-                    {'book_id': book.id},
-                    {'$set': {'interior_pdf_path': interior_pdf_path}}
-                )
+                update_content_fields(book.id, interior_pdf_path=interior_pdf_path)
             else:
                 raise Exception("No content data available to regenerate PDF")
 
@@ -280,20 +305,29 @@ def create_final_book_pdf(self, book_id):
         book.save()
 
         # Merge with selected cover
+        from .services.pdf_merger import PDFMerger
+
         merger = PDFMerger()
-        final_pdf_path = merger.merge_book(book, interior_pdf_path, book.selected_cover)
+        with track_stage('merge'):
+            final_pdf_path = merger.merge_book(book, interior_pdf_path, book.selected_cover)
 
         # Update MongoDB and book model
-        db.book_contents.update_one(
-            {'book_id': book.id},
-            {'$set': {'final_pdf_path': final_pdf_path}}
+        fingerprint = artifact_fingerprint(Path(settings.MEDIA_ROOT) / final_pdf_path)
+        update_content_fields(
+            book.id,
+            final_pdf_path=final_pdf_path,
+            final_pdf_sha256=fingerprint['sha256'],
+            final_pdf_size=fingerprint['size'],
         )
 
         book.final_pdf_path = final_pdf_path
         book.status = 'ready'
         book.progress_percentage = 100
         book.current_step = 'Book completed and ready for download'
-        book.save()
+        book.track_generation_complete()
+        if book.generation_time_seconds is not None:
+            GENERATION_SECONDS.observe(book.generation_time_seconds)
+        refresh_recent_books(book.user_id)
 
         logger.info(f"Final PDF created successfully for book {book_id}")
 
@@ -301,6 +335,7 @@ def create_final_book_pdf(self, book_id):
 
     except Exception as e:
         logger.error(f"Final PDF creation failed for book {book_id}: {str(e)}")
+        TASK_FAILURES.inc(task='create_final_book_pdf')
 
         # Update book status
         try:
@@ -310,6 +345,7 @@ def create_final_book_pdf(self, book_id):
             book.progress_percentage = 0
             book.current_step = f'Error: {str(e)}'
             book.save()
+            refresh_recent_books(book.user_id)
         except Exception:
             pass
 
@@ -317,6 +353,7 @@ def create_final_book_pdf(self, book_id):
         if self.request.retries < self.max_retries:
             delay = 3 * (self.request.retries + 1)  # 3, 6 seconds
             logger.info(f"Retrying final PDF creation for book {book_id} in {delay} seconds")
+            TASK_RETRIES.inc(task='create_final_book_pdf')
             raise self.retry(countdown=delay, exc=e)
 
         return {'status': 'failed', 'book_id': book_id, 'error': str(e)}
@@ -342,11 +379,12 @@ def cleanup_old_books():
                 # Delete associated files
                 if book.final_pdf_path and Path(book.final_pdf_path).exists():
                     Path(book.final_pdf_path).unlink()
+                if book.preview_pdf_path:
+                    (Path(settings.MEDIA_ROOT) / book.preview_pdf_path).unlink(missing_ok=True)
 
                 # Delete from MongoDB
                 if book.mongodb_id:
-                    db = get_mongodb_db()
-                    db.book_contents.delete_one({'book_id': book.id})
+                    delete_book_content(book.id)
 
                 # Delete covers
                 book.covers.all().delete()
@@ -364,4 +402,18 @@ def cleanup_old_books():
 
     except Exception as e:
         logger.error(f"Cleanup task failed: {str(e)}")
-        return {'status': 'failed', 'error': str(e)}
\ No newline at end of file
+        return {'status': 'failed', 'error': str(e)}
+
+
+@shared_task(ignore_result=True)
+def compact_usage_ledger():
+    """
+    Periodic task folding the append-only usage ledger into monthly aggregates
+    """
+    from .services.usage_tracker import UsageTracker
+
+    folded = UsageTracker().compact()
+    if folded is None:
+        logger.info("Usage ledger compaction already running elsewhere")
+    elif folded:
+        logger.info(f"Compacted {folded} usage ledger events")
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from books.models import Book, CoverStyle, Domain, Niche
+from covers.models import Cover
+
+
+class BookListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        domain = Domain.objects.create(name='AI & Automation', slug='ai_automation')
+        niche = Niche.objects.create(domain=domain, name='No-code', slug='no_code')
+        style = CoverStyle.objects.create(name='Minimal', style='minimalist')
+        for index in range(12):
+            book = Book.objects.create(
+                user=cls.user, title=f'Book {index}', domain=domain, niche=niche,
+                cover_style=style, status='ready',
+            )
+            for option in range(3):
+                Cover.objects.create(
+                    book=book, template_style=f'style_{option}',
+                    image_path=f'covers/{book.id}_{option}.png', is_selected=option == 0,
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        small, small_page = self._query_count('/api/books/?page_size=2')
+        large, large_page = self._query_count('/api/books/?page_size=10')
+
+        self.assertEqual(len(small_page['results']), 2)
+        self.assertEqual(len(large_page['results']), 10)
+        self.assertEqual(small, large)
+
+        first = large_page['results'][0]
+        self.assertTrue(first['can_download'])
+        self.assertEqual(first['selected_cover']['template_style'], 'style_0')
+        self.assertEqual(len(first['covers']), 3)
+
+    def test_history_pages_through_every_book_once(self):
+        seen = []
+        url = '/api/books/history/?page_size=5'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(book['id'] for book in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(len(set(seen)), 12)
@@ -0,0 +1,54 @@
+import io
+import tempfile
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from benchmarks import corpora
+from benchmarks.cases import all_cases
+from benchmarks.runner import Result, compare, measure, save_baseline
+
+
+class RunnerTests(SimpleTestCase):
+    def test_measure_loops_fast_functions_up_to_min_time(self):
+        result = measure('noop', lambda: None, warmup=0, repeats=3, min_time=0.001)
+        self.assertGreater(result.loops, 1)
+        self.assertEqual(result.repeats, 3)
+        self.assertLessEqual(result.min_us, result.median_us)
+
+    def test_compare_flags_only_slowdowns_beyond_threshold(self):
+        results = [
+            Result('slower', 1, 3, 100, 130, 1),
+            Result('faster', 1, 3, 50, 50, 1),
+            Result('new', 1, 3, 10, 10, 1),
+        ]
+        rows = {row['name']: row for row in compare(results, {'slower': {'median_us': 100}, 'faster': {'median_us': 100}}, 20)}
+
+        self.assertTrue(rows['slower']['regressed'])
+        self.assertEqual(rows['slower']['change_pct'], 30.0)
+        self.assertFalse(rows['faster']['regressed'])
+        self.assertIsNone(rows['new']['change_pct'])
+
+    def test_corpora_are_deterministic(self):
+        corpora.book.cache_clear()
+        first = corpora.book('short')[0]['content']
+        corpora.book.cache_clear()
+        self.assertEqual(corpora.book('short')[0]['content'], first)
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_every_case_runs(self):
+        for name, setup in all_cases():
+            with self.subTest(name):
+                setup()()
+
+    def test_regression_against_baseline_fails_the_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = Path(tmp) / 'baseline.json'
+            save_baseline(baseline, [Result('trending.get_trending_context[known]', 1, 1, 0.001, 0.001, 0)])
+            with self.assertRaises(CommandError):
+                call_command(
+                    'run_benchmarks', filter='trending.*known*', baseline=str(baseline),
+                    warmup=0, repeats=2, min_time=0.001, stdout=io.StringIO(),
+                )
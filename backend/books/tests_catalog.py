@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from books.models import Domain, Niche
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.domain = Domain.objects.create(name='Home Workout', slug='home_workout')
+        Niche.objects.create(domain=cls.domain, name='Mobility', slug='mobility')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeat_requests_are_served_without_queries(self):
+        first = self.client.get('/api/niches/', {'domain': 'home_workout'})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ETag', first)
+        self.assertIn('max-age=', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/niches/', {'domain': 'home_workout'})
+        self.assertEqual(second.content, first.content)
+
+        with self.assertNumQueries(0):
+            revalidated = self.client.get('/api/niches/', {'domain': 'home_workout'},
+                                          HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_saving_a_catalog_model_invalidates_cached_bodies(self):
+        before = self.client.get('/api/domains/')
+        self.domain.name = 'Home Fitness'
+        self.domain.save()
+
+        after = self.client.get('/api/domains/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(after.json()[0]['name'], 'Home Fitness')
@@ -0,0 +1,161 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from books.services import content_codec, content_store
+
+
+class FakeCollection:
+    """Just enough of pymongo's Collection for the content store."""
+
+    def __init__(self):
+        self.docs = []
+        self._next_id = 1
+
+    def _matches(self, doc, query):
+        for key, value in query.items():
+            if isinstance(value, dict) and '$nin' in value:
+                if doc.get(key) in value['$nin']:
+                    return False
+            elif doc.get(key) != value:
+                return False
+        return True
+
+    def _project(self, doc, projection):
+        if not projection:
+            return dict(doc)
+        included = [k for k, v in projection.items() if v]
+        if included:
+            result = {k: doc[k] for k in included if k in doc}
+            if projection.get('_id', 1) and '_id' in doc:
+                result['_id'] = doc['_id']
+            return result
+        return {k: v for k, v in doc.items() if k not in projection}
+
+    def _upsert(self, query, replacement):
+        for index, doc in enumerate(self.docs):
+            if self._matches(doc, query):
+                self.docs[index] = {**replacement, '_id': doc['_id']}
+                return self.docs[index]
+        new_doc = {**replacement, '_id': self._next_id}
+        self._next_id += 1
+        self.docs.append(new_doc)
+        return new_doc
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self._upsert(request._filter, request._doc)
+
+    def find_one_and_replace(self, query, replacement, projection=None, **kwargs):
+        return self._project(self._upsert(query, replacement), projection)
+
+    def find_one(self, query, projection=None):
+        for doc in self.docs:
+            if self._matches(doc, query):
+                return self._project(doc, projection)
+        return None
+
+    def find(self, query, projection=None):
+        return FakeCursor([self._project(d, projection) for d in self.docs if self._matches(d, query)])
+
+    def delete_many(self, query):
+        self.docs = [d for d in self.docs if not self._matches(d, query)]
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[key], reverse=direction < 0))
+
+
+class ContentStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.db = {
+            content_store.CONTENTS_COLLECTION: FakeCollection(),
+            content_store.CHAPTERS_COLLECTION: FakeCollection(),
+        }
+        patcher = mock.patch.object(content_store, 'get_mongodb_db', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _content(self, chapter_count):
+        return {
+            'title': 'Test Book',
+            'outline': {'chapters': []},
+            'chapters': [
+                {'number': n, 'title': f'Chapter {n}', 'content': f'Body {n}. ' * 100, 'word_count': 200}
+                for n in range(1, chapter_count + 1)
+            ],
+            'metadata': {'quality': {'average_score': 80, 'sections': [
+                {'title': 'Chapter 1', 'score': 80, 'clean_text': 'Body 1'},
+            ]}},
+        }
+
+    def test_header_does_not_embed_chapter_bodies(self):
+        content_store.save_book_content(1, self._content(3), '/tmp/book_1.pdf')
+
+        header = self.db[content_store.CONTENTS_COLLECTION].docs[0]
+        self.assertNotIn('chapters', header)
+        self.assertNotIn('content', header)
+        self.assertEqual(header['chapter_count'], 3)
+        self.assertNotIn('clean_text', header['metadata']['quality']['sections'][0])
+        self.assertEqual(len(self.db[content_store.CHAPTERS_COLLECTION].docs), 3)
+
+    def test_regeneration_replaces_chapters(self):
+        content_store.save_book_content(1, self._content(4), '/tmp/book_1.pdf')
+        content_store.save_book_content(1, self._content(2), '/tmp/book_1.pdf')
+
+        self.assertEqual(len(self.db[content_store.CONTENTS_COLLECTION].docs), 1)
+        data = content_store.load_content_data(1)
+        self.assertEqual([c['number'] for c in data['chapters']], [1, 2])
+        self.assertEqual(data['chapters'][1]['content'], 'Body 2. ' * 100)
+
+    def test_legacy_document_is_readable_and_convertible(self):
+        legacy = self._content(2)
+        contents = self.db[content_store.CONTENTS_COLLECTION]
+        contents.docs.append({
+            '_id': 99, 'book_id': 7, 'title': legacy['title'], 'chapters': legacy['chapters'],
+            'content': legacy, 'pdf_path': '/tmp/old.pdf',
+        })
+        self.assertEqual(content_store.load_content_data(7)['title'], 'Test Book')
+
+        contents.update_one = mock.Mock()
+        self.assertTrue(content_store.convert_legacy_document(self.db, contents.docs[0]))
+        update = contents.update_one.call_args[0][1]
+        self.assertEqual(update['$set']['schema_version'], content_store.SCHEMA_VERSION)
+        self.assertEqual(update['$set']['interior_pdf_path'], '/tmp/old.pdf')
+        self.assertIn('content', update['$unset'])
+        self.assertEqual(len(self.db[content_store.CHAPTERS_COLLECTION].docs), 2)
+
+    @override_settings(BOOK_CONTENT_CODEC='zlib')
+    def test_chapters_are_compressed_and_decoded_lazily(self):
+        content_store.save_book_content(1, self._content(2), '/tmp/book_1.pdf')
+
+        stored = self.db[content_store.CHAPTERS_COLLECTION].docs[0]
+        self.assertEqual(stored['content_codec'], content_codec.CODEC_ZLIB)
+        self.assertLess(stored['stored_size'], stored['raw_size'])
+        header = self.db[content_store.CONTENTS_COLLECTION].docs[0]
+        self.assertGreater(header['compression']['ratio'], 1)
+
+        chapter = content_store.load_content_data(1)['chapters'][0]
+        with mock.patch.object(content_store, 'decode_text', wraps=content_store.decode_text) as decode:
+            self.assertEqual(chapter['title'], 'Chapter 1')
+            decode.assert_not_called()
+            self.assertEqual(chapter.get('content'), 'Body 1. ' * 100)
+            chapter['content']
+            decode.assert_called_once()
+
+
+class ContentCodecTests(SimpleTestCase):
+    def test_round_trip_for_every_available_codec(self):
+        text = 'Ünïcode chapter text with bullets\n- one\n- two\n' * 50
+        for codec in content_codec.available_codecs():
+            with self.subTest(codec=codec):
+                stored_codec, payload, raw_size, stored_size = content_codec.encode_text(text, codec)
+                self.assertEqual(raw_size, len(text.encode('utf-8')))
+                self.assertEqual(content_codec.decode_text(stored_codec, payload), text)
+
+    def test_short_text_is_stored_plain(self):
+        self.assertEqual(content_codec.encode_text('short', content_codec.CODEC_ZLIB)[:2], ('none', 'short'))
+
+    def test_untagged_content_reads_as_plain_text(self):
+        self.assertEqual(content_codec.decode_text(None, 'legacy body'), 'legacy body')
@@ -0,0 +1,113 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from backend.utils.downloads import artifact_fingerprint, is_initial_request, serve_file
+from books.models import Book, Domain, Niche
+from covers.models import Cover
+from users.models import DownloadHistory
+
+
+class ServeFileTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = Path(tmp.name)
+        self.path = self.media_root / 'books' / 'guide.pdf'
+        self.path.parent.mkdir()
+        self.body = bytes(range(256)) * 40
+        self.path.write_bytes(self.body)
+        self.sha256 = artifact_fingerprint(self.path)['sha256']
+        self.factory = RequestFactory()
+
+    def _serve(self, **headers):
+        request = self.factory.get('/download/', **headers)
+        return serve_file(request, self.path, filename='Guide.pdf', content_type='application/pdf',
+                          etag_hash=self.sha256)
+
+    def test_full_download_has_strong_etag(self):
+        response = self._serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+    def test_conditional_get_returns_304(self):
+        response = self._serve(HTTP_IF_NONE_MATCH=f'"{self.sha256}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self._serve(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+
+        suffix = self._serve(HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(suffix.streaming_content), self.body[-10:])
+
+        self.assertEqual(self._serve(HTTP_RANGE=f'bytes={len(self.body)}-').status_code, 416)
+
+    def test_stale_if_range_sends_full_body(self):
+        response = self._serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_proxy_modes_hand_off_the_transfer(self):
+        with override_settings(MEDIA_ROOT=self.media_root, DOWNLOAD_SERVE_MODE='x-accel',
+                               DOWNLOAD_ACCEL_PREFIX='/protected-media/'):
+            response = self._serve()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/books/guide.pdf')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(DOWNLOAD_SERVE_MODE='x-sendfile'):
+            response = self._serve()
+        self.assertEqual(response['X-Sendfile'], str(self.path.resolve()))
+
+    def test_only_initial_requests_count_as_downloads(self):
+        self.assertTrue(is_initial_request(self.factory.get('/')))
+        self.assertTrue(is_initial_request(self.factory.get('/', HTTP_RANGE='bytes=0-')))
+        self.assertFalse(is_initial_request(self.factory.get('/', HTTP_RANGE='bytes=500-')))
+
+
+class DownloadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        domain = Domain.objects.create(name='AI & Automation', slug='ai_automation')
+        niche = Niche.objects.create(domain=domain, name='No-code', slug='no_code')
+        cls.book = Book.objects.create(user=cls.user, title='Guide', domain=domain, niche=niche, status='ready')
+        Cover.objects.create(book=cls.book, template_style='minimal', image_path='covers/1.png', is_selected=True)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media_root = Path(tmp.name)
+        (media_root / 'books').mkdir()
+        (media_root / 'books' / 'guide.pdf').write_bytes(b'%PDF' + b'x' * 1000)
+        settings_override = override_settings(MEDIA_ROOT=media_root, DOWNLOAD_SERVE_MODE='x-accel')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        content = mock.patch('books.views.get_content_fields', return_value={
+            'final_pdf_path': 'books/guide.pdf', 'final_pdf_sha256': 'abc',
+        })
+        content.start()
+        self.addCleanup(content.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/books/{self.book.id}/download/'
+
+    def test_proxy_mode_counts_resumed_ranges_once(self):
+        first = self.client.get(self.url)
+        resumed = self.client.get(self.url, HTTP_RANGE='bytes=500-')
+
+        self.assertEqual(first.status_code, 200)
+        # nginx handles the range; Django still answers 200
+        self.assertEqual(resumed.status_code, 200)
+        self.assertIn('X-Accel-Redirect', resumed)
+        self.assertEqual(DownloadHistory.objects.filter(book=self.book).count(), 1)
+
+        self.client.get(self.url, HTTP_RANGE='bytes=0-')
+        self.assertEqual(DownloadHistory.objects.filter(book=self.book).count(), 2)
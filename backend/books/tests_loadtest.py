@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase
+
+from benchmarks.loadtest import compare_reports, memory_mongo, percentile
+from books.services import content_store
+
+
+class MemoryMongoTests(SimpleTestCase):
+    def test_content_store_round_trip(self):
+        with memory_mongo():
+            content_store.save_book_content(3, {
+                'title': 'Stand-in',
+                'chapters': [{'number': n, 'title': f'Chapter {n}', 'content': 'Text. ' * 80} for n in (2, 1)],
+            }, '/tmp/book_3.pdf')
+            content_store.update_content_fields(3, final_pdf_path='books/book_3.pdf')
+
+            data = content_store.load_content_data(3)
+            fields = content_store.get_content_fields(3, 'final_pdf_path')
+
+        self.assertEqual([chapter['number'] for chapter in data['chapters']], [1, 2])
+        self.assertEqual(data['chapters'][0]['content'], 'Text. ' * 80)
+        self.assertEqual(fields['final_pdf_path'], 'books/book_3.pdf')
+
+
+class ReportTests(SimpleTestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_comparison_flags_regressions_in_the_right_direction(self):
+        baseline = {'books_per_minute': 100, 'stages': {'merge': {'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30}}}
+        current = {'books_per_minute': 80, 'stages': {'merge': {'p50_ms': 5, 'p95_ms': 20, 'p99_ms': 45}}}
+
+        rows = {row[0]: row for row in compare_reports(current, baseline, max_regression=10)}
+
+        self.assertEqual(rows['books_per_minute'][3], 20.0)
+        self.assertTrue(rows['books_per_minute'][4])
+        self.assertFalse(rows['stages.merge.p50_ms'][4])
+        self.assertTrue(rows['stages.merge.p99_ms'][4])
@@ -0,0 +1,194 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.utils.memory import MiB, StageMemory
+from backend.utils.metrics import DEAD_SNAPSHOT, REGISTRY, SNAPSHOT_PREFIX, Counter, Histogram, Registry
+from books import metrics
+from books.models import Book, Domain, Niche
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.metrics_dir = Path(tmp.name)
+        override = override_settings(METRICS_DIR=str(self.metrics_dir), METRICS_FLUSH_INTERVAL=3600)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.registry = Registry()
+        self.stage = Histogram('stage_seconds', 'Stage duration', ['stage'], buckets=(1, 5), registry=self.registry)
+        self.retries = Counter('retries_total', 'Retries', ['task'], registry=self.registry)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        for value in (0.5, 2, 7):
+            self.stage.observe(value, stage='outline')
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE stage_seconds histogram', text)
+        self.assertIn('stage_seconds_bucket{stage="outline",le="1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="outline",le="5"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="outline",le="+Inf"} 3', text)
+        self.assertIn('stage_seconds_sum{stage="outline"} 9.5', text)
+        self.assertIn('stage_seconds_count{stage="outline"} 3', text)
+
+    def test_snapshots_from_other_processes_are_merged(self):
+        self.retries.inc(task='merge')
+        # Any live process other than this one
+        (self.metrics_dir / f'{SNAPSHOT_PREFIX}{os.getppid()}.json').write_text(json.dumps({
+            'retries_total': [[{'task': 'merge'}, 2]],
+            'stage_seconds': [[{'stage': 'merge'}, {'buckets': [1, 0], 'sum': 0.5, 'count': 1}]],
+        }))
+
+        text = self.registry.render()
+
+        self.assertIn('retries_total{task="merge"} 3', text)
+        self.assertIn('stage_seconds_count{stage="merge"} 1', text)
+
+    def test_snapshots_of_dead_processes_are_folded_into_totals(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        stale = self.metrics_dir / f'{SNAPSHOT_PREFIX}{exited.pid}.json'
+        stale.write_text(json.dumps({
+            'retries_total': [[{'task': 'stale'}, 5]],
+            'stage_seconds': [[{'stage': 'stale'}, {'buckets': [1, 1], 'sum': 3.5, 'count': 2}]],
+        }))
+        live = self.metrics_dir / f'{SNAPSHOT_PREFIX}{os.getppid()}.json'
+        live.write_text(json.dumps({'retries_total': [[{'task': 'live'}, 1]]}))
+
+        before = self.registry.render()
+        self.assertFalse(stale.exists())
+        self.assertTrue(live.exists())
+
+        # The counters of the exited process stay in every later scrape
+        for text in (before, self.registry.render()):
+            self.assertIn('retries_total{task="stale"} 5', text)
+            self.assertIn('stage_seconds_count{stage="stale"} 2', text)
+            self.assertIn('stage_seconds_sum{stage="stale"} 3.5', text)
+            self.assertIn('retries_total{task="live"} 1', text)
+
+    def test_counters_do_not_go_down_when_a_process_exits(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # A worker child: counts, publishes, then retires
+                self.retries.inc(2, task='exit')
+                self.registry.flush()
+                self.registry.remove_snapshot()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.retries.inc(3, task='exit')
+
+        self.assertIn('retries_total{task="exit"} 5', self.registry.render())
+        self.assertEqual(list(self.metrics_dir.glob(f'{SNAPSHOT_PREFIX}{pid}.*')), [])
+
+    def test_own_snapshot_is_removed_on_exit(self):
+        self.retries.inc(task='exit')
+        self.registry.flush()
+        own = self.metrics_dir / f'{SNAPSHOT_PREFIX}{os.getpid()}.json'
+        self.assertTrue(own.exists())
+
+        self.registry.remove_snapshot()
+        # Once from atexit and once from the Celery signal still counts once
+        self.registry.remove_snapshot()
+        self.registry.flush()
+
+        self.assertFalse(own.exists())
+        dead = json.loads((self.metrics_dir / DEAD_SNAPSHOT).read_text())
+        self.assertEqual(dead['retries_total'], [[{'task': 'exit'}, 1]])
+
+    def test_timer_records_even_when_the_block_raises(self):
+        with self.assertRaises(RuntimeError):
+            with self.stage.time(stage='pdf_render'):
+                raise RuntimeError('boom')
+        self.assertIn('stage_seconds_count{stage="pdf_render"} 1', self.registry.render())
+
+
+def _series(metric, **labels):
+    return dict((tuple(sorted(l.items())), v) for l, v in metric.snapshot()).get(tuple(sorted(labels.items())))
+
+
+@override_settings(METRICS_DIR='')
+class StageMemoryTests(SimpleTestCase):
+    def setUp(self):
+        was_tracing = tracemalloc.is_tracing()
+        tracemalloc.start(1)
+        self.addCleanup(lambda: None if was_tracing else tracemalloc.stop())
+
+    def test_inner_stage_peak_counts_towards_the_outer_stage(self):
+        with StageMemory() as outer:
+            with StageMemory() as inner:
+                block = bytearray(8 * MiB)
+                del block
+
+        self.assertGreaterEqual(inner.alloc_peak, 8 * MiB)
+        self.assertGreaterEqual(outer.alloc_peak, inner.alloc_peak)
+
+    def test_track_stage_records_time_and_memory(self):
+        before = _series(metrics.STAGE_ALLOC_PEAK_BYTES, stage='test_stage')
+        with metrics.track_stage('test_stage'):
+            bytearray(2 * MiB)
+
+        after = _series(metrics.STAGE_ALLOC_PEAK_BYTES, stage='test_stage')
+        self.assertEqual(after['count'], (before or {'count': 0})['count'] + 1)
+        self.assertIsNotNone(_series(metrics.STAGE_RSS_GROWTH_BYTES, stage='test_stage'))
+        self.assertIsNotNone(_series(metrics.STAGE_SECONDS, stage='test_stage'))
+
+    def test_worker_over_budget_is_counted_and_logged(self):
+        recycled = _series(metrics.WORKER_RECYCLES) or 0
+
+        with self.settings(WORKER_MEMORY_BUDGET_MB=0):
+            metrics.record_worker_memory('books.tasks.create_final_book_pdf')
+        self.assertEqual(_series(metrics.WORKER_RECYCLES) or 0, recycled)
+
+        with self.settings(WORKER_MEMORY_BUDGET_MB=1), self.assertLogs('books.metrics', 'WARNING'):
+            metrics.record_worker_memory('books.tasks.create_final_book_pdf')
+        self.assertEqual(_series(metrics.WORKER_RECYCLES), recycled + 1)
+
+    def test_recycle_is_exported_after_the_child_exits(self):
+        from backend.celery import _record_worker_memory, _remove_metrics_snapshot
+
+        with tempfile.TemporaryDirectory() as metrics_dir, \
+                self.settings(METRICS_DIR=metrics_dir, WORKER_MEMORY_BUDGET_MB=1):
+            inherited = _series(metrics.WORKER_RECYCLES) or 0
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    # A prefork child's last task, then Celery retiring it
+                    with self.assertLogs('books.metrics', 'WARNING'):
+                        _record_worker_memory(sender=None)
+                    _remove_metrics_snapshot()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+
+            exported = REGISTRY.collect()['book_worker_recycles_total'][()]
+
+        # This process's count, plus the child's: what it forked with and its recycle
+        self.assertEqual(exported, inherited + inherited + 1)
+
+
+@override_settings(METRICS_DIR='', METRICS_TOKEN='secret')
+class MetricsEndpointTests(TestCase):
+    def test_requires_token_and_reports_books_in_flight(self):
+        user = User.objects.create_user('metrics', 'metrics@example.com', 'password123')
+        domain = Domain.objects.create(name='Tech', slug='tech')
+        niche = Niche.objects.create(domain=domain, name='Gadgets', slug='gadgets')
+        Book.objects.create(user=user, title='Busy', domain=domain, niche=niche, status='generating')
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('book_pipeline_books{status="generating"} 1', response.content.decode())
+        self.assertIn('# TYPE book_stage_seconds histogram', response.content.decode())
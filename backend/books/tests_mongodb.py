@@ -0,0 +1,71 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from backend.utils import mongodb
+from books.checks import check_mongodb_indexes
+
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self._indexes = indexes
+
+    def index_information(self):
+        return self._indexes
+
+
+@override_settings(MONGODB_URI='mongodb://127.0.0.1:1', MONGODB_DB_NAME='test_books')
+class MongoClientManagementTests(SimpleTestCase):
+    def setUp(self):
+        mongodb.reset_mongodb_client()
+        self.addCleanup(mongodb.reset_mongodb_client)
+
+    def test_client_is_reused_within_a_process(self):
+        first = mongodb.get_mongodb_client()
+        self.assertIs(first, mongodb.get_mongodb_client())
+
+    def test_client_is_rebuilt_after_fork(self):
+        first = mongodb.get_mongodb_client()
+        with mock.patch('backend.utils.mongodb.os.getpid', return_value=-1):
+            second = mongodb.get_mongodb_client()
+        self.assertIsNot(first, second)
+
+    @override_settings(MONGODB_MAX_POOL_SIZE=7, MONGODB_COMPRESSORS='zlib')
+    def test_pool_options_come_from_settings(self):
+        client = mongodb.get_mongodb_client()
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+        self.assertEqual(client.options.pool_options._compression_settings.compressors, ['zlib'])
+
+    def test_missing_indexes_reports_absent_and_non_unique(self):
+        db = {
+            'book_contents': FakeCollection({
+                '_id_': {'key': [('_id', 1)]},
+                'book_id_unique': {'key': [('book_id', 1)], 'unique': True},
+            }),
+            'book_generation_params': FakeCollection({
+                'book_id_unique': {'key': [('book_id', 1)]},
+            }),
+            'book_chapters': FakeCollection({
+                'book_id_number_unique': {'key': [('book_id', 1), ('number', 1)], 'unique': True},
+            }),
+            'book_profiles': FakeCollection({
+                'book_id_created_at': {'key': [('book_id', 1), ('created_at', -1)]},
+            }),
+        }
+        self.assertEqual(
+            mongodb.missing_indexes(db),
+            [('book_generation_params', 'book_id_unique')],
+        )
+
+
+class MongoIndexCheckTests(SimpleTestCase):
+    def test_skipped_unless_databases_are_checked(self):
+        with mock.patch('backend.utils.mongodb.missing_indexes') as missing:
+            self.assertEqual(check_mongodb_indexes(None), [])
+            self.assertEqual(check_mongodb_indexes(None, databases=None), [])
+        missing.assert_not_called()
+
+    def test_reports_missing_indexes_for_database_checks(self):
+        with mock.patch('backend.utils.mongodb.missing_indexes', return_value=[('book_contents', 'book_id_unique')]):
+            errors = check_mongodb_indexes(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['books.W002'])
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from books.models import Book, Domain, Niche
+from books.services import custom_llm_book_generator
+from books.services.custom_llm_book_generator import CustomLLMBookGenerator
+
+
+class PreviewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('writer', 'writer@example.com', 'password123')
+        domain = Domain.objects.create(name='Parenting', slug='parenting')
+        niche = Niche.objects.create(domain=domain, name='Toddler Sleep', slug='toddler_sleep')
+        cls.book = Book.objects.create(
+            user=cls.user, title='Generating...', domain=domain, niche=niche,
+            book_length='short', status='generating',
+        )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = Path(tmp.name)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, METRICS_DIR='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class PipelinePreviewTests(PreviewTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['outlines'].clear()
+        with mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            self.generator = CustomLLMBookGenerator()
+        # No MongoDB here; the book's own fields drive generation
+        patcher = mock.patch.object(self.generator, '_get_workflow_params', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The untrained local engine never reaches the quality gate; chapters
+        # pass it unless a test says otherwise
+        self.failing_attempts = 0
+        evaluate = custom_llm_book_generator.evaluate_section
+        self.evaluated = []
+
+        def evaluate_section(text):
+            self.evaluated.append(text)
+            diag = evaluate(text)
+            if len(self.evaluated) <= self.failing_attempts:
+                return dict(diag, score=50)
+            return dict(diag, score=90, has_min_structure=True)
+
+        patcher = mock.patch.object(custom_llm_book_generator, 'evaluate_section', side_effect=evaluate_section)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preview_is_published_after_the_first_chapter(self):
+        streamed = []
+        stream_chapter = self.generator.custom_llm.stream_chapter
+        publish_preview = self.generator.publish_preview
+
+        def record_stream(**kwargs):
+            streamed.append(kwargs['chapter_title'])
+            return stream_chapter(**kwargs)
+
+        def record_publish(book, outline, chapters_content):
+            self.chapters_streamed_at_preview = list(streamed)
+            return publish_preview(book, outline, chapters_content)
+
+        with mock.patch.object(self.generator.custom_llm, 'stream_chapter', side_effect=record_stream), \
+                mock.patch.object(self.generator, 'publish_preview', side_effect=record_publish):
+            content = self.generator.generate_book_content(self.book)
+
+        first_title = content['outline']['chapters'][0]['title']
+        self.assertTrue(self.chapters_streamed_at_preview)
+        self.assertEqual(set(self.chapters_streamed_at_preview), {first_title})
+        self.assertGreater(len(set(streamed)), 1)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.preview_pdf_path, f'books/book_{self.book.id}_preview.pdf')
+        self.assertEqual(self.book.title, content['title'])
+        preview = self.media_root / self.book.preview_pdf_path
+        self.assertTrue(preview.read_bytes().startswith(b'%PDF'))
+        self.assertEqual(self.book.preview_pdf_sha256, hashlib.sha256(preview.read_bytes()).hexdigest())
+        self.assertEqual(list(preview.parent.glob('*.partial')), [])
+
+    def test_preview_waits_for_a_chapter_that_passes_the_quality_gate(self):
+        # Both attempts at chapter 1 fail
+        self.failing_attempts = 2
+        previewed = []
+        publish_preview = self.generator.publish_preview
+
+        def record_publish(book, outline, chapters_content):
+            previewed.append([chapter['number'] for chapter in chapters_content])
+            return publish_preview(book, outline, chapters_content)
+
+        with mock.patch.object(self.generator, 'publish_preview', side_effect=record_publish):
+            self.generator.generate_book_content(self.book)
+
+        self.assertEqual(previewed, [[1, 2]])
+
+    def test_no_preview_when_no_chapter_passes(self):
+        self.failing_attempts = 1000
+        self.generator.generate_book_content(self.book)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.preview_pdf_path, '')
+
+    def test_preview_failure_does_not_fail_generation(self):
+        with mock.patch.object(self.generator.pdf_generator, 'create_preview_pdf', side_effect=OSError('disk full')), \
+                self.assertLogs('books.services.custom_llm_book_generator', 'WARNING'):
+            content = self.generator.generate_book_content(self.book)
+
+        self.assertGreaterEqual(len(content['chapters']), 6)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.preview_pdf_path, '')
+
+    def test_section_progress_writes_are_throttled(self):
+        pieces = []
+        stream_chapter = self.generator.custom_llm.stream_chapter
+
+        def record_stream(**kwargs):
+            for piece in stream_chapter(**kwargs):
+                pieces.append(piece)
+                yield piece
+
+        def section_writes():
+            return [q for q in queries.captured_queries if 'Writing chapter' in q['sql']]
+
+        with mock.patch.object(self.generator.custom_llm, 'stream_chapter', side_effect=record_stream):
+            with CaptureQueriesContext(connection) as queries:
+                self.generator.generate_book_content(self.book)
+            self.assertLess(len(section_writes()), len(pieces) / 2)
+
+            pieces.clear()
+            with mock.patch('books.services.custom_llm_book_generator.PROGRESS_WRITE_INTERVAL', 0), \
+                    CaptureQueriesContext(connection) as queries:
+                self.generator.generate_book_content(self.book)
+            self.assertEqual(len(section_writes()), len(pieces))
+
+
+class PreviewEndpointTests(PreviewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/books/{self.book.id}/preview/'
+
+    def test_not_found_until_published(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        status = self.client.get(f'/api/books/{self.book.id}/status/')
+        self.assertIsNone(status.data['preview_url'])
+
+    def test_serves_the_published_preview(self):
+        path = self.media_root / 'books' / f'book_{self.book.id}_preview.pdf'
+        path.parent.mkdir()
+        path.write_bytes(b'%PDF-1.4 preview')
+        Book.objects.filter(pk=self.book.pk).update(preview_pdf_path=f'books/{path.name}')
+
+        status = self.client.get(f'/api/books/{self.book.id}/status/')
+        self.assertEqual(status.data['preview_url'], self.url)
+        self.assertEqual(self.client.get(f'/api/books/{self.book.id}/').data['preview_url'], self.url)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 preview')
+
+    def test_polls_revalidate_and_resumes_do_not_mix_previews(self):
+        path = self.media_root / 'books' / f'book_{self.book.id}_preview.pdf'
+        path.parent.mkdir()
+        path.write_bytes(b'%PDF-1.4 first preview')
+        Book.objects.filter(pk=self.book.pk).update(preview_pdf_path=f'books/{path.name}')
+
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        self.assertEqual(etag, f'"{hashlib.sha256(b"%PDF-1.4 first preview").hexdigest()}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Regenerated: a new file with its own hash behind the same path
+        path.write_bytes(b'%PDF-1.4 second preview')
+        Book.objects.filter(pk=self.book.pk).update(
+            preview_pdf_sha256=hashlib.sha256(b'%PDF-1.4 second preview').hexdigest()
+        )
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        resumed = self.client.get(self.url, HTTP_RANGE='bytes=9-', HTTP_IF_RANGE=etag)
+        self.assertEqual(resumed.status_code, 200)
+        self.assertEqual(b''.join(resumed.streaming_content), b'%PDF-1.4 second preview')
+
+    def test_other_users_cannot_see_it(self):
+        Book.objects.filter(pk=self.book.pk).update(preview_pdf_path='books/anything.pdf')
+        other = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -0,0 +1,110 @@
+import pstats
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from celery.exceptions import Retry
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from benchmarks.loadtest import memory_mongo
+from books.models import Book, Domain, Niche
+from books.services import profiling
+
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+
+@profiling.profiled('fake_task')
+def fake_task(task, book_id, fail=None):
+    _busy(20000)
+    if fail:
+        raise fail
+    return 'done'
+
+
+@override_settings(METRICS_DIR='', TASK_PROFILING_BOOK_IDS=[], TASK_PROFILING_USER_IDS=[],
+                   TASK_PROFILING_SAMPLE_RATE=0.0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        mongo = memory_mongo()
+        self.db = mongo.__enter__()
+        self.addCleanup(mongo.__exit__, None, None, None)
+
+        self.user = User.objects.create_user('profiled', 'profiled@example.com', 'password123')
+        domain = Domain.objects.create(name='Tech', slug='tech')
+        niche = Niche.objects.create(domain=domain, name='Gadgets', slug='gadgets')
+        self.book = Book.objects.create(user=self.user, title='Slow', domain=domain, niche=niche)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(profiling.profiling_reason(self.book.id))
+        self.assertEqual(fake_task(None, self.book.id), 'done')
+        self.assertEqual(profiling.list_profiles(self.book.id), [])
+
+    def test_enabled_per_book_user_and_sample(self):
+        with self.settings(TASK_PROFILING_BOOK_IDS=[self.book.id]):
+            self.assertEqual(profiling.profiling_reason(self.book.id), 'book')
+        with self.settings(TASK_PROFILING_USER_IDS=[self.user.id]):
+            self.assertEqual(profiling.profiling_reason(self.book.id), 'user')
+        with self.settings(TASK_PROFILING_SAMPLE_RATE=1.0):
+            self.assertEqual(profiling.profiling_reason(self.book.id), 'sampled')
+
+        profiling.flag_book(self.book.id)
+        self.assertEqual(profiling.profiling_reason(self.book.id), 'book')
+
+    def test_flag_is_shared_across_processes_and_expires(self):
+        profiling.flag_book(self.book.id)
+
+        # A worker with its own per-process cache still sees the flag
+        other_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                   'LOCATION': 'another-worker'}}
+        with self.settings(CACHES=other_cache):
+            self.assertEqual(profiling.profiling_reason(self.book.id), 'book')
+
+        Book.objects.filter(id=self.book.id).update(profile_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(profiling.profiling_reason(self.book.id))
+
+    def test_profiled_run_stores_hotspots_and_raw_stats(self):
+        profiling.flag_book(self.book.id)
+
+        self.assertEqual(fake_task(None, self.book.id), 'done')
+        with self.assertRaises(Retry):
+            fake_task(None, self.book.id, fail=Retry())
+
+        profiles = profiling.list_profiles(self.book.id)
+        self.assertEqual({p['status'] for p in profiles}, {'ok', 'retry'})
+        self.assertNotIn('stats', profiles[0])
+        functions = [row['function'] for row in profiles[0]['hotspots']['cumulative']]
+        self.assertTrue(any(name.startswith('_busy ') for name in functions))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'task.prof'
+            path.write_bytes(profiling.profile_data(self.book.id, profiles[0]['_id']))
+            self.assertGreater(pstats.Stats(str(path)).total_calls, 0)
+
+    def test_admin_shows_hotspots_and_serves_download(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client.force_login(admin)
+        self.client.post('/admin/books/book/', {'action': 'profile_next_run', '_selected_action': [self.book.id]})
+        fake_task(None, self.book.id)
+
+        page = self.client.get(f'/admin/books/book/{self.book.id}/change/').content.decode()
+        self.assertIn('fake_task', page)
+        self.assertIn('_busy', page)
+
+        profile = profiling.list_profiles(self.book.id)[0]
+        download = self.client.get(f"/admin/books/book/{self.book.id}/profiles/{profile['_id']}.prof")
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download.content, profiling.profile_data(self.book.id, profile['_id']))
+
+        # Another book's URL does not reach this book's profile
+        other = Book.objects.create(user=self.user, title='Other', domain=self.book.domain, niche=self.book.niche)
+        self.assertIsNone(profiling.profile_data(other.id, profile['_id']))
+        mismatched = self.client.get(f"/admin/books/book/{other.id}/profiles/{profile['_id']}.prof")
+        self.assertEqual(mismatched.status_code, 404)
+        missing_book = self.client.get(f"/admin/books/book/999999/profiles/{profile['_id']}.prof")
+        self.assertEqual(missing_book.status_code, 404)
@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from backend.middleware import REFRESHED_AT_KEY
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', SESSION_REFRESH_INTERVAL=3600)
+class SlidingSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('poller', 'poller@example.com', 'password123')
+        self.client.force_login(self.user)
+
+    def _session_writes(self, path='/api/books/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            q['sql'] for q in queries.captured_queries
+            if 'django_session' in q['sql'] and not q['sql'].lstrip().upper().startswith('SELECT')
+        ]
+        return len(writes), response
+
+    def test_polling_does_not_write_the_session(self):
+        with mock.patch('backend.middleware.time.time', return_value=1_000_000):
+            self._session_writes()  # first request stamps the refresh time
+            for _ in range(3):
+                writes, response = self._session_writes()
+                self.assertEqual(writes, 0)
+                self.assertNotIn('sessionid', response.cookies)
+
+    def test_session_is_refreshed_after_the_interval(self):
+        with mock.patch('backend.middleware.time.time', return_value=1_000_000):
+            self._session_writes()
+        with mock.patch('backend.middleware.time.time', return_value=1_000_000 + 3600):
+            writes, response = self._session_writes()
+        self.assertGreater(writes, 0)
+        self.assertIn('sessionid', response.cookies)
+        self.assertEqual(self.client.session[REFRESHED_AT_KEY], 1_000_000 + 3600)
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# What a web process loads at startup: settings, apps and every URLconf view,
+# plus the task module the views enqueue into. The URLconf is imported with
+# a plain import statement because -X importtime doesn't report modules
+# loaded through importlib.import_module
+STARTUP_SCRIPT = """
+import django
+django.setup()
+import backend.urls
+import books.tasks
+"""
+
+# Only needed once a cover is rendered, a PDF merged or Stripe called
+DEFERRED_MODULES = ('matplotlib', 'PIL.Image', 'reportlab.platypus', 'reportlab.graphics', 'pypdf', 'stripe')
+
+# Cumulative microseconds for the URLconf; several times the current cost
+# so only an eager heavy import trips it
+URLCONF_BUDGET_US = 600_000
+
+
+def _import_times(script):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode:
+        raise AssertionError(proc.stderr[-2000:])
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_startup_defers_heavy_dependencies(self):
+        times = _import_times(STARTUP_SCRIPT)
+
+        self.assertEqual([module for module in DEFERRED_MODULES if module in times], [])
+        self.assertLess(times['backend.urls'], URLCONF_BUDGET_US)
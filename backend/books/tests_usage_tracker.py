@@ -0,0 +1,71 @@
+import json
+import multiprocessing
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from books.services.usage_tracker import UsageTracker
+
+
+def _record_many(data_dir, count):
+    tracker = UsageTracker(data_dir)
+    for _ in range(count):
+        tracker.record_usage(100, 50, model='test-model')
+
+
+class UsageLedgerTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_dir = Path(tmp.name)
+        self.tracker = UsageTracker(self.data_dir)
+
+    def test_appends_from_several_processes_are_all_counted(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_record_many, args=(self.data_dir, 50)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(self.tracker.compact(), 200)
+        stats = self.tracker.get_usage_stats()
+        self.assertEqual(stats['overall_totals']['total_tokens'], 200 * 150)
+        self.assertEqual(stats['efficiency_metrics']['total_operations'], 200)
+        self.assertFalse(self.tracker.ledger_file.exists())
+
+    def test_stats_include_events_not_yet_compacted(self):
+        self.tracker.record_usage(10, 5)
+        self.tracker.compact()
+        self.tracker.record_usage(20, 10, operation='outline')
+        self.tracker.record_cloudflare_usage('image_generation', 3)
+
+        stats = self.tracker.get_usage_stats()
+        self.assertEqual(stats['overall_totals']['total_tokens'], 45)
+        month = next(iter(stats['monthly_stats'].values()))
+        self.assertEqual(month['operations'], {'generation': 1, 'outline': 1})
+        self.assertEqual(stats['cloudflare_usage']['by_type']['image_generation']['count'], 3)
+
+    def test_recording_does_not_rewrite_the_summary(self):
+        self.tracker.record_usage(10, 5)
+        self.tracker.compact()
+        summary_mtime = self.tracker.usage_file.stat().st_mtime_ns
+
+        self.tracker.record_usage(10, 5)
+
+        self.assertEqual(self.tracker.usage_file.stat().st_mtime_ns, summary_mtime)
+        self.assertEqual(len(self.tracker.ledger_file.read_text().splitlines()), 1)
+
+    def test_legacy_summary_is_read_and_extended(self):
+        self.tracker.usage_file.write_text(json.dumps({
+            'total_tokens': 300, 'total_cost': 0.1, 'total_input_tokens': 200, 'total_output_tokens': 100,
+            'monthly_usage': {}, 'operations': [{}, {}, {}],
+        }))
+        self.tracker.record_usage(10, 5)
+        self.tracker.compact()
+
+        data = json.loads(self.tracker.usage_file.read_text())
+        self.assertEqual(data['total_tokens'], 315)
+        self.assertEqual(data['total_operations'], 4)
+        self.assertNotIn('operations', data)
@@ -3,7 +3,7 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.http import FileResponse, Http404
+from django.http import Http404
 from django.contrib.auth import authenticate, login, logout
 from django.utils import timezone
 from django.conf import settings
@@ -26,9 +26,10 @@ from .serializers import (
     CoverStyleSerializer
 )
 from .tasks import generate_book_content, generate_book_covers, create_final_book_pdf
-from .services.pdf_merger import PDFMerger
-from covers.services import CoverGeneratorProfessional
-from backend.utils.mongodb import get_mongodb_db
+from .catalog_cache import CatalogCacheMixin
+from .pagination import BookCursorPagination
+from .services.content_store import get_content_fields, load_content_data, update_content_fields
+from backend.utils.downloads import artifact_fingerprint, is_initial_request, serve_file
 
 
 @api_view(['POST'])
@@ -59,26 +60,29 @@ def create_guided_book(request):
     )
 
 
-class DomainViewSet(viewsets.ReadOnlyModelViewSet):
+class DomainViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for reading domains
     Returns all active domains ordered for dynamic frontend wizard
     """
     serializer_class = DomainSerializer
     permission_classes = [AllowAny]
+    # Public catalog: skip the session lookup so cache hits never touch the DB
+    authentication_classes = []
     
     def get_queryset(self):
         return Domain.objects.filter(is_active=True).order_by('order')
 
 
-class NicheViewSet(viewsets.ReadOnlyModelViewSet):
+class NicheViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for reading niches filtered by domain parameter."""
 
     serializer_class = NicheSerializer
     permission_classes = [AllowAny]
+    authentication_classes = []
 
     def get_queryset(self):
-        queryset = Niche.objects.filter(is_active=True)
+        queryset = Niche.objects.filter(is_active=True).select_related('domain')
         domain_param = self.request.query_params.get('domain_id') or self.request.query_params.get('domain')
 
         if domain_param:
@@ -93,13 +97,14 @@ class NicheViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset.order_by('order', 'name')
 
 
-class CoverStyleViewSet(viewsets.ReadOnlyModelViewSet):
+class CoverStyleViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for reading cover styles
     """
     queryset = CoverStyle.objects.filter(is_active=True)
     serializer_class = CoverStyleSerializer
     permission_classes = [AllowAny]
+    authentication_classes = []
 
 
 class BookViewSet(viewsets.ModelViewSet):
@@ -107,14 +112,27 @@ class BookViewSet(viewsets.ModelViewSet):
     ViewSet for managing books
     """
     permission_classes = [IsAuthenticated]
+    pagination_class = BookCursorPagination
     
     def get_serializer_class(self):
         if self.action == 'create':
             return BookCreateSerializer
         return BookSerializer
     
+    # Read-only actions whose responses are built from BookSerializer alone
+    SERIALIZE_ACTIONS = ('list', 'retrieve', 'history')
+    
     def get_queryset(self):
-        return Book.objects.filter(user=self.request.user)
+        queryset = Book.objects.filter(user=self.request.user)
+        if self.action in self.SERIALIZE_ACTIONS:
+            # BookSerializer reads domain/niche/cover_style/user and every
+            # cover; load them with the page instead of per book. Actions
+            # that change covers skip the prefetch so they never serialize
+            # a stale cover list.
+            queryset = queryset.select_related(
+                'domain', 'niche', 'cover_style', 'user'
+            ).prefetch_related('covers')
+        return queryset
     
     def create(self, request, *args, **kwargs):
         """
@@ -279,8 +297,7 @@ class BookViewSet(viewsets.ModelViewSet):
         
         try:
             # Get final PDF path from MongoDB
-            db = get_mongodb_db()
-            content_doc = db.book_contents.find_one({'book_id': book.id})
+            content_doc = get_content_fields(book.id, 'final_pdf_path', 'final_pdf_sha256')
             
             if not content_doc:
                 return Response(
@@ -295,26 +312,33 @@ class BookViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Check if file exists
-            from pathlib import Path
-            from django.conf import settings
             pdf_path = Path(settings.MEDIA_ROOT) / final_pdf_path
-            if not pdf_path.exists():
+            if not pdf_path.is_file():
                 return Response(
                     {'error': 'PDF file not found on server'},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Record download for analytics
-            book.record_download(request)
+            # Books merged before hashes were recorded get one on first download
+            sha256 = content_doc.get('final_pdf_sha256')
+            if not sha256:
+                fingerprint = artifact_fingerprint(pdf_path)
+                sha256 = fingerprint['sha256']
+                update_content_fields(book.id, final_pdf_sha256=sha256, final_pdf_size=fingerprint['size'])
             
-            # Return file response
-            response = FileResponse(
-                open(pdf_path, 'rb'),
+            response = serve_file(
+                request,
+                pdf_path,
+                filename=f"{book.title}.pdf",
                 content_type='application/pdf',
-                filename=f"{book.title}.pdf"
+                etag_hash=sha256,
             )
-            response['Content-Disposition'] = f'attachment; filename="{book.title}.pdf"'
+            
+            # Record download for analytics: once per download, not per
+            # resumed range or revalidation. Proxy modes answer 200 even for
+            # ranges, so the request decides rather than the status
+            if is_initial_request(request) and response.status_code in (200, 206):
+                book.record_download(request)
             
             return response
             
@@ -325,14 +349,49 @@ class BookViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """
+        Download the interior preview (title page, contents, first chapter),
+        published while the rest of the book is still being generated
+        """
+        book = self.get_object()
+        
+        if not book.preview_pdf_path:
+            return Response(
+                {'error': 'Preview is not ready yet. It is published once the first chapter is written.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        pdf_path = Path(settings.MEDIA_ROOT) / book.preview_pdf_path
+        if not pdf_path.is_file():
+            return Response(
+                {'error': 'Preview file not found on server'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Replaced when the book is regenerated; the ETag lets pollers get a
+        # 304 and keeps If-Range resumes from mixing two previews. Previews
+        # published before hashes were recorded get one on first download
+        sha256 = book.preview_pdf_sha256
+        if not sha256:
+            sha256 = artifact_fingerprint(pdf_path)['sha256']
+            Book.objects.filter(pk=book.pk, preview_pdf_sha256='').update(preview_pdf_sha256=sha256)
+        return serve_file(
+            request,
+            pdf_path,
+            filename=f"{book.title} (preview).pdf",
+            content_type='application/pdf',
+            etag_hash=sha256,
+        )
+    
     def _create_final_pdf(self, book):
         """
         Merge cover + interior into final downloadable PDF
         """
         try:
             # Get interior PDF path from MongoDB
-            db = get_mongodb_db()
-            content_doc = db.book_contents.find_one({'book_id': book.id})
+            content_doc = get_content_fields(book.id, 'interior_pdf_path')
             
             if not content_doc:
                 print(f"No content found for book {book.id} in MongoDB")
@@ -340,7 +399,7 @@ class BookViewSet(viewsets.ModelViewSet):
                 print(f"Attempting to regenerate content for book {book.id}")
                 self._generate_book_content(book)
                 # Try to fetch again
-                content_doc = db.book_contents.find_one({'book_id': book.id})
+                content_doc = get_content_fields(book.id, 'interior_pdf_path')
                 if not content_doc:
                     raise Exception("Book content could not be generated")
             
@@ -355,17 +414,16 @@ class BookViewSet(viewsets.ModelViewSet):
                 from books.services.custom_llm_book_generator import CustomLLMBookGenerator
 
                 generator = CustomLLMBookGenerator()
-                content_data = content_doc.get('content', {})
+                content_data = load_content_data(book.id)
                 if content_data:
                     interior_pdf_path = generator.create_pdf(book, content_data)
-                    db.book_contents.update_one(
-                        {'book_id': book.id},
-                        {'$set': {'interior_pdf_path': interior_pdf_path}}
-                    )
+                    update_content_fields(book.id, interior_pdf_path=interior_pdf_path)
                 else:
                     raise Exception("No content data available to regenerate PDF")
             
             # Merge with selected cover
+            from .services.pdf_merger import PDFMerger
+
             merger = PDFMerger()
             final_pdf_path = merger.merge_book(
                 book, 
@@ -374,9 +432,12 @@ class BookViewSet(viewsets.ModelViewSet):
             )
             
             # Update MongoDB with final path
-            db.book_contents.update_one(
-                {'book_id': book.id},
-                {'$set': {'final_pdf_path': final_pdf_path}}
+            fingerprint = artifact_fingerprint(Path(settings.MEDIA_ROOT) / final_pdf_path)
+            update_content_fields(
+                book.id,
+                final_pdf_path=final_pdf_path,
+                final_pdf_sha256=fingerprint['sha256'],
+                final_pdf_size=fingerprint['size'],
             )
             
             # Update book model
@@ -398,9 +459,11 @@ class BookViewSet(viewsets.ModelViewSet):
         """
         book = self.get_object()
         
-        # Reset book status
+        # Reset book status; the old preview no longer matches what is generated
         book.status = 'draft'
         book.error_message = None
+        book.preview_pdf_path = ''
+        book.preview_pdf_sha256 = ''
         book.save()
         
         # Delete old covers
@@ -416,9 +479,9 @@ class BookViewSet(viewsets.ModelViewSet):
         """
         Get user's book history
         """
-        books = self.get_queryset()
+        books = self.paginate_queryset(self.get_queryset())
         serializer = self.get_serializer(books, many=True)
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['delete'])
     def clear_history(self, request):
@@ -0,0 +1,60 @@
+"""
+Run a local stand-in for the Cloudflare Workers AI API
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customllm.stand_in import StandInConfig, StandInServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the Workers AI text, streaming and image endpoints locally with configurable '
+        'latency, errors and 429s; point CLOUDFLARE_API_BASE_URL at it'
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8787)
+        parser.add_argument('--latency-ms', type=float, default=200.0, help='Mean time to first byte')
+        parser.add_argument('--latency-jitter-ms', type=float, default=50.0,
+                            help='Spread: half-range (uniform) or standard deviation (normal, lognormal)')
+        parser.add_argument('--latency-distribution', default='normal',
+                            choices=['fixed', 'uniform', 'normal', 'lognormal'])
+        parser.add_argument('--token-delay-ms', type=float, default=5.0, help='Delay between streamed pieces')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered 5xx')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered 429')
+        parser.add_argument('--rpm', type=float, default=0.0,
+                            help='Per-model requests a minute before answering 429 (0 = unlimited)')
+        parser.add_argument('--seed', type=int, default=None, help='Make latency and failures reproducible')
+
+    def handle(self, *args, **options):
+        if options['error_rate'] + options['throttle_rate'] > 1:
+            raise CommandError('--error-rate and --throttle-rate add up to more than 1')
+        config = StandInConfig(
+            latency_ms=options['latency_ms'],
+            latency_jitter_ms=options['latency_jitter_ms'],
+            latency_distribution=options['latency_distribution'],
+            token_delay_ms=options['token_delay_ms'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            rpm=options['rpm'],
+            seed=options['seed'],
+        )
+        try:
+            server = StandInServer((options['host'], options['port']), config)
+        except OSError as exc:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f'Cloudflare stand-in listening on {server.url}'))
+        self.stdout.write(f'  export CLOUDFLARE_API_BASE_URL={server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(json.dumps(server.stats(), indent=2))
@@ -0,0 +1,44 @@
+"""
+Report on (or empty) the Cloudflare response cache
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from customllm.services import response_cache
+
+
+class Command(BaseCommand):
+    help = 'Show the Cloudflare response cache hit ratio and bytes saved, or clear it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Delete every cached response')
+        parser.add_argument('--json', action='store_true', help='Print the stats as JSON')
+
+    def handle(self, *args, **options):
+        backend = response_cache.get_cache()
+        if backend is None:
+            self.stdout.write(self.style.WARNING('The response cache is disabled (LLM_CACHE_BACKEND is empty)'))
+            return
+
+        if options['clear']:
+            backend.clear()
+            self.stdout.write(self.style.SUCCESS('Response cache cleared'))
+            return
+
+        stats = response_cache.cache_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        usage = stats['usage']
+        self.stdout.write(
+            f"{stats['backend']} cache: {usage['entries']} entries, {usage['bytes'] / 1024 / 1024:.1f} MB"
+        )
+        self.stdout.write(f"{'operation':<18}{'hits':>8}{'misses':>8}{'bypass':>8}{'hit ratio':>11}{'saved MB':>10}")
+        for operation, counts in sorted(stats['operations'].items()):
+            self.stdout.write(
+                f"{operation:<18}{counts['hit']:>8}{counts['miss']:>8}{counts['bypass']:>8}"
+                f"{counts['hit_ratio']:>11.1%}{counts['bytes_saved'] / 1024 / 1024:>10.2f}"
+            )
@@ -3,14 +3,133 @@ Cloudflare Workers AI Client
 Handles communication with Cloudflare's AI platform for custom model inference
 """
 
+import asyncio
 import os
+import random
 import requests
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Optional, Any
 import json
 
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from books.metrics import CLOUDFLARE_RETRIES, CLOUDFLARE_SECONDS
+
+from . import rate_limiter, response_cache
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_API_BASE_URL = 'https://api.cloudflare.com/client/v4'
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Responses no retry or fallback will fix for the next request either:
+# bad credentials or an unknown model
+FATAL_STATUSES = (401, 403, 404)
+
+
+class CloudflareFatalError(Exception):
+    """The API rejected the account or model; every further call would fail too."""
+
+# One pooled, keep-alive session per process. Like the MongoDB client it
+# is rebuilt after a fork so prefork children never share sockets.
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class _CountingRetry(Retry):
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        reason = str(response.status) if response is not None else type(error).__name__
+        # Raises once retries are exhausted, so only retries that happen are counted
+        retry = super().increment(method, url, response, error, *args, **kwargs)
+        CLOUDFLARE_RETRIES.inc(reason=reason)
+        return retry
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """
+    Seconds before retry ``attempt + 1``: backoff * 2**attempt plus up to
+    ``backoff`` of jitter, so workers throttled together don't retry in
+    lockstep, and never less than the server's Retry-After.
+    """
+    backoff = getattr(settings, 'CLOUDFLARE_RETRY_BACKOFF', 0.5)
+    delay = backoff * 2 ** attempt + random.uniform(0, backoff)
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, int(retry_after))
+    return delay
+
+
+def _build_session() -> requests.Session:
+    retries = getattr(settings, 'CLOUDFLARE_MAX_RETRIES', 3)
+    backoff = getattr(settings, 'CLOUDFLARE_RETRY_BACKOFF', 0.5)
+    # Only connection failures are retried here: they never reach the
+    # provider. RETRY_STATUSES are retried by CloudflareAIClient._open so
+    # that every request that does reach it takes a rate-limit token.
+    retry = _CountingRetry(
+        total=retries,
+        connect=retries,
+        # A read timeout means the model may still be working; retrying
+        # would pay for the generation twice
+        read=0,
+        status=0,
+        allowed_methods=frozenset({'GET', 'POST'}),
+        backoff_factor=backoff,
+        backoff_jitter=backoff,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    pool_size = getattr(settings, 'CLOUDFLARE_POOL_SIZE', 10)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def reset_session() -> None:
+    """Drop the shared session; the next call builds one from current settings."""
+    global _session, _session_pid
+    _session = None
+    _session_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_session)
+
+
+def _stream_text(line: str) -> Optional[str]:
+    """
+    The text in one line of a streamed response. Workers AI streams
+    server-sent events (``data: {"response": ...}`` and a final
+    ``data: [DONE]``); bare JSON lines are accepted too.
+    """
+    if line.startswith('data:'):
+        line = line[5:].strip()
+    if not line or line == '[DONE]':
+        return None
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return data.get('response') if isinstance(data, dict) else None
+
 
 class CloudflareAIClient:
     """
@@ -22,15 +141,66 @@ class CloudflareAIClient:
         self.api_key = os.getenv('CLOUDFLARE_API_TOKEN')
         self.account_id = os.getenv('CLOUDFLARE_ACCOUNT_ID')
         self.custom_model_id = os.getenv('CUSTOM_MODEL_ID', '@cf/meta/llama-3.1-8b-instruct')
+        api_base_url = (getattr(settings, 'CLOUDFLARE_API_BASE_URL', '') or DEFAULT_API_BASE_URL).rstrip('/')
+
+        if api_base_url != DEFAULT_API_BASE_URL:
+            # A local stand-in (manage.py cloudflare_stand_in) takes any credentials
+            self.api_key = self.api_key or 'stand-in'
+            self.account_id = self.account_id or 'stand-in'
         
         if not self.api_key or not self.account_id:
             raise ValueError("CLOUDFLARE_API_TOKEN and CLOUDFLARE_ACCOUNT_ID must be set in environment variables")
         
-        self.base_url = f"https://api.cloudflare.com/client/v4/accounts/{self.account_id}/ai/run"
+        self.api_root = f"{api_base_url}/accounts/{self.account_id}/ai"
+        self.base_url = f"{self.api_root}/run"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+
+    @contextmanager
+    def _open(self, operation: str, model: Optional[str], method: str, url: str,
+              **kwargs) -> Iterator[requests.Response]:
+        """
+        Send through the shared session, retrying RETRY_STATUSES, and
+        record the latency. Each attempt takes its own rate-limit token and
+        slot for ``model`` (None for calls outside the limits); the slot of
+        the response handed out is held, and the response left open, until
+        the block exits.
+        """
+        retries = getattr(settings, 'CLOUDFLARE_MAX_RETRIES', 3)
+        start_time = time.perf_counter()
+        outcome = 'error'
+        try:
+            for attempt in range(retries + 1):
+                with ExitStack() as stack:
+                    if model:
+                        stack.enter_context(rate_limiter.limit('cloudflare', model))
+                    response = get_session().request(method, url, headers=self.headers, **kwargs)
+                    if kwargs.get('stream'):
+                        # Hands the connection back to the pool; unstreamed
+                        # responses have done so already
+                        stack.callback(response.close)
+                    outcome = str(response.status_code)
+                    if response.status_code not in RETRY_STATUSES or attempt == retries:
+                        CLOUDFLARE_SECONDS.observe(
+                            time.perf_counter() - start_time, operation=operation, outcome=outcome,
+                        )
+                        outcome = None
+                        yield response
+                        return
+                    retry_after = response.headers.get('Retry-After')
+                CLOUDFLARE_RETRIES.inc(reason=outcome)
+                time.sleep(_retry_delay(attempt, retry_after))
+        finally:
+            if outcome is not None:
+                CLOUDFLARE_SECONDS.observe(time.perf_counter() - start_time, operation=operation, outcome=outcome)
+
+    def _request(self, operation: str, model: Optional[str], method: str, url: str,
+                 **kwargs) -> requests.Response:
+        """``_open`` for a response read in full."""
+        with self._open(operation, model, method, url, **kwargs) as response:
+            return response
     
     def call_model(
         self,
@@ -38,6 +208,7 @@ class CloudflareAIClient:
         model: Optional[str] = None,
         max_tokens: int = 2000,
         temperature: float = 0.7,
+        cache: bool = True,
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -48,10 +219,13 @@ class CloudflareAIClient:
             model: Model identifier (uses custom model by default)
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature (0-1)
+            cache: Serve an identical earlier request from the response
+                cache; pass False when a fresh sample is wanted
             **kwargs: Additional model-specific parameters
         
         Returns:
-            Dict containing model response and metadata
+            Dict containing model response and metadata (``cached`` is
+            True when it came from the response cache)
         """
         model_to_use = model or self.custom_model_id
         url = f"{self.base_url}/{model_to_use}"
@@ -64,30 +238,44 @@ class CloudflareAIClient:
             "temperature": temperature,
             **kwargs
         }
+
+        key = response_cache.cache_key(
+            'call_model', model_to_use, prompt, {"max_tokens": max_tokens, "temperature": temperature, **kwargs},
+        )
+        cached = response_cache.lookup('call_model', key, cache)
+        if cached is not None:
+            entry = json.loads(cached)
+            logger.info(f"Model call served from cache: {model_to_use}")
+            return {
+                "success": True,
+                "response": entry["response"],
+                "model": model_to_use,
+                "elapsed_time": 0.0,
+                "tokens": entry["tokens"],
+                "cached": True,
+            }
         
         try:
             logger.info(f"Calling Cloudflare model: {model_to_use}")
             start_time = time.time()
             
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
+            response = self._request('call_model', model_to_use, 'POST', url, json=payload, timeout=60)
             
             elapsed_time = time.time() - start_time
             
             if response.status_code == 200:
                 result = response.json()
                 logger.info(f"Model call successful in {elapsed_time:.2f}s")
+                text = result.get("result", {}).get("response", "")
+                tokens = result.get("result", {}).get("tokens_used", 0)
+                response_cache.store(key, json.dumps({"response": text, "tokens": tokens}).encode(), cache)
                 
                 return {
                     "success": True,
-                    "response": result.get("result", {}).get("response", ""),
+                    "response": text,
                     "model": model_to_use,
                     "elapsed_time": elapsed_time,
-                    "tokens": result.get("result", {}).get("tokens_used", 0)
+                    "tokens": tokens
                 }
             else:
                 logger.error(f"Cloudflare API error: {response.status_code} - {response.text}")
@@ -112,6 +300,93 @@ class CloudflareAIClient:
                 "model": model_to_use
             }
     
+    def async_http(self, concurrency: int = 4):
+        """
+        An ``httpx.AsyncClient`` for ``acall_model``, keeping up to
+        ``concurrency`` connections alive. ``async_transport`` lets tests
+        swap the network for an ``httpx.MockTransport``.
+        """
+        import httpx
+
+        return httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=httpx.Timeout(60, connect=10),
+            transport=getattr(self, 'async_transport', None),
+        )
+
+    async def acall_model(
+        self,
+        http,
+        prompt: str,
+        model: Optional[str] = None,
+        max_tokens: int = 2000,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        ``call_model`` on an ``async_http()`` client, with the same retry
+        policy as the pooled session. Raises ``CloudflareFatalError`` for
+        FATAL_STATUSES; other failures come back as ``success: False``.
+        """
+        import httpx
+
+        model_to_use = model or self.custom_model_id
+        url = f"{self.base_url}/{model_to_use}"
+        payload = {
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **kwargs
+        }
+        retries = getattr(settings, 'CLOUDFLARE_MAX_RETRIES', 3)
+
+        start_time = time.perf_counter()
+        outcome = 'error'
+        try:
+            for attempt in range(retries + 1):
+                retry_after = None
+                try:
+                    # Every attempt is a request against the provider's limit
+                    async with rate_limiter.alimit('cloudflare', model_to_use):
+                        response = await http.post(url, json=payload)
+                except rate_limiter.RateLimitExceeded as exc:
+                    logger.warning(f"Cloudflare call not sent: {exc}")
+                    return {"success": False, "error": str(exc), "model": model_to_use}
+                except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                    error, reason = f"Connection failed: {exc}", type(exc).__name__
+                except httpx.TimeoutException:
+                    # As in the session: the model may still be generating
+                    return {"success": False, "error": "Request timeout", "model": model_to_use}
+                else:
+                    outcome = str(response.status_code)
+                    if response.status_code == 200:
+                        result = response.json().get("result", {})
+                        return {
+                            "success": True,
+                            "response": result.get("response", ""),
+                            "model": model_to_use,
+                            "elapsed_time": time.perf_counter() - start_time,
+                            "tokens": result.get("tokens_used", 0)
+                        }
+                    error = f"HTTP {response.status_code}: {response.text}"
+                    if response.status_code in FATAL_STATUSES:
+                        raise CloudflareFatalError(error)
+                    if response.status_code not in RETRY_STATUSES:
+                        break
+                    reason = outcome
+                    retry_after = response.headers.get('Retry-After')
+
+                if attempt == retries:
+                    break
+                CLOUDFLARE_RETRIES.inc(reason=reason)
+                await asyncio.sleep(_retry_delay(attempt, retry_after))
+
+            logger.error(f"Cloudflare API error: {error}")
+            return {"success": False, "error": error, "model": model_to_use}
+        finally:
+            CLOUDFLARE_SECONDS.observe(time.perf_counter() - start_time, operation='acall_model', outcome=outcome)
+
     def generate_text_stream(
         self,
         prompt: str,
@@ -139,33 +414,65 @@ class CloudflareAIClient:
         }
         
         try:
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                stream=True,
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line.decode('utf-8'))
-                            if 'response' in data:
-                                yield data['response']
-                        except json.JSONDecodeError:
-                            continue
-            else:
-                logger.error(f"Stream generation failed: {response.status_code}")
+            # Closing the response hands the connection back to the pool;
+            # the concurrency slot is held until then too
+            with self._open('generate_text_stream', model_to_use, 'POST', url,
+                            json=payload, stream=True, timeout=120) as response:
+                if response.status_code == 200:
+                    for line in response.iter_lines():
+                        text = _stream_text(line.decode('utf-8'))
+                        if text:
+                            yield text
+                else:
+                    logger.error(f"Stream generation failed: {response.status_code}")
                 
         except Exception as e:
             logger.error(f"Stream generation error: {str(e)}")
     
+    async def astream_text(self, http, prompt: str, model: Optional[str] = None, **kwargs):
+        """
+        ``generate_text_stream`` on an ``async_http()`` client. Raises
+        ``CloudflareFatalError`` for FATAL_STATUSES; any other failure is
+        logged and ends the stream.
+        """
+        import httpx
+
+        model_to_use = model or self.custom_model_id
+        url = f"{self.base_url}/{model_to_use}"
+        payload = {
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            **kwargs
+        }
+
+        start_time = time.perf_counter()
+        outcome = 'error'
+        try:
+            async with rate_limiter.alimit('cloudflare', model_to_use), \
+                    http.stream('POST', url, json=payload, timeout=httpx.Timeout(120, connect=10)) as response:
+                outcome = str(response.status_code)
+                if response.status_code in FATAL_STATUSES:
+                    await response.aread()
+                    raise CloudflareFatalError(f"HTTP {response.status_code}: {response.text}")
+                if response.status_code != 200:
+                    logger.error(f"Stream generation failed: {response.status_code}")
+                    return
+                async for line in response.aiter_lines():
+                    text = _stream_text(line)
+                    if text:
+                        yield text
+        except rate_limiter.RateLimitExceeded as e:
+            logger.warning(f"Stream not started: {e}")
+        except httpx.HTTPError as e:
+            logger.error(f"Stream generation error: {str(e)}")
+        finally:
+            CLOUDFLARE_SECONDS.observe(time.perf_counter() - start_time, operation='astream_text', outcome=outcome)
+
     def generate_image(
         self,
         prompt: str,
         model: str = "@cf/stabilityai/stable-diffusion-xl-base-1.0",
+        cache: bool = True,
         **kwargs
     ) -> Optional[bytes]:
         """
@@ -174,6 +481,7 @@ class CloudflareAIClient:
         Args:
             prompt: Image description prompt
             model: Image generation model
+            cache: Serve an identical earlier request from the response cache
             **kwargs: Additional parameters (width, height, steps, etc.)
         
         Returns:
@@ -185,19 +493,21 @@ class CloudflareAIClient:
             "prompt": prompt,
             **kwargs
         }
+
+        key = response_cache.cache_key('generate_image', model, prompt, kwargs)
+        cached = response_cache.lookup('generate_image', key, cache)
+        if cached is not None:
+            logger.info(f"Image served from cache: {model}")
+            return cached
         
         try:
             logger.info(f"Generating image with Cloudflare: {model}")
             
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
+            response = self._request('generate_image', model, 'POST', url, json=payload, timeout=60)
             
             if response.status_code == 200:
                 logger.info("Image generated successfully")
+                response_cache.store(key, response.content, cache)
                 return response.content
             else:
                 logger.error(f"Image generation failed: {response.status_code}")
@@ -214,10 +524,10 @@ class CloudflareAIClient:
         Returns:
             List of model identifiers
         """
-        url = f"https://api.cloudflare.com/client/v4/accounts/{self.account_id}/ai/models"
+        url = f"{self.api_root}/models"
         
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self._request('get_available_models', None, 'GET', url, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -5,10 +5,11 @@ Unlimited generation capacity for the 3 trained domains
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional
 from customllm.services.local_llm_engine import LocalLLMEngine
 from customllm.services.cloudflare_client import CloudflareAIClient
-from backend.utils.mongodb import get_mongodb_db
+from customllm.services import outline_cache
+from books.services import content_store
 
 logger = logging.getLogger(__name__)
 
@@ -63,12 +64,27 @@ class CustomBookGenerator:
             if not self.is_domain_supported(domain):
                 logger.warning("Domain %s not in trained set; using fallback outline generator", domain)
             
-            # Generate outline using local LLM
-            result = self.llm.generate_outline(
-                domain=domain,
-                niche=book_context.get('niche', 'General'),
-                target_audience=book_context.get('audience', 'professionals'),
-                page_count=book_context.get('page_count', 30)
+            niche = book_context.get('niche', 'General')
+            audience = book_context.get('audience', 'professionals')
+            page_count = book_context.get('page_count', 30)
+
+            # Generate outline using local LLM, or reuse one generated for the same parameters
+            result = outline_cache.get_or_generate(
+                'local',
+                {
+                    'domain': domain,
+                    'niche': niche,
+                    'audience': audience,
+                    'page_count': page_count,
+                    'niche_content_skeleton': book_context.get('niche_content_skeleton'),
+                    'custom_outline_instructions': book_context.get('custom_outline_instructions'),
+                },
+                lambda: self.llm.generate_outline(
+                    domain=domain,
+                    niche=niche,
+                    target_audience=audience,
+                    page_count=page_count
+                ),
             )
             
             logger.info(f"✅ Outline generated: {result.get('chapters', 0)} chapters")
@@ -120,6 +136,37 @@ class CustomBookGenerator:
             logger.error(f"❌ Chapter generation failed: {str(e)}")
             raise
     
+    def stream_chapter(
+        self,
+        chapter_title: str,
+        chapter_outline: str,
+        book_context: Dict[str, Any],
+        word_count: int = 500,
+        subtopics: Optional[list] = None
+    ) -> Iterator[str]:
+        """
+        Generate chapter content with the local LLM, yielding the
+        introduction and each subsection as soon as it is written
+        
+        Args:
+            chapter_title: Chapter title
+            chapter_outline: Brief outline
+            book_context: Book metadata
+            word_count: Target word count
+        
+        Yields:
+            Pieces of chapter text; joined they are ``generate_chapter``'s content
+        """
+        logger.info(f"✍️ Streaming chapter '{chapter_title}' with Custom LLM")
+        
+        yield from self.llm.stream_chapter_content(
+            chapter_title=chapter_title,
+            chapter_outline=chapter_outline,
+            book_context=book_context,
+            word_count=word_count,
+            subtopics=subtopics
+        )
+    
     def generate_cover_image(self, book_context: Dict[str, Any]) -> Optional[bytes]:
         """
         Generate cover image using Cloudflare AI
@@ -187,22 +234,15 @@ class CustomBookGenerator:
             MongoDB document ID
         """
         try:
-            db = get_mongodb_db()
-            collection = db['book_contents']
-            
-            document = {
-                'book_id': book_id,
-                'outline': content_data.get('outline', {}),
-                'chapters': content_data.get('chapters', []),
-                'metadata': content_data.get('metadata', {}),
-                'generated_with': 'custom_local_llm',
-                'api_calls_used': 1 if content_data.get('cover_image') else 0  # Only Cloudflare for image
-            }
-            
-            result = collection.insert_one(document)
-            logger.info(f"✅ Book content saved to MongoDB: {result.inserted_id}")
-            
-            return str(result.inserted_id)
+            mongodb_id = content_store.save_book_content(
+                book_id,
+                content_data,
+                generated_with='custom_local_llm',
+                api_calls_used=1 if content_data.get('cover_image') else 0,  # Only Cloudflare for image
+            )
+            logger.info(f"✅ Book content saved to MongoDB: {mongodb_id}")
+            
+            return mongodb_id
             
         except Exception as e:
             logger.error(f"❌ Failed to save book content: {str(e)}")
@@ -6,8 +6,9 @@ Generates unlimited content for the 3 trained domains
 
 import random
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from django.core.cache import cache
+from books.metrics import LLM_FALLBACKS
 from customllm.models import TrainingDomain, TrainingNiche, TrainingSample
 
 logger = logging.getLogger(__name__)
@@ -146,6 +147,7 @@ class LocalLLMEngine:
         
         if not samples:
             logger.warning(f"No training data for domain: {domain_slug}")
+            LLM_FALLBACKS.inc(kind='outline', domain=domain_slug)
             fallback = self._generate_fallback_outline(domain, niche, chapter_count, target_audience)
             return {
                 'outline': fallback,
@@ -204,6 +206,50 @@ class LocalLLMEngine:
         Returns:
             Dict with chapter content
         """
+        domain_slug = self._get_domain_slug(book_context.get('domain', 'AI & Automation'))
+        content = "".join(self.stream_chapter_content(
+            chapter_title,
+            chapter_outline,
+            book_context,
+            word_count=word_count,
+            subtopics=subtopics
+        ))
+        
+        if not self.training_data.get(domain_slug, {}).get('chapter', []):
+            return {
+                'content': content,
+                'word_count': len(content.split()),
+                'metadata': {
+                    'domain': domain_slug,
+                    'niche': book_context.get('niche', 'General'),
+                    'generated_by': 'contextual_fallback'
+                }
+            }
+        
+        return {
+            'content': content,
+            'word_count': len(content.split()),
+            'metadata': {
+                'model': 'custom_local_llm',
+                'domain': domain_slug,
+                'trained': True,
+                'elapsed_time': 0.2
+            }
+        }
+    
+    def stream_chapter_content(
+        self,
+        chapter_title: str,
+        chapter_outline: str,
+        book_context: Dict[str, Any],
+        word_count: int = 500,
+        subtopics: Optional[list] = None
+    ) -> Iterator[str]:
+        """
+        Generate chapter content one piece at a time: the introduction,
+        then each subsection as it is written, then the conclusion.
+        Joining the pieces gives ``generate_chapter_content``'s content.
+        """
         domain = book_context.get('domain', 'AI & Automation')
         domain_slug = self._get_domain_slug(domain)
         niche = book_context.get('niche', 'General')
@@ -213,13 +259,15 @@ class LocalLLMEngine:
         
         if not samples:
             logger.warning(f"No chapter training data for domain: {domain_slug}, using contextual fallback")
-            return self._generate_fallback_chapter(
+            LLM_FALLBACKS.inc(kind='chapter', domain=domain_slug)
+            yield from self._iter_fallback_chapter(
                 chapter_title, 
                 chapter_outline, 
                 word_count,
                 domain_slug,
                 niche
             )
+            return
         
         # Select best matching sample
         best_sample = self._select_best_sample(
@@ -232,7 +280,7 @@ class LocalLLMEngine:
         )
         
         # Generate chapter content
-        content = self._adapt_chapter_template(
+        yield from self._iter_chapter_template(
             best_sample,
             title=chapter_title,
             outline=chapter_outline,
@@ -240,17 +288,6 @@ class LocalLLMEngine:
             context=book_context,
             subtopics=subtopics
         )
-        
-        return {
-            'content': content,
-            'word_count': len(content.split()),
-            'metadata': {
-                'model': 'custom_local_llm',
-                'domain': domain_slug,
-                'trained': True,
-                'elapsed_time': 0.2
-            }
-        }
     
     def _select_best_sample(self, samples: List[Dict], context: Dict) -> Dict:
         """Select best matching training sample based on context"""
@@ -373,16 +410,24 @@ class LocalLLMEngine:
         subtopics: Optional[list] = None
     ) -> str:
         """Adapt training template to generate specific chapter"""
+        return "".join(self._iter_chapter_template(template, title, outline, word_count, context, subtopics))
+    
+    def _iter_chapter_template(
+        self,
+        template: Dict,
+        title: str,
+        outline: str,
+        word_count: int,
+        context: Dict,
+        subtopics: Optional[list] = None
+    ) -> Iterator[str]:
+        """``_adapt_chapter_template``, yielding each subsection as it is written"""
         
         # Use template as base and customize
         base_content = template.get('completion', '')
         
-        # Generate content sections
-        sections = []
-        
-        # Introduction
-        sections.append(f"# {title}\n\n")
-        sections.append(f"{outline}\n\n")
+        # Introduction; the pieces concatenate to the sections joined by blank lines
+        yield "\n\n".join([f"# {title}\n\n", f"{outline}\n\n"])
         
         # Main content (3-5 subsections)
         subsection_count = max(3, min(5, word_count // 200))
@@ -392,18 +437,16 @@ class LocalLLMEngine:
         topics = (subtopics or [])[:subsection_count]
         for i in range(subsection_count):
             heading = topics[i] if i < len(topics) else f"Key Concept {i+1}"
-            sections.append(f"#### {heading}\n")
-            sections.append(self._generate_subsection(
+            subsection = self._generate_subsection(
                 title=heading,
                 context=context,
                 word_count=words_per_section,
                 section_num=i+1
-            ))
+            )
+            yield "\n\n" + "\n\n".join([f"#### {heading}\n", subsection])
         
         # Conclusion
-        sections.append(self._generate_section_conclusion(title, context))
-        
-        return "\n\n".join(sections)
+        yield "\n\n" + self._generate_section_conclusion(title, context)
     
     def _generate_subsection(
         self,
@@ -672,9 +715,30 @@ class LocalLLMEngine:
         niche: str = 'General'
     ) -> Dict[str, Any]:
         """Generate domain/niche-specific fallback chapter"""
+        content = "".join(self._iter_fallback_chapter(title, outline, word_count, domain_slug, niche))
+        actual_words = len(content.split())
         
-        sections = []
-        sections.append(f"# {title}\n\n{outline}\n\n")
+        return {
+            'content': content,
+            'word_count': actual_words,
+            'metadata': {
+                'domain': domain_slug,
+                'niche': niche,
+                'generated_by': 'contextual_fallback'
+            }
+        }
+    
+    def _iter_fallback_chapter(
+        self,
+        title: str,
+        outline: str,
+        word_count: int,
+        domain_slug: str = 'ai_automation',
+        niche: str = 'General'
+    ) -> Iterator[str]:
+        """``_generate_fallback_chapter``, yielding each subsection as it is written"""
+        
+        yield f"# {title}\n\n{outline}\n\n"
 
         # Domain-specific section templates
         section_templates = {
@@ -727,24 +791,10 @@ class LocalLLMEngine:
         words_per_section = max(120, word_count // 4)
         
         for idx, heading in enumerate(base_topics, 1):
-            sections.append(f"#### {heading}\n\n")
-            
             # Generate contextual content
             paragraph = self._generate_contextual_paragraph(heading, niche, domain_slug, words_per_section)
-            sections.append(paragraph + "\n\n")
-        
-        content = "".join(sections)
-        actual_words = len(content.split())
-        
-        return {
-            'content': content,
-            'word_count': actual_words,
-            'metadata': {
-                'domain': domain_slug,
-                'niche': niche,
-                'generated_by': 'contextual_fallback'
-            }
-        }
+            yield f"#### {heading}\n\n" + paragraph + "\n\n"
+
     
     def _generate_contextual_paragraph(self, heading: str, niche: str, domain_slug: str, word_count: int) -> str:
         """Generate contextual paragraph based on domain, niche, and heading"""
@@ -3,11 +3,14 @@ Custom Model Service
 Main interface for using custom-trained LLM model for book generation
 """
 
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from typing import Callable, Dict, List, Optional, Any
+from . import outline_cache
 from .cloudflare_client import CloudflareAIClient
 from .prompt_templates import PromptTemplates
-from .response_parser import ResponseParser
+from .response_parser import ResponseParser, StreamingOutlineParser
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +50,21 @@ class CustomModelService:
         """
         logger.info(f"Generating outline for {domain} / {niche}")
         
+        fields = dict(kwargs, domain=domain, niche=niche, audience=target_audience, page_count=page_count)
+        return outline_cache.get_or_generate(
+            f'cloudflare:{self.model_id}',
+            fields,
+            lambda: self._generate_book_outline(domain, niche, target_audience, page_count, **kwargs),
+        )
+    
+    def _generate_book_outline(
+        self,
+        domain: str,
+        niche: str,
+        target_audience: str,
+        page_count: int,
+        **kwargs
+    ) -> Dict[str, Any]:
         # Build prompt from template
         prompt = self.prompts.outline_prompt(
             domain=domain,
@@ -56,11 +74,12 @@ class CustomModelService:
             **kwargs
         )
         
-        # Call model
+        # Call model; uncached, each miss adds a distinct outline variant
         result = self.client.call_model(
             prompt=prompt,
             max_tokens=2000,
-            temperature=0.7
+            temperature=0.7,
+            cache=False
         )
         
         if not result.get("success"):
@@ -136,6 +155,213 @@ class CustomModelService:
             }
         }
     
+    def generate_chapters_batch(
+        self,
+        chapters: List[Dict[str, Any]],
+        book_context: Dict[str, Any],
+        concurrency: int = 4,
+        word_count: int = 1000,
+        fallback: Optional[Callable[[Dict[str, Any], str], Dict[str, Any]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate several chapters with up to ``concurrency`` model calls in
+        flight, so a book takes about as long as its slowest chapter.
+
+        Args:
+            chapters: Dicts with ``title``, ``outline`` and optionally ``word_count``
+            book_context: Overall book context (domain, niche, etc.)
+            concurrency: Maximum simultaneous model calls
+            word_count: Default target word count per chapter
+            fallback: ``fallback(chapter, error)`` producing a chapter result
+                when the model call for that chapter fails; defaults to the
+                local trained engine
+
+        Returns:
+            One ``generate_chapter_content``-shaped dict per chapter, in
+            input order; fallback results carry ``metadata['fallback']``.
+
+        Raises:
+            CloudflareFatalError: the account or model was rejected; the
+                remaining calls are cancelled
+        """
+        return asyncio.run(self.agenerate_chapters_batch(
+            chapters, book_context, concurrency=concurrency, word_count=word_count, fallback=fallback,
+        ))
+
+    async def agenerate_chapters_batch(self, chapters, book_context, concurrency=4, word_count=1000, fallback=None):
+        """``generate_chapters_batch`` for callers already in an event loop."""
+        fallback = fallback or self._default_fallback(book_context, word_count)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        logger.info(f"Generating {len(chapters)} chapters, {concurrency} at a time")
+        async with self.client.async_http(concurrency) as http:
+            try:
+                # A TaskGroup cancels the other chapters as soon as one raises
+                async with asyncio.TaskGroup() as group:
+                    tasks = [
+                        group.create_task(self._agenerate_chapter(
+                            http, semaphore, chapter, book_context, word_count, fallback,
+                        ))
+                        for chapter in chapters
+                    ]
+            except ExceptionGroup as group:
+                # Surface the error that stopped the batch (usually a
+                # CloudflareFatalError), not the group wrapper
+                raise group.exceptions[0] from None
+        return [task.result() for task in tasks]
+
+    def generate_book_streaming(
+        self,
+        domain: str,
+        niche: str,
+        target_audience: str,
+        page_count: int = 20,
+        concurrency: int = 4,
+        word_count: int = 1000,
+        fallback: Optional[Callable[[Dict[str, Any], str], Dict[str, Any]]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Stream the outline and start each chapter as soon as its outline
+        line arrives, instead of waiting for the whole outline first.
+
+        Args:
+            domain, niche, target_audience, page_count, **kwargs: as for
+                ``generate_book_outline``
+            concurrency: Maximum simultaneous chapter calls
+            word_count: Target word count per chapter
+            fallback: As for ``generate_chapters_batch``
+
+        Returns:
+            Dict with ``outline`` (as ``generate_book_outline``), ``chapters``
+            (one result per outline chapter, in order) and ``metadata``
+            including ``first_chapter_seconds``, the time until the first
+            chapter was written
+
+        Raises:
+            CloudflareFatalError: the account or model was rejected
+        """
+        return asyncio.run(self.agenerate_book_streaming(
+            domain, niche, target_audience, page_count,
+            concurrency=concurrency, word_count=word_count, fallback=fallback, **kwargs
+        ))
+
+    async def agenerate_book_streaming(self, domain, niche, target_audience, page_count=20, concurrency=4,
+                                       word_count=1000, fallback=None, **kwargs):
+        """``generate_book_streaming`` for callers already in an event loop."""
+        prompt = self.prompts.outline_prompt(
+            domain=domain,
+            niche=niche,
+            target_audience=target_audience,
+            page_count=page_count,
+            **kwargs
+        )
+        book_context = {"domain": domain, "niche": niche, "target_audience": target_audience}
+        fallback = fallback or self._default_fallback(book_context, word_count)
+        semaphore = asyncio.Semaphore(concurrency)
+        parser = StreamingOutlineParser()
+        started = time.perf_counter()
+        first_chapter_at = None
+
+        async def generate(http, chapter):
+            nonlocal first_chapter_at
+            result = await self._agenerate_chapter(
+                http, semaphore,
+                {"title": chapter["title"], "outline": chapter["description"]},
+                dict(book_context), word_count, fallback,
+            )
+            if first_chapter_at is None:
+                first_chapter_at = time.perf_counter() - started
+            return result
+
+        logger.info(f"Streaming outline for {domain} / {niche}")
+        # One extra connection so the outline stream never waits on a chapter
+        async with self.client.async_http(concurrency + 1) as http:
+            try:
+                async with asyncio.TaskGroup() as group:
+                    tasks = []
+
+                    def start(events):
+                        for kind, value in events:
+                            if kind == 'title':
+                                book_context["title"] = value
+                            else:
+                                tasks.append(group.create_task(generate(http, value)))
+
+                    async for chunk in self.client.astream_text(http, prompt, max_tokens=2000, temperature=0.7):
+                        start(parser.feed(chunk))
+                    start(parser.close())
+                    outline_seconds = time.perf_counter() - started
+
+                    outline = parser.outline()
+                    if not tasks:
+                        # Nothing parseable came back: write the fallback structure
+                        for chapter in outline["chapters"]:
+                            tasks.append(group.create_task(generate(http, chapter)))
+            except ExceptionGroup as group:
+                raise group.exceptions[0] from None
+
+        return {
+            "outline": outline,
+            "chapters": [task.result() for task in tasks],
+            "metadata": {
+                "model": self.model_id,
+                "outline_seconds": round(outline_seconds, 3),
+                "first_chapter_seconds": round(first_chapter_at, 3) if first_chapter_at is not None else None,
+                "elapsed_time": round(time.perf_counter() - started, 3),
+            }
+        }
+
+    async def _agenerate_chapter(self, http, semaphore, chapter, book_context, word_count, fallback):
+        """One chapter on a shared async client; failures go to ``fallback``."""
+        prompt = self.prompts.chapter_prompt(
+            title=chapter['title'],
+            outline=chapter.get('outline', ''),
+            context=book_context,
+            word_count=chapter.get('word_count', word_count),
+        )
+        async with semaphore:
+            result = await self.client.acall_model(http, prompt=prompt, max_tokens=2500, temperature=0.7)
+
+        if result.get("success"):
+            try:
+                content = self.parser.parse_chapter(result.get("response", ""))
+            except Exception as exc:
+                result = {"success": False, "error": f"Unparseable response: {exc}"}
+        if not result.get("success"):
+            logger.warning(f"Chapter '{chapter['title']}' failed ({result.get('error')}); using fallback")
+            fallback_result = await asyncio.to_thread(fallback, chapter, result.get('error', ''))
+            metadata = dict(fallback_result.get('metadata') or {}, fallback=True, error=result.get('error'))
+            return {**fallback_result, 'metadata': metadata}
+
+        return {
+            "content": content,
+            "word_count": len(content.split()),
+            "metadata": {
+                "model": result.get("model"),
+                "elapsed_time": result.get("elapsed_time"),
+                "tokens": result.get("tokens")
+            }
+        }
+
+    def _default_fallback(self, book_context, word_count):
+        def fallback(chapter, error):
+            return self._local_fallback(chapter, book_context, chapter.get('word_count', word_count))
+        return fallback
+
+    def _local_fallback(self, chapter: Dict[str, Any], book_context: Dict[str, Any], word_count: int) -> Dict[str, Any]:
+        """Generate the chapter with the local trained engine instead."""
+        from .local_llm_engine import LocalLLMEngine
+
+        if not hasattr(self, '_local_engine'):
+            self._local_engine = LocalLLMEngine()
+        return self._local_engine.generate_chapter_content(
+            chapter_title=chapter['title'],
+            chapter_outline=chapter.get('outline', ''),
+            book_context=book_context,
+            word_count=word_count,
+        )
+
     def refine_content(
         self,
         content: str,
@@ -0,0 +1,122 @@
+"""
+Shared outline memoization
+
+An outline depends only on the generation parameters (domain, niche,
+audience, length, the niche's content skeleton and any custom outline
+instructions), yet every book recomputed it and the remote path paid a
+model call for it. Outlines are now kept in the ``outlines`` cache alias
+(Redis when ``CACHE_URL`` is set, so every worker shares them) under a
+hash of those parameters, normalized so case and whitespace differences
+don't split entries.
+
+To keep books with the same parameters from all getting the same outline,
+each key holds up to ``OUTLINE_CACHE_VARIANTS`` outlines: the first k
+lookups generate and store a new variant, later ones are served the
+variants round-robin. ``OUTLINE_CACHE_VARIANTS = 0`` turns memoization
+off. Entries expire after ``OUTLINE_CACHE_TIMEOUT`` seconds; the local
+memory backend also culls once it holds ``OUTLINE_CACHE_MAX_ENTRIES``
+keys, Redis evicts under its own ``maxmemory-policy``.
+
+    result = outline_cache.get_or_generate('local', fields, generate)
+    result['metadata']['outline_cache']  # {'hit': True, 'variant': 1, 'variants': 3}
+
+Lookups are counted in ``outline_cache_lookups_total``.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from books.metrics import OUTLINE_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'outlines'
+
+# Bump when the key derivation or the stored result changes shape
+KEY_VERSION = 1
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return WHITESPACE_RE.sub(' ', value).strip().casefold()
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def cache_key(source: str, fields: Dict[str, Any]) -> str:
+    """
+    ``source`` separates generators that would answer the same fields
+    differently (the local engine, each remote model). Empty fields are
+    dropped so a missing value and ``None`` or ``''`` share an entry.
+    """
+    normalized = {name: _normalize(value) for name, value in fields.items() if value not in (None, '', [], {})}
+    payload = json.dumps([KEY_VERSION, source, normalized], sort_keys=True, default=str)
+    return 'outline:' + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _variants() -> int:
+    return max(getattr(settings, 'OUTLINE_CACHE_VARIANTS', 3), 0)
+
+
+def _with_cache_metadata(result: Dict[str, Any], hit: bool, variant: int, variants: int, started: float):
+    result = copy.deepcopy(result) if hit else result
+    metadata = result.setdefault('metadata', {})
+    if hit:
+        metadata['elapsed_time'] = round(time.perf_counter() - started, 4)
+    metadata['outline_cache'] = {'hit': hit, 'variant': variant, 'variants': variants}
+    return result
+
+
+def get_or_generate(source: str, fields: Dict[str, Any], generate: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    A cached outline result for ``fields``, or ``generate()``'s, stored as
+    a new variant. ``generate`` must return a fresh sample each time (call
+    the model with its response cache off) or the variants are identical.
+    Failures are never stored; a cache that can't be reached is skipped.
+    """
+    variants = _variants()
+    if variants == 0:
+        OUTLINE_CACHE_LOOKUPS.inc(source=source, result='disabled')
+        result = generate()
+        result.setdefault('metadata', {})['outline_cache'] = {'hit': False, 'variant': None, 'variants': 0}
+        return result
+
+    started = time.perf_counter()
+    key = cache_key(source, fields)
+    cache = caches[CACHE_ALIAS]
+    timeout = getattr(settings, 'OUTLINE_CACHE_TIMEOUT', 24 * 60 * 60)
+    try:
+        stored = cache.get(key) or []
+        if len(stored) >= variants:
+            cache.add(f'{key}:served', -1, timeout)
+            variant = cache.incr(f'{key}:served') % variants
+            OUTLINE_CACHE_LOOKUPS.inc(source=source, result='hit')
+            return _with_cache_metadata(stored[variant], True, variant, variants, started)
+    except Exception as exc:
+        logger.warning(f"Outline cache unavailable, generating uncached: {exc}")
+        OUTLINE_CACHE_LOOKUPS.inc(source=source, result='error')
+        return _with_cache_metadata(generate(), False, None, variants, started)
+
+    OUTLINE_CACHE_LOOKUPS.inc(source=source, result='miss')
+    result = generate()
+    # Another worker may have added variants meanwhile; re-read so neither is lost
+    try:
+        stored = (cache.get(key) or [])[:variants - 1] + [copy.deepcopy(result)]
+        cache.set(key, stored, timeout)
+    except Exception as exc:
+        logger.warning(f"Could not store outline variant: {exc}")
+        return _with_cache_metadata(result, False, None, variants, started)
+    return _with_cache_metadata(result, False, len(stored) - 1, variants, started)
@@ -0,0 +1,284 @@
+"""
+Cross-worker rate limiting for outbound model calls
+
+Every Celery child talks to Cloudflare on its own, so without coordination
+N workers burst together, collect 429s and spend their retries backing
+off. Each call now first takes a token from a per provider/model token
+bucket (``rpm`` requests a minute, bursts of up to ``burst``) and one of
+``concurrency`` slots, held until the response is read.
+
+With ``RATE_LIMIT_REDIS_URL`` set the bucket and the slots live in Redis
+and one Lua script decides atomically, on Redis's clock, for every worker
+on every host. Without it, or while Redis is unreachable, each process
+enforces the limits alone, which is only correct for a single worker.
+Slots are leases that expire after ``RATE_LIMIT_LEASE_SECONDS`` so a
+killed worker cannot hold one forever.
+
+``mode='block'`` waits up to ``timeout`` seconds for capacity;
+``mode='fail_fast'`` raises ``RateLimitExceeded`` at once. Either way the
+refusal is counted in ``outbound_rate_limit_rejections_total`` and waits in
+``outbound_rate_limit_wait_seconds``.
+
+    with limit('cloudflare', model):
+        response = session.post(...)
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+from books.metrics import RATE_LIMIT_LOCAL_FALLBACKS, RATE_LIMIT_REJECTIONS, RATE_LIMIT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# How long a waiter sleeps when only a concurrency slot is missing; slots
+# free up when another call finishes, which the limiter can't predict
+SLOT_POLL_SECONDS = 0.05
+
+# KEYS: bucket hash, lease zset. ARGV: rate per second, burst,
+# concurrency (0 = unlimited), lease seconds, lease id.
+# Returns {granted, seconds to wait}; -1 means "until a slot frees up".
+_ACQUIRE_SCRIPT = """
+-- Needed before Redis 5 to write after reading TIME; a no-op from 5 on
+redis.replicate_commands()
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local concurrency = tonumber(ARGV[3])
+local lease_seconds = tonumber(ARGV[4])
+
+if concurrency > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    if redis.call('ZCARD', KEYS[2]) >= concurrency then
+        return {0, '-1'}
+    end
+end
+
+local tokens = burst
+if rate > 0 then
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    if state[1] then
+        tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    if tokens < 1 then
+        return {0, tostring((1 - tokens) / rate)}
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+end
+
+if concurrency > 0 then
+    redis.call('ZADD', KEYS[2], now + lease_seconds, ARGV[5])
+    redis.call('EXPIRE', KEYS[2], math.ceil(lease_seconds) + 60)
+end
+return {1, '0'}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """No capacity within the allowed wait (or at once, in fail_fast mode)."""
+
+
+@dataclass(frozen=True)
+class Limits:
+    rpm: float
+    burst: int
+    concurrency: int
+
+    @property
+    def rate(self) -> float:
+        return self.rpm / 60
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rpm <= 0 and self.concurrency <= 0
+
+
+def limits_for(provider: str, model: str) -> Limits:
+    """``RATE_LIMITS[provider]`` with any ``'<provider>:<model>'`` override applied."""
+    configured = getattr(settings, 'RATE_LIMITS', {})
+    merged = {'rpm': 0, 'burst': 1, 'concurrency': 0}
+    merged.update(configured.get(provider, {}))
+    merged.update(configured.get(f'{provider}:{model}', {}))
+    return Limits(float(merged['rpm']), max(int(merged['burst']), 1), int(merged['concurrency']))
+
+
+class _LocalState:
+    """The same bucket and slots, for one process."""
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.active = 0
+
+
+class TokenBucketLimiter:
+    def __init__(self, redis_url: str = '', lease_seconds: float = 300):
+        self.lease_seconds = lease_seconds
+        self._redis = None
+        self._script = None
+        if redis_url:
+            import redis
+
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=2, socket_connect_timeout=2)
+            self._script = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._lock = threading.Lock()
+        self._local: Dict[str, _LocalState] = {}
+        self._redis_down_until = 0.0
+
+    # Decisions ------------------------------------------------------------
+
+    def _try_local(self, key: str, limits: Limits) -> Tuple[bool, float]:
+        with self._lock:
+            state = self._local.setdefault(key, _LocalState(limits.burst))
+            if limits.concurrency > 0 and state.active >= limits.concurrency:
+                return False, -1
+            if limits.rpm > 0:
+                now = time.monotonic()
+                state.tokens = min(limits.burst, state.tokens + (now - state.stamp) * limits.rate)
+                state.stamp = now
+                if state.tokens < 1:
+                    return False, (1 - state.tokens) / limits.rate
+                state.tokens -= 1
+            state.active += 1
+            return True, 0.0
+
+    def _try_redis(self, key: str, limits: Limits, lease: str) -> Tuple[bool, float]:
+        granted, wait = self._script(
+            keys=[f'ratelimit:{key}:bucket', f'ratelimit:{key}:leases'],
+            args=[limits.rate, limits.burst, limits.concurrency, self.lease_seconds, lease],
+        )
+        return bool(granted), float(wait)
+
+    def _use_redis(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def try_acquire(self, key: str, limits: Limits, lease: str) -> Tuple[Optional[str], float]:
+        """
+        One attempt. Returns ``(backend, 0)`` when granted, where backend
+        is 'redis' or 'local' and must be passed to ``release``, otherwise
+        ``(None, seconds to wait)`` with -1 for "until a slot frees up".
+        """
+        if self._use_redis():
+            try:
+                granted, wait = self._try_redis(key, limits, lease)
+                return ('redis' if granted else None), wait
+            except Exception as exc:
+                # Keep calling out at per-process limits rather than not at all
+                logger.warning(f"Rate limiter Redis unavailable, limiting per process for 30s: {exc}")
+                self._redis_down_until = time.monotonic() + 30
+        if self._redis is not None:
+            RATE_LIMIT_LOCAL_FALLBACKS.inc()
+        granted, wait = self._try_local(key, limits)
+        return ('local' if granted else None), wait
+
+    def release(self, key: str, limits: Limits, lease: str, backend: str) -> None:
+        if limits.concurrency <= 0:
+            return
+        if backend == 'redis':
+            try:
+                self._redis.zrem(f'ratelimit:{key}:leases', lease)
+            except Exception as exc:
+                # The lease expires on its own
+                logger.warning(f"Could not release rate-limit slot: {exc}")
+            return
+        with self._lock:
+            state = self._local.get(key)
+            if state is not None and state.active > 0:
+                state.active -= 1
+
+    # Waiting --------------------------------------------------------------
+
+    def _next_delay(self, provider, model, wait, deadline, mode):
+        if mode == 'fail_fast':
+            RATE_LIMIT_REJECTIONS.inc(provider=provider, model=model, reason='fail_fast')
+            raise RateLimitExceeded(f"{provider} {model}: no capacity")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            RATE_LIMIT_REJECTIONS.inc(provider=provider, model=model, reason='timeout')
+            raise RateLimitExceeded(f"{provider} {model}: no capacity within the wait timeout")
+        return min(SLOT_POLL_SECONDS if wait < 0 else wait, remaining)
+
+    @contextmanager
+    def limit(self, provider: str, model: str, mode: Optional[str] = None, timeout: Optional[float] = None):
+        limits = limits_for(provider, model)
+        if limits.unlimited:
+            yield
+            return
+        mode, timeout = _defaults(mode, timeout)
+        key, lease = f'{provider}:{model}', uuid.uuid4().hex
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            backend, wait = self.try_acquire(key, limits, lease)
+            if backend:
+                break
+            time.sleep(self._next_delay(provider, model, wait, deadline, mode))
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - started, provider=provider, model=model)
+        try:
+            yield
+        finally:
+            self.release(key, limits, lease, backend)
+
+    @asynccontextmanager
+    async def alimit(self, provider: str, model: str, mode: Optional[str] = None, timeout: Optional[float] = None):
+        """``limit`` for coroutines: waits with ``asyncio.sleep``."""
+        limits = limits_for(provider, model)
+        if limits.unlimited:
+            yield
+            return
+        mode, timeout = _defaults(mode, timeout)
+        key, lease = f'{provider}:{model}', uuid.uuid4().hex
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            # One Redis round trip; cheap enough not to need a thread
+            backend, wait = self.try_acquire(key, limits, lease)
+            if backend:
+                break
+            await asyncio.sleep(self._next_delay(provider, model, wait, deadline, mode))
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - started, provider=provider, model=model)
+        try:
+            yield
+        finally:
+            self.release(key, limits, lease, backend)
+
+
+def _defaults(mode, timeout):
+    mode = mode or getattr(settings, 'RATE_LIMIT_MODE', 'block')
+    if timeout is None:
+        timeout = getattr(settings, 'RATE_LIMIT_TIMEOUT', 30)
+    return mode, timeout
+
+
+_limiter = None
+_limiter_config = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> TokenBucketLimiter:
+    """The process-wide limiter, rebuilt when its settings change."""
+    global _limiter, _limiter_config
+    config = (getattr(settings, 'RATE_LIMIT_REDIS_URL', ''), getattr(settings, 'RATE_LIMIT_LEASE_SECONDS', 300))
+    if config != _limiter_config:
+        with _limiter_lock:
+            if config != _limiter_config:
+                _limiter = TokenBucketLimiter(*config)
+                _limiter_config = config
+    return _limiter
+
+
+def limit(provider: str, model: str, mode: Optional[str] = None, timeout: Optional[float] = None):
+    return get_limiter().limit(provider, model, mode, timeout)
+
+
+def alimit(provider: str, model: str, mode: Optional[str] = None, timeout: Optional[float] = None):
+    return get_limiter().alimit(provider, model, mode, timeout)
@@ -0,0 +1,358 @@
+"""
+Content-addressed cache for Cloudflare model responses
+
+The same outline prompt (domain, niche, audience, page count) and the same
+cover-description prompts are sent over and over. ``CloudflareAIClient``
+looks each ``call_model`` and ``generate_image`` request up here first;
+the key is a hash of the operation, model id, normalized prompt and
+sampling parameters, so only a request that would be answered from the
+same distribution is served from the cache. Failed calls are never
+stored.
+
+Entries live on local disk (``LLM_CACHE_DIR``, shared by the processes of
+one host) or in Redis (``LLM_CACHE_REDIS_URL``, shared by every host).
+Both expire entries after ``LLM_CACHE_TTL`` seconds and evict the least
+recently used ones once the stored responses exceed ``LLM_CACHE_MAX_MB``.
+
+Callers that want a fresh sample (regenerating a chapter the user
+rejected, outline variants) pass ``cache=False`` or wrap the calls in
+``with bypass():``. Hits, misses and the response bytes served without a
+call are counted in ``llm_cache_lookups_total`` and
+``llm_cache_bytes_saved_total``; ``python manage.py llm_cache`` prints
+the hit ratio.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from backend.utils.metrics import REGISTRY
+from books.metrics import LLM_CACHE_BYTES_SAVED, LLM_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Bump when the key derivation or entry format changes
+KEY_VERSION = 1
+
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+@contextmanager
+def bypass():
+    """Send every model call in this block to Cloudflare, uncached."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Unicode NFC with runs of spaces and blank lines collapsed."""
+    text = unicodedata.normalize('NFC', prompt).strip()
+    text = '\n'.join(' '.join(line.split()) for line in text.splitlines())
+    return re.sub(r'\n{3,}', '\n\n', text)
+
+
+def cache_key(operation: str, model: str, prompt: str, params: Dict[str, Any]) -> str:
+    material = json.dumps(
+        {
+            'v': KEY_VERSION,
+            'operation': operation,
+            'model': model,
+            'prompt': normalize_prompt(prompt),
+            'params': params,
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str,
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    One file per entry under ``directory``, named by key. The first line
+    holds the expiry time; the file's mtime is its last use, which is
+    what LRU eviction sorts by.
+    """
+
+    # Re-measure the directory at least this often even when this
+    # process's own writes don't push it over the limit
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, directory, max_bytes: int, ttl: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._estimated_bytes = None
+        self._last_sweep = 0.0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as entry:
+                expires_at = float(entry.readline())
+                value = entry.read()
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        if expires_at < now:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        path = self._path(key)
+        tmp_path = path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as entry:
+                entry.write(f'{time.time() + self.ttl}\n'.encode())
+                entry.write(value)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning(f"Could not write LLM cache entry: {exc}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += len(value)
+            due = (
+                self._estimated_bytes is None
+                or self._estimated_bytes > self.max_bytes
+                or time.monotonic() - self._last_sweep >= self.SWEEP_INTERVAL
+            )
+        if due:
+            self.sweep()
+
+    def _entries(self):
+        if not self.directory.is_dir():
+            return
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    yield entry.path, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+    def sweep(self) -> None:
+        """Drop expired entries, then least recently used ones down to 90% of the limit."""
+        now = time.time()
+        live = []
+        for path, stat in self._entries():
+            if stat.st_mtime + self.ttl < now:
+                # Unused for a whole TTL, so certainly expired
+                Path(path).unlink(missing_ok=True)
+            else:
+                live.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in live)
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            live.sort()
+            for _, size, path in live:
+                if total <= target:
+                    break
+                Path(path).unlink(missing_ok=True)
+                total -= size
+        with self._lock:
+            self._estimated_bytes = total
+            self._last_sweep = time.monotonic()
+
+    def usage(self) -> Dict[str, int]:
+        entries = size = 0
+        for _, stat in self._entries():
+            entries += 1
+            size += stat.st_size
+        return {'entries': entries, 'bytes': size}
+
+    def clear(self) -> None:
+        for path, _ in list(self._entries()):
+            Path(path).unlink(missing_ok=True)
+        with self._lock:
+            self._estimated_bytes = 0
+
+
+class RedisCache:
+    """
+    Entries are plain keys with a Redis TTL. A sorted set scores every key
+    by its last use and a hash keeps entry sizes, so the byte total can be
+    held under ``max_bytes`` by evicting from the low end of the set.
+    Entries that expired on their own are still counted until eviction
+    reaches them, which only makes eviction start a little early.
+    """
+
+    def __init__(self, url: str, max_bytes: int, ttl: int, prefix: str = 'llm-cache'):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prefix = f'{prefix}:v{KEY_VERSION}'
+        self.lru_key = f'{self.prefix}:lru'
+        self.sizes_key = f'{self.prefix}:sizes'
+        self.total_key = f'{self.prefix}:bytes'
+
+    def _entry_key(self, key: str) -> str:
+        return f'{self.prefix}:entry:{key}'
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.redis.get(self._entry_key(key))
+        if value is not None:
+            self.redis.zadd(self.lru_key, {key: time.time()})
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        pipe = self.redis.pipeline()
+        pipe.set(self._entry_key(key), value, ex=self.ttl)
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hget(self.sizes_key, key)
+        pipe.hset(self.sizes_key, key, len(value))
+        previous = pipe.execute()[2]
+        total = self.redis.incrby(self.total_key, len(value) - int(previous or 0))
+        if total > self.max_bytes:
+            self._evict(total - int(self.max_bytes * 0.9))
+
+    def _evict(self, excess: int) -> None:
+        while excess > 0:
+            oldest = self.redis.zpopmin(self.lru_key, 50)
+            if not oldest:
+                break
+            keys = [member.decode() for member, _ in oldest]
+            sizes = self.redis.hmget(self.sizes_key, keys)
+            freed = sum(int(size or 0) for size in sizes)
+            pipe = self.redis.pipeline()
+            pipe.delete(*(self._entry_key(key) for key in keys))
+            pipe.hdel(self.sizes_key, *keys)
+            pipe.decrby(self.total_key, freed)
+            pipe.execute()
+            excess -= freed
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            'entries': self.redis.zcard(self.lru_key),
+            'bytes': int(self.redis.get(self.total_key) or 0),
+        }
+
+    def clear(self) -> None:
+        keys = [key.decode() for key in self.redis.zrange(self.lru_key, 0, -1)]
+        pipe = self.redis.pipeline()
+        for start in range(0, len(keys), 500):
+            pipe.delete(*(self._entry_key(key) for key in keys[start:start + 500]))
+        pipe.delete(self.lru_key, self.sizes_key, self.total_key)
+        pipe.execute()
+
+
+_backend = None
+_backend_config = None
+_backend_lock = threading.Lock()
+
+
+def _config():
+    return (
+        getattr(settings, 'LLM_CACHE_BACKEND', ''),
+        str(getattr(settings, 'LLM_CACHE_DIR', '')),
+        getattr(settings, 'LLM_CACHE_REDIS_URL', ''),
+        getattr(settings, 'LLM_CACHE_MAX_MB', 512),
+        getattr(settings, 'LLM_CACHE_TTL', 7 * 24 * 60 * 60),
+    )
+
+
+def get_cache():
+    """The configured backend, or None when ``LLM_CACHE_BACKEND`` is empty."""
+    global _backend, _backend_config
+    config = _config()
+    if config != _backend_config:
+        with _backend_lock:
+            if config != _backend_config:
+                kind, directory, redis_url, max_mb, ttl = config
+                max_bytes = max_mb * 1024 * 1024
+                if kind == 'disk' and directory:
+                    _backend = DiskCache(directory, max_bytes, ttl)
+                elif kind == 'redis' and redis_url:
+                    _backend = RedisCache(redis_url, max_bytes, ttl)
+                else:
+                    if kind:
+                        logger.warning(f"LLM cache backend {kind!r} is not configured; caching disabled")
+                    _backend = None
+                _backend_config = config
+    return _backend
+
+
+def lookup(operation: str, key: str, use_cache: bool = True) -> Optional[bytes]:
+    """The cached value for ``key``, counting the hit, miss or bypass."""
+    backend = get_cache()
+    if backend is None:
+        return None
+    if not use_cache or _bypass.get():
+        LLM_CACHE_LOOKUPS.inc(operation=operation, result='bypass')
+        return None
+    try:
+        value = backend.get(key)
+    except Exception as exc:
+        # A broken cache must never cost the model call
+        logger.warning(f"LLM cache lookup failed: {exc}")
+        value = None
+    if value is None:
+        LLM_CACHE_LOOKUPS.inc(operation=operation, result='miss')
+        return None
+    LLM_CACHE_LOOKUPS.inc(operation=operation, result='hit')
+    LLM_CACHE_BYTES_SAVED.inc(len(value), operation=operation)
+    return value
+
+
+def store(key: str, value: bytes, use_cache: bool = True) -> None:
+    backend = get_cache()
+    if backend is None or not use_cache or _bypass.get():
+        return
+    try:
+        backend.set(key, value)
+    except Exception as exc:
+        logger.warning(f"LLM cache store failed: {exc}")
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit ratio and bytes saved per operation, across every process on the host."""
+    collected = REGISTRY.collect()
+    operations: Dict[str, Dict[str, Any]] = {}
+    for key, value in collected[LLM_CACHE_LOOKUPS.name].items():
+        labels = dict(key)
+        counts = operations.setdefault(labels['operation'], {'hit': 0, 'miss': 0, 'bypass': 0, 'bytes_saved': 0})
+        counts[labels['result']] = int(value)
+    for key, value in collected[LLM_CACHE_BYTES_SAVED.name].items():
+        counts = operations.setdefault(dict(key)['operation'], {'hit': 0, 'miss': 0, 'bypass': 0, 'bytes_saved': 0})
+        counts['bytes_saved'] = int(value)
+    for counts in operations.values():
+        lookups = counts['hit'] + counts['miss']
+        counts['hit_ratio'] = round(counts['hit'] / lookups, 4) if lookups else 0.0
+
+    backend = get_cache()
+    return {
+        'backend': _backend_config[0] if backend is not None else '',
+        'usage': backend.usage() if backend is not None else {'entries': 0, 'bytes': 0},
+        'operations': operations,
+    }
@@ -5,10 +5,94 @@ Parses and validates responses from custom LLM model
 
 import re
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+TITLE_RE = re.compile(r'TITLE:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+# \s* may cross lines, so "1. Intro\n   - What it covers" has a description
+CHAPTER_RE = re.compile(r'(\d+)\.\s*([^\n-]+?)(?:\s*-\s*([^\n]+))?(?:\n|$)')
+# Once a character like this follows a match, no later text can change it
+SETTLED_RE = re.compile(r'[^\s-]')
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+SPACE_RUN_RE = re.compile(r' {2,}')
+
+
+class StreamingOutlineParser:
+    """
+    Incremental ``parse_outline``: feed streamed chunks and get the title
+    and each chapter back as soon as the text after it settles the match,
+    so chapter generation can start while the outline is still arriving.
+
+        parser = StreamingOutlineParser()
+        for chunk in stream:
+            for kind, value in parser.feed(chunk):
+                ...  # ('title', str) or ('chapter', {number, title, description})
+        parser.close()
+        outline = parser.outline()  # what parse_outline returns
+
+    The patterns run over the whole response, as a one-shot parse would. A
+    chapter line's description may sit on the next line, so a match is only
+    final once a character that is neither whitespace nor ``-`` follows it.
+    """
+
+    def __init__(self):
+        self.title: Optional[str] = None
+        self.chapters: List[Dict[str, Any]] = []
+        # Everything so far until the title is found, and the text after
+        # the last settled chapter
+        self._title_text = ''
+        self._text = ''
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.title is None:
+            self._title_text += chunk
+        self._text += chunk
+        return self._scan(final=False)
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """Settle whatever is left; nothing more will arrive."""
+        return self._scan(final=True)
+
+    def _settled(self, text: str, end: int, final: bool) -> bool:
+        return final or SETTLED_RE.search(text, end) is not None
+
+    def _scan(self, final: bool) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+
+        if self.title is None:
+            title_match = TITLE_RE.search(self._title_text)
+            if title_match and self._settled(self._title_text, title_match.end(), final):
+                self.title = title_match.group(1).strip()
+                self._title_text = ''
+                events.append(('title', self.title))
+
+        consumed = 0
+        for match in CHAPTER_RE.finditer(self._text):
+            if not self._settled(self._text, match.end(), final):
+                break
+            chapter = {
+                "number": int(match.group(1)),
+                "title": match.group(2).strip(),
+                "description": match.group(3).strip() if match.group(3) else ""
+            }
+            self.chapters.append(chapter)
+            events.append(('chapter', chapter))
+            consumed = match.end()
+        self._text = '' if final else self._text[consumed:]
+        return events
+
+    def outline(self) -> Dict[str, Any]:
+        chapters = self.chapters
+        if not chapters:
+            logger.warning("No chapters found in outline, using fallback structure")
+            chapters = ResponseParser._generate_fallback_outline()
+        return {
+            "title": self.title or "Untitled Book",
+            "chapters": chapters,
+            "total_chapters": len(chapters)
+        }
+
 
 class ResponseParser:
     """
@@ -26,35 +110,10 @@ class ResponseParser:
             Structured outline dict
         """
         try:
-            # Extract title
-            title_match = re.search(r'TITLE:\s*(.+?)(?:\n|$)', response, re.IGNORECASE)
-            title = title_match.group(1).strip() if title_match else "Untitled Book"
-            
-            # Extract chapters
-            chapters = []
-            chapter_pattern = r'(\d+)\.\s*([^\n-]+?)(?:\s*-\s*([^\n]+))?(?:\n|$)'
-            
-            for match in re.finditer(chapter_pattern, response):
-                chapter_num = match.group(1)
-                chapter_title = match.group(2).strip()
-                chapter_desc = match.group(3).strip() if match.group(3) else ""
-                
-                chapters.append({
-                    "number": int(chapter_num),
-                    "title": chapter_title,
-                    "description": chapter_desc
-                })
-            
-            # Validate we have chapters
-            if not chapters:
-                logger.warning("No chapters found in outline, using fallback structure")
-                chapters = self._generate_fallback_outline()
-            
-            return {
-                "title": title,
-                "chapters": chapters,
-                "total_chapters": len(chapters)
-            }
+            parser = StreamingOutlineParser()
+            parser.feed(response)
+            parser.close()
+            return parser.outline()
             
         except Exception as e:
             logger.error(f"Outline parsing error: {str(e)}")
@@ -91,8 +150,8 @@ class ResponseParser:
                     content = content[len(prefix):].strip()
             
             # Clean up excessive whitespace
-            content = re.sub(r'\n{3,}', '\n\n', content)
-            content = re.sub(r' {2,}', ' ', content)
+            content = BLANK_LINES_RE.sub('\n\n', content)
+            content = SPACE_RUN_RE.sub(' ', content)
             
             # Validate minimum length
             if len(content) < 100:
@@ -170,7 +229,8 @@ class ResponseParser:
         
         return True
     
-    def _generate_fallback_outline(self) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _generate_fallback_outline() -> List[Dict[str, Any]]:
         """Generate fallback outline if parsing fails"""
         return [
             {"number": 1, "title": "Introduction", "description": "Overview and context"},
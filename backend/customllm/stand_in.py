@@ -0,0 +1,279 @@
+"""
+Local stand-in for the Cloudflare Workers AI REST API
+
+Serves ``/client/v4/accounts/<account>/ai/run/<model>`` (text, server-sent
+event streaming and images) and ``.../ai/models`` the way
+``CloudflareAIClient`` uses them, so generation, the batch and streaming
+paths, the response cache and the rate limiter can be exercised and
+benchmarked without network or credentials:
+
+    python manage.py cloudflare_stand_in --latency-ms 800 --throttle-rate 0.05
+    CLOUDFLARE_API_BASE_URL=http://127.0.0.1:8787/client/v4 python manage.py ...
+
+Responses are deterministic for a prompt: outline prompts get a parseable
+TITLE / numbered-chapter outline, everything else prose of roughly the
+requested length. Latency (time to first byte) follows the configured
+distribution; failures are injected as 5xx (``error_rate``) and 429s
+(``throttle_rate``, or for real once a model goes over ``rpm``).
+``GET /__stats__`` returns the run requests served, by status.
+"""
+
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+RUN_PATH_RE = re.compile(r'^/client/v4/accounts/[^/]+/ai/run/(?P<model>.+)$')
+MODELS_PATH_RE = re.compile(r'^/client/v4/accounts/[^/]+/ai/models(?:/search)?$')
+STATS_PATH = '/__stats__'
+
+MODELS = [
+    '@cf/meta/llama-3.1-8b-instruct',
+    '@cf/meta/llama-3.1-70b-instruct',
+    '@cf/stabilityai/stable-diffusion-xl-base-1.0',
+]
+
+_VOCABULARY = (
+    'practical framework routine habit strategy example method insight system progress '
+    'foundation principle technique workflow result balance challenge solution detail '
+    'approach pattern outcome practice experience planning review measure'
+).split()
+
+
+@dataclass
+class StandInConfig:
+    latency_ms: float = 200.0
+    latency_jitter_ms: float = 50.0
+    # fixed, uniform (latency +- jitter), normal (jitter = stdev) or
+    # lognormal (median latency, jitter = stdev of the underlying normal in ms)
+    latency_distribution: str = 'normal'
+    # Between streamed pieces, after the first byte
+    token_delay_ms: float = 5.0
+    # Share of requests answered 500/502/503
+    error_rate: float = 0.0
+    # Share answered 429 regardless of load
+    throttle_rate: float = 0.0
+    # Per-model requests a minute before real 429s; 0 = no limit
+    rpm: float = 0.0
+    seed: Optional[int] = None
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), config: Optional[StandInConfig] = None):
+        super().__init__(address, _StandInHandler)
+        self.config = config or StandInConfig()
+        self.statuses: Counter = Counter()
+        self.requests = 0
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._recent: Dict[str, deque] = {}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The value for ``CLOUDFLARE_API_BASE_URL``."""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/client/v4'
+
+    def start(self) -> 'StandInServer':
+        """Serve from a background thread (tests, the load test)."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def latency(self) -> float:
+        config = self.config
+        mean, jitter = config.latency_ms, config.latency_jitter_ms
+        with self._lock:
+            if config.latency_distribution == 'uniform':
+                value = self._rng.uniform(mean - jitter, mean + jitter)
+            elif config.latency_distribution == 'normal':
+                value = self._rng.gauss(mean, jitter)
+            elif config.latency_distribution == 'lognormal' and mean > 0:
+                value = self._rng.lognormvariate(0, jitter / mean) * mean
+            else:
+                value = mean
+        return max(value, 0) / 1000
+
+    def decide(self, model: str) -> int:
+        """The status this request gets; counts it either way."""
+        config = self.config
+        with self._lock:
+            self.requests += 1
+            status = 200
+            if config.rpm > 0:
+                now = time.monotonic()
+                recent = self._recent.setdefault(model, deque())
+                while recent and now - recent[0] >= 60:
+                    recent.popleft()
+                if len(recent) >= config.rpm:
+                    status = 429
+                else:
+                    recent.append(now)
+            if status == 200:
+                roll = self._rng.random()
+                if roll < config.throttle_rate:
+                    status = 429
+                elif roll < config.throttle_rate + config.error_rate:
+                    status = self._rng.choice((500, 502, 503))
+            self.statuses[status] += 1
+            return status
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+                'config': asdict(self.config),
+            }
+
+
+def _words(seed: str, count: int):
+    rng = random.Random(seed)
+    return [rng.choice(_VOCABULARY) for _ in range(count)]
+
+
+def outline_text(prompt: str) -> str:
+    niche = re.search(r'\*\*Niche\*\*:\s*(.+)', prompt)
+    subject = niche.group(1).strip() if niche else 'The Subject'
+    lines = [f'TITLE: {subject.title()}: A Practical Guide', '', 'CHAPTERS:']
+    for number in range(1, 9):
+        topic = ' '.join(word.title() for word in _words(f'{prompt}-{number}', 2))
+        lines.append(f'{number}. {topic} in {subject} - How {topic.lower()} shapes everyday results')
+    return '\n'.join(lines)
+
+
+def prose_text(prompt: str, max_tokens: int) -> str:
+    requested = re.search(r'(\d{3,5})\s+words', prompt)
+    count = min(int(requested.group(1)) if requested else 400, int(max_tokens * 0.75))
+    words = _words(prompt, max(count, 20))
+    sentences = [' '.join(words[start:start + 12]).capitalize() + '.' for start in range(0, len(words), 12)]
+    paragraphs = [' '.join(sentences[start:start + 5]) for start in range(0, len(sentences), 5)]
+    return '## Overview\n\n' + '\n\n'.join(paragraphs)
+
+
+def png(width: int, height: int, seed: str) -> bytes:
+    """A solid-colour PNG of the requested size."""
+    colour = hashlib.sha256(seed.encode()).digest()[:3]
+    row = b'\x00' + colour * width
+    raw = zlib.compress(row * height, 6)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', raw) + chunk(b'IEND', b'')
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: StandInServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body: bytes, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def _error(self, status, message):
+        headers = {'Retry-After': '1'} if status == 429 else None
+        self._json(status, {'success': False, 'errors': [{'code': status, 'message': message}], 'result': None},
+                   headers)
+
+    def _authorized(self):
+        if self.headers.get('Authorization', '').startswith('Bearer '):
+            return True
+        self._error(401, 'Authentication error')
+        return False
+
+    def do_GET(self):
+        if self.path == STATS_PATH or self.path.endswith(STATS_PATH):
+            self._json(200, self.server.stats())
+        elif MODELS_PATH_RE.match(self.path):
+            if self._authorized():
+                self._json(200, {'success': True, 'result': [{'name': name} for name in MODELS]})
+        else:
+            self._error(404, 'No route for that URI')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        match = RUN_PATH_RE.match(self.path)
+        if not match:
+            self._error(404, 'No route for that URI')
+            return
+        if not self._authorized():
+            return
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._error(400, 'Malformed JSON')
+            return
+
+        model = match.group('model')
+        status = self.server.decide(model)
+        time.sleep(self.server.latency())
+        if status == 429:
+            self._error(429, 'Rate limited')
+        elif status != 200:
+            self._error(status, 'Internal error')
+        elif 'messages' not in payload and 'prompt' in payload:
+            image = png(int(payload.get('width', 1024)), int(payload.get('height', 1024)), payload['prompt'])
+            self._send(200, image, content_type='image/png')
+        else:
+            messages = payload.get('messages') or [{'content': payload.get('prompt', '')}]
+            prompt = messages[-1].get('content', '')
+            text = outline_text(prompt) if 'TITLE:' in prompt else prose_text(prompt, int(payload.get('max_tokens', 2000)))
+            if payload.get('stream'):
+                self._stream(text)
+            else:
+                tokens = len(text.split())
+                self._json(200, {
+                    'success': True,
+                    'errors': [],
+                    'result': {
+                        'response': text,
+                        'tokens_used': tokens,
+                        'usage': {'prompt_tokens': len(prompt.split()), 'completion_tokens': tokens},
+                    },
+                })
+
+    def _stream(self, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        delay = self.server.config.token_delay_ms / 1000
+        # Word-sized pieces that keep their whitespace, as token streams do
+        for piece in re.findall(r'\S+\s*|\s+', text):
+            self._chunk(f'data: {json.dumps({"response": piece})}\n\n'.encode())
+            if delay:
+                time.sleep(delay)
+        self._chunk(b'data: [DONE]\n\n')
+        self._chunk(b'')
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
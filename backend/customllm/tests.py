@@ -1,3 +1,760 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import re
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from books.metrics import (
+    CLOUDFLARE_RETRIES, CLOUDFLARE_SECONDS, LLM_CACHE_BYTES_SAVED, LLM_CACHE_LOOKUPS, OUTLINE_CACHE_LOOKUPS,
+    RATE_LIMIT_LOCAL_FALLBACKS, RATE_LIMIT_REJECTIONS,
+)
+from customllm.services import cloudflare_client, outline_cache, rate_limiter, response_cache
+from customllm.services.custom_book_generator import CustomBookGenerator
+from customllm.services.local_llm_engine import LocalLLMEngine
+from customllm.services.cloudflare_client import CloudflareAIClient, CloudflareFatalError
+from customllm.services.model_service import CustomModelService
+from customllm.services.response_parser import ResponseParser, StreamingOutlineParser
+from customllm.stand_in import StandInConfig, StandInServer
+
+
+class StubCloudflareServer(ThreadingHTTPServer):
+    """Local HTTP/1.1 server answering like the Workers AI run endpoint."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.statuses = []  # served first, then 200s
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+
+    def next_status(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client_address)
+            return self.statuses.pop(0) if self.statuses else 200
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = self.server.next_status(self.client_address)
+        if status == 200:
+            self._reply(200, {'result': {'response': 'Hello from the stub.', 'tokens_used': 5}, 'success': True})
+        else:
+            self._reply(status, {'success': False, 'errors': [{'message': 'try later'}]})
+
+    def do_GET(self):
+        self.server.next_status(self.client_address)
+        self._reply(200, {'result': [{'name': '@cf/meta/llama-3.1-8b-instruct'}], 'success': True})
+
+    def log_message(self, *args):
+        pass
+
+
+def _count(metric, **labels):
+    for series_labels, value in metric.snapshot():
+        if series_labels == labels:
+            return value['count'] if isinstance(value, dict) else value
+    return 0
+
+
+@override_settings(METRICS_DIR='', LLM_CACHE_BACKEND='', RATE_LIMITS={}, CLOUDFLARE_RETRY_BACKOFF=0,
+                   CLOUDFLARE_MAX_RETRIES=2, CLOUDFLARE_POOL_SIZE=4)
+class CloudflareSessionTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubCloudflareServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        cloudflare_client.reset_session()
+        self.addCleanup(cloudflare_client.reset_session)
+
+        with mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            self.client = CloudflareAIClient()
+        self.client.api_root = f'http://127.0.0.1:{self.server.server_port}/ai'
+        self.client.base_url = f'{self.client.api_root}/run'
+
+    def test_clients_share_one_keep_alive_connection(self):
+        other = CloudflareAIClient.__new__(CloudflareAIClient)
+        other.__dict__.update(self.client.__dict__)
+
+        for client in (self.client, other, self.client):
+            self.assertTrue(client.call_model('Hi')['success'])
+        self.assertEqual(self.client.get_available_models(), ['@cf/meta/llama-3.1-8b-instruct'])
+
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retries_rate_limits_and_server_errors(self):
+        retried = _count(CLOUDFLARE_RETRIES, reason='429') + _count(CLOUDFLARE_RETRIES, reason='503')
+        self.server.statuses = [429, 503]
+
+        result = self.client.call_model('Hi')
+
+        self.assertTrue(result['success'])
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(_count(CLOUDFLARE_RETRIES, reason='429') + _count(CLOUDFLARE_RETRIES, reason='503'), retried + 2)
+
+    def test_gives_up_after_max_retries_and_records_latency(self):
+        observed = _count(CLOUDFLARE_SECONDS, operation='call_model', outcome='503')
+        retried = _count(CLOUDFLARE_RETRIES, reason='503')
+        self.server.statuses = [503, 503, 503, 503]
+
+        with self.assertLogs('customllm.services.cloudflare_client', 'ERROR'):
+            result = self.client.call_model('Hi')
+
+        self.assertFalse(result['success'])
+        self.assertIn('HTTP 503', result['error'])
+        self.assertEqual(self.server.requests, 3)
+        # Two retries; the attempt that exhausted the budget is not one
+        self.assertEqual(_count(CLOUDFLARE_RETRIES, reason='503'), retried + 2)
+        self.assertEqual(_count(CLOUDFLARE_SECONDS, operation='call_model', outcome='503'), observed + 1)
+
+    def test_every_attempt_takes_a_rate_limit_token(self):
+        self.server.statuses = [429, 503]
+        limits = {'cloudflare': {'rpm': 1, 'burst': 2}}
+
+        with override_settings(RATE_LIMITS=limits, RATE_LIMIT_MODE='fail_fast', RATE_LIMIT_REDIS_URL=''):
+            with self.assertLogs('customllm.services.cloudflare_client', 'ERROR'):
+                result = self.client.call_model('Hi', model='@cf/test/retried')
+
+        # The retry after the 503 found the bucket empty and was not sent
+        self.assertFalse(result['success'])
+        self.assertIn('no capacity', result['error'])
+        self.assertEqual(self.server.requests, 2)
+
+
+@override_settings(METRICS_DIR='', RATE_LIMITS={}, CLOUDFLARE_RETRY_BACKOFF=0, CLOUDFLARE_MAX_RETRIES=1)
+class ChapterBatchTests(SimpleTestCase):
+    DELAYS = {1: 0.2, 2: 0.05, 3: 0.1, 4: 0.15, 5: 0.05, 6: 0.1, 7: 0.05, 8: 0.2, 9: 0.1, 10: 0.05}
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            self.service = CustomModelService()
+        self.statuses = {}
+        self.in_flight = self.max_in_flight = 0
+        self.service.client.async_transport = httpx.MockTransport(self._handle)
+        self.chapters = [{'title': f'Topic {n} Basics', 'outline': f'What topic {n} covers'} for n in self.DELAYS]
+
+    async def _handle(self, request):
+        prompt = json.loads(request.content)['messages'][0]['content']
+        number = int(re.search(r'Topic (\d+) Basics', prompt).group(1))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.DELAYS[number])
+        finally:
+            self.in_flight -= 1
+        status = self.statuses.get(number, 200)
+        if status != 200:
+            return httpx.Response(status, json={'success': False})
+        return httpx.Response(200, json={'result': {'response': self._body(number)}})
+
+    @staticmethod
+    def _body(number):
+        # Long enough that the parser keeps it rather than substituting a placeholder
+        return f'Chapter body for topic {number}. ' + 'It explains the topic step by step. ' * 4
+
+    def _fallback(self, chapter, error):
+        return {'content': f"Local draft of {chapter['title']}", 'word_count': 4, 'metadata': {'model': 'local'}}
+
+    def test_chapters_run_concurrently_and_keep_their_order(self):
+        started = time.perf_counter()
+        results = self.service.generate_chapters_batch(self.chapters, {'domain': 'Tech'}, concurrency=10)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([r['content'] for r in results], [self._body(n).strip() for n in self.DELAYS])
+        self.assertLess(elapsed, sum(self.DELAYS.values()) / 2)
+        self.assertEqual(self.max_in_flight, 10)
+
+    def test_concurrency_is_bounded(self):
+        self.service.generate_chapters_batch(self.chapters, {'domain': 'Tech'}, concurrency=3)
+        self.assertEqual(self.max_in_flight, 3)
+
+    def test_provider_concurrency_limit_applies_across_the_batch(self):
+        with override_settings(RATE_LIMITS={'cloudflare': {'concurrency': 2}}):
+            results = self.service.generate_chapters_batch(self.chapters, {'domain': 'Tech'}, concurrency=10)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(self.max_in_flight, 2)
+
+    def test_failed_chapter_falls_back_without_failing_the_batch(self):
+        self.statuses = {4: 503}
+
+        with self.assertLogs('customllm', 'WARNING'):
+            results = self.service.generate_chapters_batch(
+                self.chapters, {'domain': 'Tech'}, concurrency=5, fallback=self._fallback,
+            )
+
+        self.assertEqual(results[3]['content'], 'Local draft of Topic 4 Basics')
+        self.assertTrue(results[3]['metadata']['fallback'])
+        self.assertIn('503', results[3]['metadata']['error'])
+        self.assertEqual(results[4]['content'], self._body(5).strip())
+
+    def test_fatal_error_cancels_the_batch(self):
+        self.statuses = {2: 401}
+
+        started = time.perf_counter()
+        with self.assertRaises(CloudflareFatalError):
+            self.service.generate_chapters_batch(self.chapters, {'domain': 'Tech'}, concurrency=10)
+        self.assertLess(time.perf_counter() - started, max(self.DELAYS.values()))
+
+
+@override_settings(METRICS_DIR='', RATE_LIMITS={}, CLOUDFLARE_RETRY_BACKOFF=0, CLOUDFLARE_MAX_RETRIES=1,
+                   LLM_CACHE_BACKEND='disk')
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubCloudflareServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(LLM_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cloudflare_client.reset_session()
+        self.addCleanup(cloudflare_client.reset_session)
+        with mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            self.client = CloudflareAIClient()
+        self.client.api_root = f'http://127.0.0.1:{self.server.server_port}/ai'
+        self.client.base_url = f'{self.client.api_root}/run'
+
+    def test_identical_prompt_is_served_from_the_cache(self):
+        hits = _count(LLM_CACHE_LOOKUPS, operation='call_model', result='hit')
+        saved = _count(LLM_CACHE_BYTES_SAVED, operation='call_model')
+
+        first = self.client.call_model('Outline a book on\n\n\n  sourdough   baking ', temperature=0.5)
+        second = self.client.call_model('Outline a book on\n\nsourdough baking', temperature=0.5)
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertNotIn('cached', first)
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['response'], first['response'])
+        self.assertEqual(second['tokens'], 5)
+        self.assertEqual(_count(LLM_CACHE_LOOKUPS, operation='call_model', result='hit'), hits + 1)
+        self.assertGreater(_count(LLM_CACHE_BYTES_SAVED, operation='call_model'), saved)
+
+    def test_model_and_sampling_parameters_are_part_of_the_key(self):
+        self.client.call_model('Hi', temperature=0.5)
+        self.client.call_model('Hi', temperature=0.9)
+        self.client.call_model('Hi', temperature=0.5, max_tokens=10)
+        self.client.call_model('Hi', temperature=0.5, model='@cf/other/model')
+
+        self.assertEqual(self.server.requests, 4)
+
+    def test_bypass_sends_the_call(self):
+        self.client.call_model('Hi')
+        self.client.call_model('Hi', cache=False)
+        with response_cache.bypass():
+            self.client.call_model('Hi')
+
+        self.assertEqual(self.server.requests, 3)
+
+    def test_failures_are_not_cached(self):
+        self.server.statuses = [500, 500]
+
+        with self.assertLogs('customllm.services.cloudflare_client', 'ERROR'):
+            self.assertFalse(self.client.call_model('Hi')['success'])
+        self.assertTrue(self.client.call_model('Hi')['success'])
+
+        self.assertEqual(self.server.requests, 3)
+
+    def test_images_are_cached(self):
+        first = self.client.generate_image('A lighthouse at dusk', width=512)
+        second = self.client.generate_image('A lighthouse at dusk', width=512)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.requests, 1)
+
+
+class DiskCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_evicts_least_recently_used_entries_over_the_size_limit(self):
+        cache = response_cache.DiskCache(self.directory, max_bytes=300, ttl=60)
+        cache.set('aa01', b'a' * 100)
+        cache.set('bb02', b'b' * 100)
+        past = time.time() - 30
+        os.utime(cache._path('aa01'), (past, past))
+        os.utime(cache._path('bb02'), (past + 1, past + 1))
+        self.assertEqual(cache.get('aa01'), b'a' * 100)  # now the most recent
+
+        cache.set('cc03', b'c' * 100)
+
+        self.assertIsNone(cache.get('bb02'))
+        self.assertEqual(cache.get('aa01'), b'a' * 100)
+        self.assertEqual(cache.get('cc03'), b'c' * 100)
+        self.assertEqual(cache.usage()['entries'], 2)
+
+    def test_entries_expire(self):
+        cache = response_cache.DiskCache(self.directory, max_bytes=1000, ttl=60)
+        cache.set('aa01', b'value')
+
+        with mock.patch('customllm.services.response_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('aa01'))
+        self.assertEqual(cache.usage()['entries'], 0)
+
+
+class StreamingOutlineParserTests(SimpleTestCase):
+    RESPONSE = (
+        "TITLE: Sourdough at Home\n\nCHAPTERS:\n"
+        "1. Starters - Feeding and keeping a culture\n"
+        "2. Flour\n"
+        "3.\nShaping - Tension without tearing\n"
+    )
+
+    def test_emits_entries_as_their_lines_complete(self):
+        parser = StreamingOutlineParser()
+
+        self.assertEqual(parser.feed('TITLE: Sourdough'), [])
+        self.assertEqual(parser.feed(' at Home\n\nCHAPTERS:\n1. Star'), [('title', 'Sourdough at Home')])
+        self.assertEqual(parser.feed('ters - Feeding'), [])
+        self.assertEqual(
+            parser.feed(' and keeping a culture\n2. Flour'),
+            [('chapter', {'number': 1, 'title': 'Starters', 'description': 'Feeding and keeping a culture'})],
+        )
+        self.assertEqual(parser.close(), [('chapter', {'number': 2, 'title': 'Flour', 'description': ''})])
+
+    def test_any_chunking_matches_parse_outline(self):
+        expected = ResponseParser().parse_outline(self.RESPONSE)
+        self.assertEqual([c['title'] for c in expected['chapters']], ['Starters', 'Flour', 'Shaping'])
+
+        for size in (1, 2, 5, 13, len(self.RESPONSE)):
+            parser = StreamingOutlineParser()
+            for start in range(0, len(self.RESPONSE), size):
+                parser.feed(self.RESPONSE[start:start + size])
+            parser.close()
+            self.assertEqual(parser.outline(), expected)
+
+    def test_nested_bullets_match_the_one_shot_regex(self):
+        responses = [
+            "TITLE: Keto Basics\n\nCHAPTERS:\n1. Introduction\n   - What keto is\n   - Who it suits\n"
+            "2. Macros\n\n   - Fat, protein and carbs\n3. Meal Plans\n",
+            "TITLE:\nKeto Basics\n1. Introduction -\n   What keto is\n2. Low-carb swaps\n-\n3. Recipes",
+            "TITLE: \n\nKeto\n1. Introduction\n  -   \n  - What keto is\n2.\n\n Macros\n",
+        ]
+        for response in responses:
+            # The regexes parse_outline applied to the whole response before streaming
+            title = re.search(r'TITLE:\s*(.+?)(?:\n|$)', response, re.IGNORECASE)
+            chapters = [
+                {'number': int(m.group(1)), 'title': m.group(2).strip(),
+                 'description': m.group(3).strip() if m.group(3) else ''}
+                for m in re.finditer(r'(\d+)\.\s*([^\n-]+?)(?:\s*-\s*([^\n]+))?(?:\n|$)', response)
+            ]
+            expected = {'title': title.group(1).strip(), 'chapters': chapters, 'total_chapters': len(chapters)}
+
+            self.assertEqual(ResponseParser().parse_outline(response), expected)
+            for size in (1, 3, 7, len(response)):
+                parser = StreamingOutlineParser()
+                streamed = []
+                for start in range(0, len(response), size):
+                    streamed += parser.feed(response[start:start + size])
+                streamed += parser.close()
+                self.assertEqual(parser.outline(), expected)
+                self.assertEqual([value for kind, value in streamed if kind == 'chapter'], chapters)
+
+        outline = ResponseParser().parse_outline(responses[0])
+        self.assertEqual(outline['chapters'][0]['description'], 'What keto is')
+        self.assertEqual(outline['chapters'][1]['description'], 'Fat, protein and carbs')
+
+
+@override_settings(METRICS_DIR='', LLM_CACHE_BACKEND='', RATE_LIMITS={}, CLOUDFLARE_RETRY_BACKOFF=0,
+                   CLOUDFLARE_MAX_RETRIES=1)
+class StreamingBookTests(SimpleTestCase):
+    CHAPTERS = 6
+    LINE_DELAY = 0.05
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            self.service = CustomModelService()
+        self.service.client.async_transport = httpx.MockTransport(self._handle)
+        self.outline_status = 200
+        self.outline_finished = None
+        self.chapter_requests = []
+
+    async def _outline_stream(self):
+        lines = ['TITLE: Sourdough at Home', '', 'CHAPTERS:']
+        lines += [f'{n}. Topic {n} Basics - What topic {n} covers' for n in range(1, self.CHAPTERS + 1)]
+        for line in lines:
+            # Split each line across events, as token streaming does
+            for piece in (line[:7], line[7:] + '\n'):
+                yield f'data: {json.dumps({"response": piece})}\n\n'.encode()
+            await asyncio.sleep(self.LINE_DELAY)
+        yield b'data: [DONE]\n\n'
+        self.outline_finished = time.perf_counter()
+
+    async def _handle(self, request):
+        payload = json.loads(request.content)
+        if payload.get('stream'):
+            if self.outline_status != 200:
+                return httpx.Response(self.outline_status, json={'success': False})
+            return httpx.Response(200, content=self._outline_stream(), headers={'Content-Type': 'text/event-stream'})
+        prompt = payload['messages'][0]['content']
+        number = int(re.search(r'Topic (\d+) Basics', prompt).group(1))
+        self.chapter_requests.append((number, time.perf_counter()))
+        await asyncio.sleep(0.02)
+        body = f'Chapter body for topic {number}. ' + 'It explains the topic step by step. ' * 4
+        return httpx.Response(200, json={'result': {'response': body}})
+
+    def test_chapters_start_while_the_outline_streams(self):
+        result = self.service.generate_book_streaming('Tech', 'Baking', 'beginners', concurrency=3)
+
+        self.assertEqual(result['outline']['title'], 'Sourdough at Home')
+        self.assertEqual(result['outline']['total_chapters'], self.CHAPTERS)
+        self.assertEqual(
+            [chapter['content'].split('.')[0] for chapter in result['chapters']],
+            [f'Chapter body for topic {n}' for n in range(1, self.CHAPTERS + 1)],
+        )
+        first_number, first_requested = self.chapter_requests[0]
+        self.assertEqual(first_number, 1)
+        self.assertLess(first_requested, self.outline_finished)
+        self.assertLess(result['metadata']['first_chapter_seconds'], result['metadata']['outline_seconds'])
+
+    def test_fatal_outline_response_raises(self):
+        self.outline_status = 403
+
+        with self.assertRaises(CloudflareFatalError):
+            self.service.generate_book_streaming('Tech', 'Baking', 'beginners')
+        self.assertEqual(self.chapter_requests, [])
+
+
+@override_settings(METRICS_DIR='', RATE_LIMIT_REDIS_URL='', RATE_LIMIT_TIMEOUT=5)
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = rate_limiter.TokenBucketLimiter()
+
+    def test_token_bucket_paces_calls_after_the_burst(self):
+        with override_settings(RATE_LIMITS={'cloudflare': {'rpm': 600, 'burst': 2}}):
+            started = time.monotonic()
+            for _ in range(5):
+                with self.limiter.limit('cloudflare', 'm'):
+                    pass
+            elapsed = time.monotonic() - started
+
+        # Two from the burst, then one every 0.1s
+        self.assertGreaterEqual(elapsed, 0.28)
+        self.assertLess(elapsed, 1)
+
+    def test_model_override_replaces_provider_limits(self):
+        with override_settings(RATE_LIMITS={'cloudflare': {'rpm': 60, 'burst': 5}, 'cloudflare:img': {'rpm': 720}}):
+            self.assertEqual(rate_limiter.limits_for('cloudflare', 'img'), rate_limiter.Limits(720, 5, 0))
+            self.assertEqual(rate_limiter.limits_for('cloudflare', 'text'), rate_limiter.Limits(60, 5, 0))
+            self.assertTrue(rate_limiter.limits_for('other', 'text').unlimited)
+
+    def test_fail_fast_refuses_without_waiting(self):
+        rejected = _count(RATE_LIMIT_REJECTIONS, provider='cloudflare', model='m', reason='fail_fast')
+        with override_settings(RATE_LIMITS={'cloudflare': {'rpm': 1, 'burst': 1}}):
+            with self.limiter.limit('cloudflare', 'm'):
+                pass
+            started = time.monotonic()
+            with self.assertRaises(rate_limiter.RateLimitExceeded):
+                with self.limiter.limit('cloudflare', 'm', mode='fail_fast'):
+                    pass
+
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(_count(RATE_LIMIT_REJECTIONS, provider='cloudflare', model='m', reason='fail_fast'), rejected + 1)
+
+    def test_concurrency_slots_block_until_released_or_timeout(self):
+        with override_settings(RATE_LIMITS={'cloudflare': {'concurrency': 1}}):
+            holding, release = threading.Event(), threading.Event()
+
+            def hold():
+                with self.limiter.limit('cloudflare', 'm'):
+                    holding.set()
+                    release.wait(5)
+
+            holder = threading.Thread(target=hold)
+            holder.start()
+            holding.wait(5)
+            with self.assertRaises(rate_limiter.RateLimitExceeded):
+                with self.limiter.limit('cloudflare', 'm', timeout=0.1):
+                    pass
+
+            threading.Timer(0.1, release.set).start()
+            started = time.monotonic()
+            with self.limiter.limit('cloudflare', 'm', timeout=2):
+                waited = time.monotonic() - started
+            holder.join()
+
+        self.assertGreaterEqual(waited, 0.05)
+
+    def test_redis_script_shares_tokens_and_slots_between_workers(self):
+        import redis
+
+        url = os.environ.get('TEST_REDIS_URL', 'redis://127.0.0.1:6379/15')
+        try:
+            redis.Redis.from_url(url, socket_connect_timeout=0.5).ping()
+        except redis.RedisError:
+            self.skipTest(f'No Redis at {url}; set TEST_REDIS_URL')
+
+        key = f'test:{uuid.uuid4().hex}'
+        self.addCleanup(redis.Redis.from_url(url).delete, f'ratelimit:{key}:bucket', f'ratelimit:{key}:leases')
+        # Two workers' limiters, 60 a minute in bursts of 2, one call at a time
+        first, second = rate_limiter.TokenBucketLimiter(url), rate_limiter.TokenBucketLimiter(url)
+        limits = rate_limiter.Limits(60, 2, 1)
+
+        self.assertEqual(first.try_acquire(key, limits, 'a'), ('redis', 0))
+        self.assertEqual(second.try_acquire(key, limits, 'b'), (None, -1))
+        first.release(key, limits, 'a', 'redis')
+        self.assertEqual(second.try_acquire(key, limits, 'b'), ('redis', 0))
+        second.release(key, limits, 'b', 'redis')
+
+        backend, wait = first.try_acquire(key, limits, 'c')
+        self.assertIsNone(backend)
+        self.assertGreater(wait, 0.5)
+        self.assertLessEqual(wait, 1)
+
+        # A lease left by a killed worker expires
+        short = rate_limiter.TokenBucketLimiter(url, lease_seconds=0.2)
+        unlimited_rate = rate_limiter.Limits(0, 1, 1)
+        self.assertEqual(short.try_acquire(key, unlimited_rate, 'killed'), ('redis', 0))
+        self.assertEqual(first.try_acquire(key, unlimited_rate, 'd'), (None, -1))
+        time.sleep(0.3)
+        self.assertEqual(first.try_acquire(key, unlimited_rate, 'd'), ('redis', 0))
+
+    def test_unreachable_redis_falls_back_to_process_limits(self):
+        fallbacks = _count(RATE_LIMIT_LOCAL_FALLBACKS)
+        limiter = rate_limiter.TokenBucketLimiter('redis://127.0.0.1:1/0')
+
+        with override_settings(RATE_LIMITS={'cloudflare': {'rpm': 60, 'burst': 1}}):
+            with self.assertLogs('customllm.services.rate_limiter', 'WARNING'):
+                with limiter.limit('cloudflare', 'm'):
+                    pass
+            with self.assertRaises(rate_limiter.RateLimitExceeded):
+                with limiter.limit('cloudflare', 'm', mode='fail_fast'):
+                    pass
+
+        self.assertEqual(_count(RATE_LIMIT_LOCAL_FALLBACKS), fallbacks + 2)
+
+
+@override_settings(METRICS_DIR='', LLM_CACHE_BACKEND='', RATE_LIMITS={}, CLOUDFLARE_RETRY_BACKOFF=0,
+                   CLOUDFLARE_MAX_RETRIES=1)
+class StandInServerTests(SimpleTestCase):
+    def setUp(self):
+        caches[outline_cache.CACHE_ALIAS].clear()
+        self.server = StandInServer(config=StandInConfig(latency_ms=0, token_delay_ms=0, seed=1)).start()
+        self.addCleanup(self.server.stop)
+        cloudflare_client.reset_session()
+        self.addCleanup(cloudflare_client.reset_session)
+
+        settings_override = override_settings(CLOUDFLARE_API_BASE_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # No credentials needed once the base URL points elsewhere
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+        os.environ.pop('CLOUDFLARE_API_TOKEN', None)
+        os.environ.pop('CLOUDFLARE_ACCOUNT_ID', None)
+
+    def test_serves_outlines_chapters_streams_and_images(self):
+        service = CustomModelService()
+
+        outline = service.generate_book_outline('Tech', 'Home Baking', 'beginners')
+        self.assertTrue(outline['outline']['title'].startswith('Home Baking'))
+        self.assertEqual(outline['chapters'], 8)
+
+        chapter = service.generate_chapter_content('Starters', 'Keeping a culture', {'domain': 'Tech'}, word_count=300)
+        self.assertGreater(chapter['word_count'], 200)
+
+        streamed = ''.join(service.client.generate_text_stream('Write 300 words about starters'))
+        self.assertEqual(streamed, service.client.call_model('Write 300 words about starters')['response'])
+
+        image = service.client.generate_image('A lighthouse', width=64, height=32)
+        self.assertTrue(image.startswith(b'\x89PNG'))
+        self.assertEqual(struct.unpack('>II', image[16:24]), (64, 32))
+
+        self.assertIn('@cf/meta/llama-3.1-8b-instruct', service.client.get_available_models())
+        self.assertEqual(self.server.stats()['statuses'], {'200': 5})
+
+    def test_injected_throttling_is_retried(self):
+        self.server.config.throttle_rate = 1.0
+        retried = _count(CLOUDFLARE_RETRIES, reason='429')
+
+        with self.assertLogs('customllm.services.cloudflare_client', 'ERROR'):
+            result = CloudflareAIClient().call_model('Hi')
+
+        self.assertFalse(result['success'])
+        self.assertEqual(self.server.stats()['statuses'], {'429': 2})
+        self.assertEqual(_count(CLOUDFLARE_RETRIES, reason='429'), retried + 1)
+
+    def test_enforces_requests_per_minute(self):
+        self.server.config.rpm = 2
+
+        statuses = [self.server.decide('@cf/m') for _ in range(3)] + [self.server.decide('@cf/other')]
+
+        self.assertEqual(statuses, [200, 200, 429, 200])
+
+    def test_latency_distributions(self):
+        config = self.server.config
+        config.latency_ms, config.latency_jitter_ms = 100, 20
+        for distribution in ('fixed', 'uniform', 'normal', 'lognormal'):
+            config.latency_distribution = distribution
+            samples = [self.server.latency() for _ in range(500)]
+            self.assertAlmostEqual(sum(samples) / len(samples), 0.1, delta=0.01, msg=distribution)
+            if distribution == 'uniform':
+                self.assertTrue(all(0.08 <= sample <= 0.12 for sample in samples))
+
+
+@override_settings(METRICS_DIR='', OUTLINE_CACHE_VARIANTS=2)
+class OutlineCacheTests(SimpleTestCase):
+    FIELDS = {
+        'domain': 'Parenting',
+        'niche': 'Toddler Sleep',
+        'audience': 'new parents',
+        'page_count': 30,
+        'niche_content_skeleton': [{'title': 'Routines'}],
+    }
+
+    def setUp(self):
+        caches[outline_cache.CACHE_ALIAS].clear()
+        self.addCleanup(caches[outline_cache.CACHE_ALIAS].clear)
+        self.generated = 0
+
+    def _generate(self):
+        self.generated += 1
+        return {'outline': {'title': f'Outline {self.generated}', 'chapters': []}, 'metadata': {'elapsed_time': 1}}
+
+    def test_serves_variants_round_robin_after_generating_them(self):
+        misses = _count(OUTLINE_CACHE_LOOKUPS, source='local', result='miss')
+        hits = _count(OUTLINE_CACHE_LOOKUPS, source='local', result='hit')
+
+        results = [outline_cache.get_or_generate('local', self.FIELDS, self._generate) for _ in range(6)]
+
+        self.assertEqual(self.generated, 2)
+        self.assertEqual(
+            [result['outline']['title'] for result in results],
+            ['Outline 1', 'Outline 2', 'Outline 1', 'Outline 2', 'Outline 1', 'Outline 2'],
+        )
+        self.assertEqual(results[0]['metadata']['outline_cache'], {'hit': False, 'variant': 0, 'variants': 2})
+        self.assertEqual(results[3]['metadata']['outline_cache'], {'hit': True, 'variant': 1, 'variants': 2})
+        self.assertEqual(_count(OUTLINE_CACHE_LOOKUPS, source='local', result='miss'), misses + 2)
+        self.assertEqual(_count(OUTLINE_CACHE_LOOKUPS, source='local', result='hit'), hits + 4)
+
+    def test_hits_are_copies(self):
+        for _ in range(3):
+            outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+        outline_cache.get_or_generate('local', self.FIELDS, self._generate)['outline']['chapters'].append('edited')
+
+        again = outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+        self.assertEqual(again['outline']['chapters'], [])
+
+    def test_key_normalizes_text_but_covers_every_field(self):
+        spaced = dict(self.FIELDS, niche='  toddler   SLEEP ', custom_outline_instructions='')
+        self.assertEqual(outline_cache.cache_key('local', spaced), outline_cache.cache_key('local', self.FIELDS))
+
+        for changed in (
+            dict(self.FIELDS, niche_content_skeleton=[{'title': 'Naps'}]),
+            dict(self.FIELDS, custom_outline_instructions='Start with bedtime stories'),
+            dict(self.FIELDS, page_count=60),
+        ):
+            self.assertNotEqual(outline_cache.cache_key('local', changed), outline_cache.cache_key('local', self.FIELDS))
+        self.assertNotEqual(outline_cache.cache_key('cloudflare:m', self.FIELDS),
+                            outline_cache.cache_key('local', self.FIELDS))
+
+    @override_settings(OUTLINE_CACHE_VARIANTS=0)
+    def test_zero_variants_disables_memoization(self):
+        for _ in range(3):
+            result = outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+
+        self.assertEqual(self.generated, 3)
+        self.assertEqual(result['metadata']['outline_cache'], {'hit': False, 'variant': None, 'variants': 0})
+
+    def test_failures_are_not_stored(self):
+        def fail():
+            raise RuntimeError('model down')
+
+        with self.assertRaises(RuntimeError):
+            outline_cache.get_or_generate('local', self.FIELDS, fail)
+        outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+
+        self.assertEqual(self.generated, 1)
+
+    def test_evicted_keys_are_regenerated(self):
+        outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+        caches[outline_cache.CACHE_ALIAS].delete(outline_cache.cache_key('local', self.FIELDS))
+
+        result = outline_cache.get_or_generate('local', self.FIELDS, self._generate)
+
+        self.assertFalse(result['metadata']['outline_cache']['hit'])
+        self.assertEqual(result['metadata']['outline_cache']['variant'], 0)
+        self.assertEqual(self.generated, 2)
+
+    def test_local_generator_shares_outlines_between_books(self):
+        # An engine without training data, as ChapterStreamTests builds; no database here
+        untrained = mock.patch.object(LocalLLMEngine, '_load_training_data',
+                                      lambda engine: setattr(engine, 'training_data', {}))
+        with untrained, mock.patch.dict(os.environ, {'CLOUDFLARE_API_TOKEN': 'token', 'CLOUDFLARE_ACCOUNT_ID': 'account'}):
+            generator = CustomBookGenerator()
+        context = dict(self.FIELDS, title='Sleep Tight', style='warm')
+
+        with mock.patch.object(generator.llm, 'generate_outline', wraps=generator.llm.generate_outline) as generate:
+            results = [generator.generate_book_outline(dict(context)) for _ in range(4)]
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(results[2]['outline'], results[0]['outline'])
+        self.assertTrue(results[3]['metadata']['outline_cache']['hit'])
+
+
+@override_settings(METRICS_DIR='')
+class ChapterStreamTests(SimpleTestCase):
+    CONTEXT = {'domain': 'Parenting', 'niche': 'Toddler Sleep', 'audience': 'new parents'}
+
+    def _engine(self, training_data):
+        engine = LocalLLMEngine.__new__(LocalLLMEngine)
+        engine.training_data = training_data
+        return engine
+
+    def _assert_stream_matches(self, engine):
+        random.seed(7)
+        pieces = list(engine.stream_chapter_content('Naps', 'Why naps matter', self.CONTEXT, 800, ['Routines']))
+        random.seed(7)
+        chapter = engine.generate_chapter_content('Naps', 'Why naps matter', self.CONTEXT, 800, ['Routines'])
+
+        self.assertEqual(''.join(pieces), chapter['content'])
+        self.assertTrue(pieces[0].startswith('# Naps'))
+        self.assertTrue(all('#### ' in piece for piece in pieces[1:5]))
+        return pieces
+
+    def test_trained_chapters_stream_intro_subsections_and_conclusion(self):
+        engine = self._engine({'parenting': {'chapter': [{'completion': 'Sleep well.', 'quality_score': 1}]}})
+        pieces = self._assert_stream_matches(engine)
+        self.assertEqual(len(pieces), 1 + 4 + 1)
+        self.assertIn('#### Routines', pieces[1])
+
+    def test_fallback_chapters_stream_each_subsection(self):
+        with self.assertLogs('customllm.services.local_llm_engine', 'WARNING'):
+            pieces = self._assert_stream_matches(self._engine({}))
+        self.assertEqual(len(pieces), 1 + 4)
@@ -3,6 +3,7 @@ import stripe
 from django.conf import settings
 from django.utils import timezone
 from .models import Subscription, SubscriptionPlan, Payment, WebhookEvent
+from users.analytics import record_payment
 import logging
 
 logger = logging.getLogger(__name__)
@@ -258,6 +259,8 @@ class StripeService:
                     metadata=invoice
                 )
 
+                record_payment(subscription.user_id, invoice['amount_paid'] / 100)
+
                 logger.info(f"Recorded successful payment for subscription {subscription.id}")
 
         except Exception as e:
@@ -6,7 +6,6 @@ from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-import stripe
 import json
 import logging
 
@@ -15,12 +14,11 @@ from .serializers import (
     SubscriptionPlanSerializer, SubscriptionSerializer,
     PaymentSerializer, CreateSubscriptionSerializer
 )
-from .services import StripeService
 
 logger = logging.getLogger(__name__)
 
-# Initialize Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# The Stripe SDK takes most of a second to import, so it (and StripeService)
+# is imported inside the views that talk to Stripe rather than at URL load
 
 class SubscriptionPlanListView(generics.ListAPIView):
     """List all active subscription plans"""
@@ -59,6 +57,8 @@ class CreateSubscriptionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        from .services import StripeService
+
         serializer = CreateSubscriptionSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -91,6 +91,8 @@ class CancelSubscriptionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        from .services import StripeService
+
         try:
             subscription = get_object_or_404(Subscription, user=request.user)
 
@@ -118,6 +120,8 @@ class ReactivateSubscriptionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        from .services import StripeService
+
         try:
             subscription = get_object_or_404(Subscription, user=request.user)
 
@@ -145,6 +149,8 @@ class UpdateSubscriptionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        from .services import StripeService
+
         plan_id = request.data.get('plan_id')
         if not plan_id:
             return Response(
@@ -184,6 +190,9 @@ class StripeWebhookView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
+        import stripe
+        from .services import StripeService
+
         payload = request.body
         sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
 
@@ -0,0 +1,198 @@
+"""
+Incremental maintenance of UserAnalyticsRollup
+
+Writers call the ``record_*`` / ``refresh_*`` helpers when the underlying
+data changes; readers (DashboardView, UserProfileViewSet.analytics) only
+read the rollup row. Counters use F() expressions so concurrent workers
+never lose increments. If a user has no rollup yet, the first event
+rebuilds it from the source tables.
+
+Analytics must never break the request or task that triggered them, so
+every helper logs and swallows database errors.
+"""
+
+import functools
+import logging
+from decimal import Decimal
+
+from django.db import DatabaseError
+from django.db.models import Case, F, PositiveIntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Payment, Subscription, UserActivity, UserAnalyticsRollup
+
+logger = logging.getLogger(__name__)
+
+RECENT_BOOKS = 5
+RECENT_ACTIVITY = 10
+
+
+def _best_effort(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except DatabaseError as exc:
+            logger.warning(f"Analytics rollup update {func.__name__} failed: {exc}")
+            return None
+    return wrapper
+
+
+def _month_start(value=None):
+    value = value or timezone.now()
+    if hasattr(value, 'date'):
+        value = timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value.replace(day=1)
+
+
+def _recent_books(user_id):
+    from books.models import Book
+
+    return list(
+        Book.objects.filter(user_id=user_id)
+        .order_by('-created_at')
+        .values('id', 'title', 'status', 'progress_percentage', 'created_at')[:RECENT_BOOKS]
+    )
+
+
+def _recent_activity(user_id):
+    from .serializers import UserActivitySerializer
+
+    activities = UserActivity.objects.filter(user_id=user_id).select_related('user').order_by('-timestamp')[:RECENT_ACTIVITY]
+    return UserActivitySerializer(activities, many=True).data
+
+
+def _current_subscription(user_id):
+    from .serializers import SubscriptionSerializer
+
+    subscription = (
+        Subscription.objects.filter(user_id=user_id, status='active')
+        .select_related('user', 'plan')
+        .first()
+    )
+    return SubscriptionSerializer(subscription).data if subscription else None
+
+
+def _total_revenue(user_id):
+    from payments.models import Payment as StripePayment
+
+    # Manual/legacy payments live in users.Payment, Stripe webhooks write
+    # payments.Payment; both count toward revenue.
+    legacy = Payment.objects.filter(user_id=user_id, status='completed').aggregate(total=Sum('amount'))['total']
+    stripe = StripePayment.objects.filter(user_id=user_id, status='succeeded').aggregate(total=Sum('amount'))['total']
+    return (legacy or Decimal('0')) + (stripe or Decimal('0'))
+
+
+def rebuild_rollup(user_id):
+    """Recompute a user's rollup from the source tables."""
+    from books.models import Book
+    from .models import DownloadHistory
+
+    month = _month_start()
+    activity = _recent_activity(user_id)
+    rollup, _ = UserAnalyticsRollup.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'books_created': Book.objects.filter(user_id=user_id).count(),
+            'books_downloaded': DownloadHistory.objects.filter(user_id=user_id).count(),
+            'total_revenue': _total_revenue(user_id),
+            'month': month,
+            'monthly_books': Book.objects.filter(
+                user_id=user_id,
+                created_at__date__gte=month,
+            ).count(),
+            'last_activity_at': activity[0]['timestamp'] if activity else None,
+            'recent_books': _recent_books(user_id),
+            'recent_activity': activity,
+            'current_subscription': _current_subscription(user_id),
+            'rebuilt_at': timezone.now(),
+        },
+    )
+    return rollup
+
+
+def get_rollup(user):
+    """Rollup with ``user`` and ``user.profile`` in one query, built on first use."""
+    rollup = (
+        UserAnalyticsRollup.objects.select_related('user', 'user__profile')
+        .filter(user=user)
+        .first()
+    )
+    if rollup is None:
+        rebuild_rollup(user.pk)
+        rollup = UserAnalyticsRollup.objects.select_related('user', 'user__profile').get(user=user)
+    return rollup
+
+
+def _update(user_id, rebuild_missing=True, **fields):
+    """Apply an incremental update; rebuild when the user has no rollup yet."""
+    if not UserAnalyticsRollup.objects.filter(user_id=user_id).update(**fields) and rebuild_missing:
+        rebuild_rollup(user_id)
+
+
+@_best_effort
+def record_book_created(book):
+    month = _month_start(book.created_at)
+    _update(
+        book.user_id,
+        books_created=F('books_created') + 1,
+        monthly_books=Case(
+            When(month=month, then=F('monthly_books') + 1),
+            default=Value(1),
+            output_field=PositiveIntegerField(),
+        ),
+        month=month,
+        recent_books=_recent_books(book.user_id),
+    )
+
+
+@_best_effort
+def record_book_deleted(book):
+    month = _month_start(book.created_at)
+    # Never rebuild here: the delete may be part of deleting the user
+    _update(
+        book.user_id,
+        rebuild_missing=False,
+        books_created=Case(
+            When(books_created__gt=0, then=F('books_created') - 1),
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        ),
+        monthly_books=Case(
+            When(month=month, monthly_books__gt=0, then=F('monthly_books') - 1),
+            default=F('monthly_books'),
+            output_field=PositiveIntegerField(),
+        ),
+        recent_books=_recent_books(book.user_id),
+    )
+
+
+@_best_effort
+def refresh_recent_books(user_id):
+    """Call after a pipeline step changes a book's title, status or progress."""
+    _update(user_id, recent_books=_recent_books(user_id))
+
+
+@_best_effort
+def record_download(user_id):
+    _update(user_id, books_downloaded=F('books_downloaded') + 1)
+
+
+@_best_effort
+def record_payment(user_id, amount):
+    _update(user_id, total_revenue=F('total_revenue') + Decimal(str(amount)))
+
+
+@_best_effort
+def refresh_recent_activity(user_id):
+    activity = _recent_activity(user_id)
+    _update(
+        user_id,
+        recent_activity=activity,
+        last_activity_at=activity[0]['timestamp'] if activity else None,
+    )
+
+
+@_best_effort
+def refresh_subscription(user_id):
+    _update(user_id, current_subscription=_current_subscription(user_id))
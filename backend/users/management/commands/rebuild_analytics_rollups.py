@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from users.analytics import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user analytics rollups from books, downloads, payments and activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=[], metavar='USERNAME',
+                            help='Only rebuild these users (repeatable)')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username__in=options['user'])
+
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            rebuild_rollup(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} analytics rollup(s)'))
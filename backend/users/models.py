@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from decimal import Decimal
 import uuid
@@ -94,34 +95,21 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.subscription_tier}"
     
+    @property
+    def current_books_used(self):
+        """Books used in the current month (a stale period counts as 0)"""
+        from .quota import books_used
+        return books_used(self)
+    
     def can_create_book(self):
         """Check if user can create a new book based on their monthly limits"""
-        if self.subscription_tier == 'testing':
-            # Testing tier has unlimited books
-            return True
-        elif self.subscription_tier == 'free':
-            return self.books_used_this_month < 2
-        elif self.subscription_tier == 'parents':
-            return self.books_used_this_month < 8
-        elif self.subscription_tier == 'creators':
-            return self.books_used_this_month < 12
-        return False
+        from .quota import has_quota
+        return has_quota(self)
     
     def increment_book_usage(self):
-        """Increment the monthly book usage"""
-        self.books_used_this_month += 1
-        self.save()
-    
-    def reset_monthly_usage(self):
-        """Reset monthly usage at the start of new month"""
-        import datetime
-        today = timezone.now().date()
-        
-        # Check if we need to reset (new month)
-        if self.monthly_reset_date.month != today.month or self.monthly_reset_date.year != today.year:
-            self.books_used_this_month = 0
-            self.monthly_reset_date = today
-            self.save()
+        """Atomically take one book from the monthly quota; False if over the limit"""
+        from .quota import consume_book
+        return consume_book(self.user)
 
 
 class SubscriptionPlan(models.Model):
@@ -380,3 +368,38 @@ class Referral(models.Model):
     
     def __str__(self):
         return f"{self.referrer.username} referred {self.referee.username} - {self.status}"
+
+
+class UserAnalyticsRollup(models.Model):
+    """
+    Materialized per-user totals for the dashboard and analytics endpoints.
+
+    Counters are bumped incrementally by users.analytics (book creation,
+    pipeline status changes, downloads, payment webhooks); run
+    ``manage.py rebuild_analytics_rollups`` to recompute from source tables.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='analytics_rollup')
+    
+    # Counters
+    books_created = models.PositiveIntegerField(default=0)
+    books_downloaded = models.PositiveIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    month = models.DateField(help_text="First day of the month monthly_books refers to")
+    monthly_books = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+    
+    # Serialized snapshots served as-is by the dashboard
+    recent_books = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    recent_activity = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    current_subscription = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    
+    rebuilt_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Analytics rollup for {self.user.username}"
+    
+    def monthly_usage(self, today=None):
+        """Books created this month; 0 if the counter belongs to an earlier month."""
+        today = today or timezone.now().date()
+        return self.monthly_books if self.month == today.replace(day=1) else 0
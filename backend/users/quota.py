@@ -0,0 +1,100 @@
+"""
+Monthly book quota accounting
+
+The quota period is the calendar month; ``UserProfile.monthly_reset_date``
+holds the first day of the period ``books_used_this_month`` belongs to.
+Nothing resets counters eagerly: a profile whose period key is older than
+the current month simply counts as 0 used, and the first consume of the
+new month rewrites both fields in the same UPDATE.
+
+``consume_book`` is a single conditional UPDATE, so two concurrent
+creates can never both take the last slot and no increment is lost.
+"""
+
+import datetime
+
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import UserProfile
+
+# Books per month by subscription tier; None means unlimited
+TIER_BOOK_LIMITS = {
+    'free': 2,
+    'parents': 8,
+    'creators': 12,
+    'testing': None,
+}
+
+
+def current_period(today=None):
+    """First day of the current quota period."""
+    today = today or timezone.now().date()
+    return today.replace(day=1)
+
+
+def books_used(profile, today=None):
+    """Books used in the current period, treating a stale period as 0."""
+    reset_date = profile.monthly_reset_date
+    if isinstance(reset_date, datetime.datetime):
+        # Unsaved profiles still hold the timezone.now default
+        reset_date = reset_date.date()
+    if reset_date < current_period(today):
+        return 0
+    return profile.books_used_this_month
+
+
+def has_quota(profile, today=None):
+    """Read-only check for display; creation must go through consume_book."""
+    if profile.subscription_tier not in TIER_BOOK_LIMITS:
+        return False
+    limit = TIER_BOOK_LIMITS[profile.subscription_tier]
+    return limit is None or books_used(profile, today) < limit
+
+
+def _within_limit(period):
+    """Profiles that may take one more book this period."""
+    condition = Q(monthly_reset_date__lt=period)
+    for tier, limit in TIER_BOOK_LIMITS.items():
+        if limit is None:
+            condition |= Q(subscription_tier=tier)
+        else:
+            condition |= Q(subscription_tier=tier, books_used_this_month__lt=limit)
+    # Unknown tiers never match
+    return condition & Q(subscription_tier__in=list(TIER_BOOK_LIMITS))
+
+
+def consume_book(user, today=None):
+    """Atomically take one book from the user's monthly quota.
+
+    Returns True if the book may be created. Users without a profile are
+    not metered.
+    """
+    period = current_period(today)
+    stale = Q(monthly_reset_date__lt=period)
+    updated = (
+        UserProfile.objects.filter(user=user)
+        .filter(_within_limit(period))
+        .update(
+            books_used_this_month=Case(
+                When(stale, then=Value(1)),
+                default=F('books_used_this_month') + 1,
+            ),
+            monthly_reset_date=Case(
+                When(stale, then=Value(period)),
+                default=F('monthly_reset_date'),
+            ),
+        )
+    )
+    if updated:
+        return True
+    return not UserProfile.objects.filter(user=user).exists()
+
+
+def release_book(user, today=None):
+    """Give back a book taken by ``consume_book`` (e.g. creation failed)."""
+    UserProfile.objects.filter(
+        user=user,
+        monthly_reset_date__gte=current_period(today),
+        books_used_this_month__gt=0,
+    ).update(books_used_this_month=F('books_used_this_month') - 1)
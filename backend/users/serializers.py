@@ -24,7 +24,7 @@ class UserSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     """Enhanced user profile serializer"""
     user = UserSerializer(read_only=True)
-    books_used_this_month = serializers.IntegerField(read_only=True)
+    books_used_this_month = serializers.IntegerField(source='current_books_used', read_only=True)
     books_per_month = serializers.IntegerField(read_only=True)
     can_create_book = serializers.SerializerMethodField()
     
@@ -0,0 +1,24 @@
+# users/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from books.models import Book
+
+from . import analytics
+from .models import Subscription, UserActivity
+
+
+@receiver(post_save, sender=UserActivity)
+def activity_saved(sender, instance, created, **kwargs):
+    if created:
+        analytics.refresh_recent_activity(instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, **kwargs):
+    analytics.refresh_subscription(instance.user_id)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    analytics.record_book_deleted(instance)
@@ -1,3 +1,241 @@
-from django.test import TestCase
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from books.models import Book, Domain, Niche
+from users import analytics, quota
+from users.models import DownloadHistory, UserActivity, UserAnalyticsRollup, UserProfile
+
+
+class UsageReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', 'author@example.com', 'password123')
+        domain = Domain.objects.create(name='Nutrition', slug='nutrition')
+        niche = Niche.objects.create(domain=domain, name='Meal prep', slug='meal_prep')
+        cls.domain = domain
+
+        def book_on(day, status):
+            book = Book.objects.create(user=cls.user, title='Book', domain=domain, niche=niche, status=status)
+            created = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+            Book.objects.filter(pk=book.pk).update(created_at=created)
+
+        book_on(datetime.date(2025, 1, 6), 'ready')   # Monday
+        book_on(datetime.date(2025, 1, 6), 'error')
+        book_on(datetime.date(2025, 1, 8), 'ready')
+        book_on(datetime.date(2025, 3, 3), 'generating')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _report(self, period, start, end):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/users/usage-report/', {
+                'period': period, 'start_date': start, 'end_date': end,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data, len(queries)
+
+    def test_daily_report_fills_empty_days(self):
+        report, _ = self._report('daily', '2025-01-05', '2025-01-09')
+
+        self.assertEqual(report['summary'], {
+            'total_books': 3, 'successful_generations': 2, 'failed_generations': 1,
+        })
+        counts = [day['books_count'] for day in report['daily_breakdown']]
+        self.assertEqual(counts, [0, 2, 0, 1, 0])
+        self.assertEqual(report['daily_breakdown'][1]['status_distribution'], {'ready': 1, 'error': 1})
+
+    def test_weekly_and_monthly_buckets(self):
+        weekly, _ = self._report('weekly', '2025-01-01', '2025-01-14')
+        self.assertEqual(
+            [(w['week_start'], w['books_count']) for w in weekly['weekly_breakdown']],
+            [(datetime.date(2024, 12, 30), 0), (datetime.date(2025, 1, 6), 3), (datetime.date(2025, 1, 13), 0)],
+        )
+
+        monthly, _ = self._report('monthly', '2025-01-01', '2025-03-31')
+        self.assertEqual(
+            [(m['month'], m['books_count']) for m in monthly['monthly_breakdown']],
+            [('2025-01', 3), ('2025-02', 0), ('2025-03', 1)],
+        )
+        self.assertEqual(monthly['domain_distribution'], {self.domain.id: 4})
+
+    def test_query_count_is_independent_of_range(self):
+        _, short_range = self._report('daily', '2025-01-01', '2025-01-07')
+        _, long_range = self._report('daily', '2024-01-01', '2025-12-31')
+        self.assertEqual(short_range, long_range)
+
+
+class AnalyticsRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('writer', 'writer@example.com', 'password123')
+        UserProfile.objects.create(user=cls.user)
+        cls.domain = Domain.objects.create(name='Parenting', slug='parenting')
+        cls.niche = Niche.objects.create(domain=cls.domain, name='Sleep', slug='sleep')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _create_book(self, status='ready'):
+        book = Book.objects.create(
+            user=self.user, title='Sleep Guide', domain=self.domain, niche=self.niche, status=status,
+        )
+        analytics.record_book_created(book)
+        return book
+
+    def test_incremental_updates_match_rebuild(self):
+        first = self._create_book()
+        self._create_book(status='generating')
+        DownloadHistory.objects.create(user=self.user, book=first)
+        analytics.record_download(self.user.pk)
+        UserActivity.objects.create(user=self.user, activity_type='book_download')
+
+        incremental = UserAnalyticsRollup.objects.get(user=self.user)
+        rebuilt = analytics.rebuild_rollup(self.user.pk)
+
+        for field in ('books_created', 'books_downloaded', 'monthly_books'):
+            self.assertEqual(getattr(incremental, field), getattr(rebuilt, field), field)
+        self.assertEqual(incremental.books_created, 2)
+        self.assertEqual(len(incremental.recent_activity), 1)
+        self.assertIsNotNone(incremental.last_activity_at)
+
+    def test_deleting_a_book_decrements_counters(self):
+        self._create_book()
+        book = self._create_book()
+        book.delete()
+
+        rollup = UserAnalyticsRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.books_created, 1)
+        self.assertEqual(rollup.monthly_books, 1)
+        self.assertEqual(len(rollup.recent_books), 1)
+
+    def test_dashboard_and_analytics_are_single_query(self):
+        self._create_book()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/profiles/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_books_created'], 1)
+        self.assertEqual(response.data['monthly_usage'], 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recent_books'][0]['title'], 'Sleep Guide')
+
+
+class BookQuotaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('quota', 'quota@example.com', 'password123')
+        cls.profile = UserProfile.objects.create(user=cls.user, subscription_tier='free')
+        cls.domain = Domain.objects.create(name='Hobbies', slug='hobbies')
+        cls.niche = Niche.objects.create(domain=cls.domain, name='Gardening', slug='gardening')
+
+    def _profile(self):
+        return UserProfile.objects.get(pk=self.profile.pk)
+
+    def test_consume_stops_at_the_tier_limit(self):
+        self.assertTrue(quota.consume_book(self.user))
+        self.assertTrue(quota.consume_book(self.user))
+        self.assertFalse(quota.consume_book(self.user))
+        self.assertEqual(self._profile().books_used_this_month, 2)
+        self.assertFalse(self._profile().can_create_book())
+
+    def test_new_month_resets_lazily_in_the_same_update(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            books_used_this_month=2, monthly_reset_date=datetime.date(2020, 1, 15),
+        )
+        profile = self._profile()
+        self.assertEqual(profile.current_books_used, 0)
+        self.assertTrue(profile.can_create_book())
+
+        self.assertTrue(quota.consume_book(self.user))
+        profile = self._profile()
+        self.assertEqual(profile.books_used_this_month, 1)
+        self.assertEqual(profile.monthly_reset_date, quota.current_period())
+
+    def test_create_endpoint_rejects_over_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            books_used_this_month=2, monthly_reset_date=quota.current_period(),
+        )
+
+        response = client.post(
+            '/api/books/', {'domain': self.domain.slug, 'niche': self.niche.slug}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Book.objects.filter(user=self.user).exists())
+
+
+class BookQuotaConcurrencyTests(TransactionTestCase):
+    @contextmanager
+    def _file_database(self):
+        """
+        Threads reach Django's in-memory SQLite test DB through shared
+        cache, where a second writer fails at once with "table is locked".
+        Run against a file copy instead so writers take real locks and wait
+        on the busy timeout, as separate web and Celery processes do.
+        """
+        settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite' or not connection.is_in_memory_db():
+            yield
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'quota.sqlite3')
+            connection.ensure_connection()
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+            saved = settings_dict['NAME'], settings_dict['OPTIONS']
+            settings_dict['NAME'], settings_dict['OPTIONS'] = path, dict(saved[1], timeout=30)
+            try:
+                yield
+            finally:
+                settings_dict['NAME'], settings_dict['OPTIONS'] = saved
+
+    def _in_threads(self, target, count):
+        barrier = threading.Barrier(count)
+        results = []
+
+        def run():
+            try:
+                barrier.wait()
+                results.append(target())
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_parallel_consumes_never_exceed_the_limit(self):
+        user = User.objects.create_user('race', 'race@example.com', 'password123')
+        UserProfile.objects.create(user=user, subscription_tier='creators')
+        limit = quota.TIER_BOOK_LIMITS['creators']
+
+        with self._file_database():
+            results = self._in_threads(lambda: quota.consume_book(user), 40)
+            used = self._in_threads(lambda: UserProfile.objects.get(user=user).books_used_this_month, 1)
+
+        self.assertEqual(len(results), 40)
+        self.assertEqual(results.count(True), limit)
+        self.assertEqual(used, [limit])
@@ -4,11 +4,14 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models import Count, Sum, Avg
+from django.db.models import Count, Avg, DateField
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-import stripe
+from collections import defaultdict
 
+from .analytics import get_rollup
+from .quota import current_period
 from .models import (
     UserProfile, 
     SubscriptionPlan, 
@@ -52,36 +55,17 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def analytics(self, request):
         """Get user analytics data"""
-        profile = request.user.profile
-        
-        # Calculate analytics
-        total_books = request.user.books.count()
-        total_downloads = request.user.downloads.count()
-        total_revenue = request.user.payments.filter(
-            status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Get monthly usage
-        current_month = timezone.now().month
-        current_year = timezone.now().year
-        monthly_usage = request.user.books.filter(
-            created_at__year=current_year,
-            created_at__month=current_month
-        ).count()
-        
-        # Get last activity
-        last_activity = UserActivity.objects.filter(
-            user=request.user
-        ).first()
+        # Served from the materialized rollup (users/analytics.py)
+        rollup = get_rollup(request.user)
         
         analytics_data = {
-            'total_books_created': total_books,
-            'total_books_downloaded': total_downloads,
-            'total_revenue': total_revenue,
-            'monthly_usage': monthly_usage,
-            'subscription_tier': profile.subscription_tier,
-            'account_created_date': request.user.date_joined,
-            'last_activity_date': last_activity.timestamp if last_activity else None
+            'total_books_created': rollup.books_created,
+            'total_books_downloaded': rollup.books_downloaded,
+            'total_revenue': rollup.total_revenue,
+            'monthly_usage': rollup.monthly_usage(),
+            'subscription_tier': rollup.user.profile.subscription_tier,
+            'account_created_date': rollup.user.date_joined,
+            'last_activity_date': rollup.last_activity_at
         }
         
         serializer = UserAnalyticsSerializer(analytics_data)
@@ -102,15 +86,13 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         """Get current usage limits"""
         profile = request.user.profile
         
-        # Check if we need to reset monthly usage
-        profile.reset_monthly_usage()
-        
+        # The month rolls over lazily; nothing is written here
         return Response({
             'subscription_tier': profile.subscription_tier,
             'books_per_month': profile.books_per_month,
-            'books_used_this_month': profile.books_used_this_month,
+            'books_used_this_month': profile.current_books_used,
             'can_create_book': profile.can_create_book(),
-            'reset_date': profile.monthly_reset_date
+            'reset_date': current_period()
         })
 
 
@@ -348,122 +330,120 @@ class UsageReportView(APIView):
             start_date = serializer.validated_data['start_date']
             end_date = serializer.validated_data['end_date']
             
+            books = request.user.books.filter(
+                created_at__date__gte=start_date,
+                created_at__date__lte=end_date
+            )
+            
             # Generate report based on period
             if period == 'daily':
                 # Daily breakdown
-                report = self._generate_daily_report(start_date, end_date)
+                report = self._generate_daily_report(books, start_date, end_date)
             elif period == 'weekly':
                 # Weekly breakdown
-                report = self._generate_weekly_report(start_date, end_date)
+                report = self._generate_weekly_report(books, start_date, end_date)
             else:
                 # Monthly breakdown
-                report = self._generate_monthly_report(start_date, end_date)
+                report = self._generate_monthly_report(books, start_date, end_date)
             
             return Response(report)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    def _generate_daily_report(self, start_date, end_date):
-        """Generate daily usage report"""
-        books = request.user.books.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
+    def _grouped_counts(self, books, bucket):
+        """One GROUP BY (bucket, status, domain) query for the whole range.
+        
+        Returns ``({bucket_date: {status: count}}, summary, domain_distribution)``.
+        """
+        rows = (
+            books.order_by()
+            .annotate(bucket=bucket)
+            .values('bucket', 'status', 'domain')
+            .annotate(count=Count('id'))
         )
         
+        buckets = defaultdict(lambda: defaultdict(int))
+        domains = defaultdict(int)
+        summary = {'total_books': 0, 'successful_generations': 0, 'failed_generations': 0}
+        for row in rows:
+            count = row['count']
+            buckets[row['bucket']][row['status']] += count
+            domains[row['domain']] += count
+            summary['total_books'] += count
+            if row['status'] == 'ready':
+                summary['successful_generations'] += count
+            elif row['status'] == 'error':
+                summary['failed_generations'] += count
+        return buckets, summary, dict(domains)
+    
+    def _breakdown_entry(self, buckets, bucket_start):
+        distribution = dict(buckets.get(bucket_start, {}))
+        return {
+            'books_count': sum(distribution.values()),
+            'status_distribution': distribution,
+        }
+    
+    def _generate_daily_report(self, books, start_date, end_date):
+        """Generate daily usage report"""
+        buckets, summary, _ = self._grouped_counts(books, TruncDate('created_at'))
+        
         report = {
             'period': 'daily',
             'date_range': {'start': start_date, 'end': end_date},
-            'summary': {
-                'total_books': books.count(),
-                'successful_generations': books.filter(status='ready').count(),
-                'failed_generations': books.filter(status='error').count(),
-            },
+            'summary': summary,
             'daily_breakdown': []
         }
         
-        # Add daily breakdown
+        # Empty days are filled in here rather than queried
         current_date = start_date
         while current_date <= end_date:
-            day_books = books.filter(created_at__date=current_date)
             report['daily_breakdown'].append({
                 'date': current_date,
-                'books_count': day_books.count(),
-                'status_distribution': dict(
-                    day_books.values_list('status', flat=True)
-                    .annotate(count=Count('id'))
-                    .values_list('status', 'count')
-                )
+                **self._breakdown_entry(buckets, current_date),
             })
             current_date += timezone.timedelta(days=1)
         
         return report
     
-    def _generate_weekly_report(self, start_date, end_date):
+    def _generate_weekly_report(self, books, start_date, end_date):
         """Generate weekly usage report"""
-        books = request.user.books.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
+        buckets, summary, _ = self._grouped_counts(
+            books, TruncWeek('created_at', output_field=DateField())
         )
         
         report = {
             'period': 'weekly',
             'date_range': {'start': start_date, 'end': end_date},
-            'summary': {
-                'total_books': books.count(),
-                'successful_generations': books.filter(status='ready').count(),
-                'failed_generations': books.filter(status='error').count(),
-            },
+            'summary': summary,
             'weekly_breakdown': []
         }
         
-        # Add weekly breakdown
+        # TruncWeek buckets start on Monday, matching weekday() == 0
         current_week_start = start_date - timezone.timedelta(days=start_date.weekday())
         while current_week_start <= end_date:
-            current_week_end = current_week_start + timezone.timedelta(days=6)
-            week_books = books.filter(
-                created_at__date__gte=current_week_start,
-                created_at__date__lte=current_week_end
-            )
-            
             report['weekly_breakdown'].append({
                 'week_start': current_week_start,
-                'week_end': current_week_end,
-                'books_count': week_books.count(),
-                'status_distribution': dict(
-                    week_books.values_list('status', flat=True)
-                    .annotate(count=Count('id'))
-                    .values_list('status', 'count')
-                )
+                'week_end': current_week_start + timezone.timedelta(days=6),
+                **self._breakdown_entry(buckets, current_week_start),
             })
-            
             current_week_start += timezone.timedelta(days=7)
         
         return report
     
-    def _generate_monthly_report(self, start_date, end_date):
+    def _generate_monthly_report(self, books, start_date, end_date):
         """Generate monthly usage report"""
-        books = request.user.books.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
+        buckets, summary, domains = self._grouped_counts(
+            books, TruncMonth('created_at', output_field=DateField())
         )
         
         report = {
             'period': 'monthly',
             'date_range': {'start': start_date, 'end': end_date},
-            'summary': {
-                'total_books': books.count(),
-                'successful_generations': books.filter(status='ready').count(),
-                'failed_generations': books.filter(status='error').count(),
-            },
-            'domain_distribution': dict(
-                books.values_list('domain', flat=True)
-                .annotate(count=Count('id'))
-                .values_list('domain', 'count')
-            ),
+            'summary': summary,
+            'domain_distribution': domains,
             'monthly_breakdown': []
         }
         
-        # Add monthly breakdown
         current_month_start = start_date.replace(day=1)
         while current_month_start <= end_date:
             if current_month_start.month == 12:
@@ -471,19 +451,9 @@ class UsageReportView(APIView):
             else:
                 next_month = current_month_start.replace(month=current_month_start.month + 1)
             
-            month_books = books.filter(
-                created_at__date__gte=current_month_start,
-                created_at__date__lt=next_month
-            )
-            
             report['monthly_breakdown'].append({
                 'month': current_month_start.strftime('%Y-%m'),
-                'books_count': month_books.count(),
-                'status_distribution': dict(
-                    month_books.values_list('status', flat=True)
-                    .annotate(count=Count('id'))
-                    .values_list('status', 'count')
-                )
+                **self._breakdown_entry(buckets, current_month_start),
             })
             
             current_month_start = next_month
@@ -497,30 +467,15 @@ class DashboardView(APIView):
     
     def get(self, request):
         """Get dashboard overview"""
-        profile = request.user.profile
-        
-        # Reset monthly usage if needed
-        profile.reset_monthly_usage()
-        
-        # Get recent activity
-        recent_activity = UserActivity.objects.filter(
-            user=request.user
-        ).order_by('-timestamp')[:10]
-        
-        # Get recent books
-        recent_books = request.user.books.order_by('-created_at')[:5]
-        
-        # Get subscription info
-        current_subscription = Subscription.objects.filter(
-            user=request.user,
-            status='active'
-        ).first()
+        # One query: rollup + user + profile; lists are stored snapshots
+        rollup = get_rollup(request.user)
+        profile = rollup.user.profile
         
         dashboard_data = {
             'user_profile': UserProfileSerializer(profile).data,
-            'recent_activity': UserActivitySerializer(recent_activity, many=True).data,
-            'recent_books': recent_books,
-            'current_subscription': SubscriptionSerializer(current_subscription).data if current_subscription else None,
+            'recent_activity': rollup.recent_activity,
+            'recent_books': rollup.recent_books,
+            'current_subscription': rollup.current_subscription,
         }
         
         return Response(dashboard_data)
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import type { CursorPage } from '../types';
 
 // API Base URL - use proxy in development, can be overridden with VITE_API_BASE_URL env var
 // In development: requests to /api will be proxied to http://127.0.0.1:8000/api by Vite
@@ -66,6 +67,22 @@ apiClient.interceptors.response.use(
   }
 );
 
+// Follow a cursor-paginated endpoint until the last page
+export async function fetchAllPages<T>(url: string, pageSize = 100): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const params: Record<string, string | number> = { page_size: pageSize };
+    if (cursor) params.cursor = cursor;
+    const response = await apiClient.get<CursorPage<T>>(url, { params });
+    items.push(...response.data.results);
+    cursor = response.data.next
+      ? new URL(response.data.next, window.location.origin).searchParams.get('cursor')
+      : null;
+  } while (cursor);
+  return items;
+}
+
 // API Helper Methods
 export const api = {
   // Domain & Niche endpoints
@@ -88,8 +105,8 @@ export const api = {
   },
   
   // Books endpoints
-  getBooks() {
-    return apiClient.get('/books/');
+  getBooks(params?: { cursor?: string; page_size?: number }) {
+    return apiClient.get('/books/', { params });
   },
   
   getBook(bookId: string | number) {
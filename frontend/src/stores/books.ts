@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia';
 import { ref, computed } from 'vue';
 import type { Book, BookCreate, CoverSelect, ConfigResponse } from '../types';
-import apiClient from '../services/api';
+import apiClient, { fetchAllPages } from '../services/api';
 
 export const useBooksStore = defineStore('books', () => {
   // State
@@ -39,8 +39,7 @@ export const useBooksStore = defineStore('books', () => {
     try {
       loading.value = true;
       error.value = null;
-      const response = await apiClient.get<Book[]>('/books/');
-      books.value = response.data;
+      books.value = await fetchAllPages<Book>('/books/');
       return { success: true };
     } catch (err: any) {
       const message = err.response?.data?.error || 'Failed to fetch books';
@@ -131,6 +131,13 @@ export interface ApiResponse<T> {
   message?: string;
 }
 
+// Cursor-paginated list (GET /books/, /books/history/)
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface ApiError {
   error: string;
   details?: Record<string, string[]>;